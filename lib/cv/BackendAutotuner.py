@@ -0,0 +1,348 @@
+import numpy as np
+import platform
+import hashlib
+import json
+import time
+import cv2
+import os
+
+# BackendAutotuner picks, per machine and resolution, the fastest of the
+# interchangeable implementations a LanePipeline has for a stage:
+# - gradients: float Gradient Magnitude and Direction (sqrt/arctan2) or the
+#   integer Sobel comparisons of fast_gradients
+# - undistort: Distortion Correction then Bird's Eye View, or the composite
+#   remap of warp_first
+# - warp: dense warp of the thresholded frame or sparse_warp of its nonzero
+#   pixels (only when the undistorted frame is warped, warp_first thresholds
+#   the bird's eye view itself)
+# - fit: np.polyfit or the moment fitter
+# The first backend of each stage is the default. On the first frame of a
+# resolution each stage's backends are timed in turn on that frame, with the
+# stages before it set to their choice:
+# - A backend is only a candidate when its lane lines stay within
+#   fit_tolerance pixels of those of the default backends on that frame.
+#   warp_first for instance resamples the frame once instead of twice and
+#   can move the lines by hundreds of pixels on a hard frame.
+# - Only the pipeline stages the backend changes are timed (STAGE_TIMES, from
+#   the pipeline's stage times), not the whole frame
+# - A candidate replaces the default only when it's faster by more than the
+#   spread of the timed runs (interquartile range, the larger of the two),
+#   not on timing noise
+# The choice is stored in a JSON cache file keyed by machine (CPU model,
+# cores, OpenCV and NumPy versions), resolution and a hash of the pipeline
+# parameters that change the stages' work (thresholds, detect_scale,
+# threshold_decimation, ...), so later startups on the same hardware and
+# configuration only read it. A backend can be forced per stage, forced
+# stages are not timed or checked.
+
+# Stage -> backend -> pipeline parameters selecting it, in tuning order
+STAGE_BACKENDS = {
+    "gradients": {
+        "float": {"fast_gradients": False},
+        "integer": {"fast_gradients": True},
+    },
+    "undistort": {
+        "undistort": {"warp_first": False},
+        "remap": {"warp_first": True},
+    },
+    "warp": {
+        "dense": {"sparse_warp": False},
+        "sparse": {"sparse_warp": True},
+    },
+    "fit": {
+        "polyfit": {"fit_method": "polyfit"},
+        "moments": {"fit_method": "moments"},
+    },
+}
+
+# Pipeline parameters left out of the cache key: those the backends set and
+# those only changing the overlay's text
+UNKEYED_PARAMS = ("font_family", "font_color", "font_size", "font_thickness", "line_type",
+                  "unit_type", "curve_type")
+
+# Cache entries tuned another way are tuned again
+CACHE_VERSION = 2
+
+# Stage -> pipeline stage times its backends change
+STAGE_TIMES = {
+    "gradients": ("threshold",),
+    "undistort": ("undistort", "threshold", "warp"),
+    "warp": ("warp", "detect"),
+    "fit": ("detect",),
+}
+
+
+def get_cpu_model():
+    """
+        CPU model name, from /proc/cpuinfo on Linux
+    """
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+class BackendAutotuner:
+    def __init__(self, pipeline, cache_path = "backend_cache.json", overrides = None, repeats = 5,
+                 fit_tolerance = 1.0):
+        """
+            pipeline is a configured LanePipeline, cache_path the JSON file
+            choices are kept in (None keeps them in memory only), overrides
+            forces backends as {stage: backend}, repeats is the runs timed per
+            backend (their median is taken), fit_tolerance the largest
+            distance in pixels a backend may move the lane lines from those
+            of the default backends
+        """
+        self.pipeline_m = pipeline
+        self.cache_path_m = cache_path
+        self.overrides_m = dict(overrides or {})
+        for stage, backend in self.overrides_m.items():
+            if backend not in STAGE_BACKENDS.get(stage, {}):
+                raise ValueError("Unknown backend %s for stage %s, choose one of %s" %(
+                    backend, stage, {s: list(b) for s, b in STAGE_BACKENDS.items()}
+                ))
+        self.repeats_m = repeats
+        self.fit_tolerance_m = fit_tolerance
+        # Frame shape -> backend per stage, once selected in this process
+        self.choices_m = {}
+        # Frame shape -> stage -> backend -> seconds per frame in the stage,
+        # None when its lane lines differ from the default's, when tuned
+        self.timings_m = {}
+
+    def get_machine_key(self):
+        """
+            Identity of this machine's hardware and libraries, machines of a
+            fleet with the same hardware share their choices
+        """
+        ncores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        return "%s|%s|%d cores|opencv %s|numpy %s" %(
+            platform.machine(), get_cpu_model(), ncores, cv2.__version__, np.__version__
+        )
+
+    def get_params_key(self):
+        """
+            Hash of the pipeline parameters the stages' timings depend on,
+            but not of those the backends set
+        """
+        backend_params = set(name for backends in STAGE_BACKENDS.values()
+                             for params in backends.values() for name in params)
+        params = {name: value for name, value in self.pipeline_m.get_params().items()
+                  if name not in backend_params and name not in UNKEYED_PARAMS}
+        params_json = json.dumps(params, sort_keys = True, default = lambda value: np.asarray(value).tolist())
+        return hashlib.sha1(params_json.encode()).hexdigest()[:12]
+
+    def get_cache_key(self, frame_shape):
+        """
+            Cache key of a frame shape on this machine with the pipeline's
+            current parameters
+        """
+        return "%s|%dx%d|params %s" %(
+            self.get_machine_key(), frame_shape[1], frame_shape[0], self.get_params_key()
+        )
+
+    def load_cache(self):
+        """
+            Returns the cache file's entries, empty when it doesn't exist or
+            can't be read
+        """
+        if self.cache_path_m is None or not os.path.exists(self.cache_path_m):
+            return {}
+        try:
+            with open(self.cache_path_m) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError) as e:
+            print("Error: Could not read backend cache %s (%s)" %(self.cache_path_m, e))
+            return {}
+
+    def save_cache(self, key, entry):
+        """
+            Adds an entry to the cache file, replacing it whole so a reader
+            never sees it half written
+        """
+        if self.cache_path_m is None:
+            return
+        cache = self.load_cache()
+        cache[key] = entry
+        tmp_path = self.cache_path_m + ".tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump(cache, cache_file, indent = 2, sort_keys = True)
+        os.replace(tmp_path, self.cache_path_m)
+
+    def time_backend(self, frame, params, stage_times):
+        """
+            Runs the pipeline on frame with params overridden, after one
+            untimed run that builds tables and compiles kernels. Returns the
+            median and interquartile range of the seconds spent in
+            stage_times per run and the lane line fits of the frame, None for
+            all when the pipeline fails on the frame.
+        """
+        pipeline = self.pipeline_m
+        pipeline.set_params(**params)
+        times = []
+        try:
+            for run in range(self.repeats_m + 1):
+                pipeline.reset_tracker()
+                pipeline.run_pipeline(frame)
+                run_times = pipeline.get_stage_times()[0]
+                times.append(sum(run_times.get(stage, 0.0) for stage in stage_times))
+        except Exception as e:
+            # e.g. no lane line pixels found in the frame
+            print("Error: Backend %s failed (%s: %s)" %(params, type(e).__name__, e))
+            return None, None, None
+        lane_metrics = pipeline.get_lane_metrics()
+        q1, median, q3 = np.percentile(times[1:], [25, 50, 75])
+        return float(median), float(q3 - q1), (lane_metrics["left_fit"], lane_metrics["right_fit"])
+
+    def fits_match(self, fits, reference_fits, frame_shape):
+        """
+            Returns whether lane line fits stay within fit_tolerance pixels
+            of the reference fits on every row of the frame
+        """
+        if fits is None or reference_fits is None:
+            return False
+        ploty = np.arange(frame_shape[0], dtype = np.float64)
+        for fit, reference_fit in zip(fits, reference_fits):
+            distance = np.abs(np.polyval(fit, ploty) - np.polyval(reference_fit, ploty))
+            if distance.max() > self.fit_tolerance_m:
+                return False
+        return True
+
+    def tune(self, frame):
+        """
+            Times the backends of every stage not forced on frame, returns
+            the backend per stage and the seconds per frame each backend
+            spent in its stage (None when its lane lines differ from the
+            default's)
+        """
+        pipeline = self.pipeline_m
+        saved_params = pipeline.get_params()
+        # A repeated frame would be reused as static and cached stages would
+        # be read back instead of computed
+        stage_cache = pipeline.stage_cache_m
+        pipeline.set_stage_cache(None)
+        choices = {}
+        timings = {}
+        tuning_params = {"skip_static": False}
+        # Lane lines of the default backends, or forced ones, candidates are
+        # checked against
+        reference_params = dict(tuning_params)
+        for stage, backends in STAGE_BACKENDS.items():
+            reference_params.update(backends[self.overrides_m.get(stage, next(iter(backends)))])
+        reference_fits = self.time_backend(frame, reference_params, ())[2]
+        try:
+            for stage, backends in STAGE_BACKENDS.items():
+                default = next(iter(backends))
+                if stage in self.overrides_m:
+                    choices[stage] = self.overrides_m[stage]
+                elif stage == "warp" and tuning_params["warp_first"]:
+                    # The remap warps the raw frame, there is no thresholded
+                    # frame to warp
+                    choices[stage] = "dense"
+                else:
+                    timings[stage] = {}
+                    spreads = {}
+                    for backend, params in backends.items():
+                        seconds, spread, fits = self.time_backend(
+                            frame, dict(tuning_params, **params), STAGE_TIMES[stage]
+                        )
+                        if backend != default and not self.fits_match(fits, reference_fits, frame.shape):
+                            seconds = None
+                        timings[stage][backend] = seconds
+                        spreads[backend] = spread
+                    choices[stage] = default
+                    if timings[stage][default] is not None:
+                        for backend, seconds in timings[stage].items():
+                            best = timings[stage][choices[stage]]
+                            spread = max(spreads[backend], spreads[default])
+                            if seconds is not None and best - seconds > spread:
+                                choices[stage] = backend
+                tuning_params.update(backends[choices[stage]])
+        finally:
+            pipeline.set_params(**saved_params)
+            pipeline.set_stage_cache(stage_cache)
+            pipeline.reset_tracker()
+        return choices, timings
+
+    def select(self, frame, retune = False):
+        """
+            Backend per stage for frames of this frame's shape: from this
+            process, else from the cache file, else tuned on frame and saved.
+            Overrides always win. The choice is applied to the pipeline.
+        """
+        shape = frame.shape
+        if retune or shape not in self.choices_m:
+            key = self.get_cache_key(shape)
+            entry = None if retune else self.load_cache().get(key)
+            if (entry is None or set(entry["choices"]) != set(STAGE_BACKENDS)
+                    or entry.get("version") != CACHE_VERSION):
+                # Not tuned yet, or tuned with other stages or checks than
+                # there are now
+                choices, timings = self.tune(frame)
+                self.timings_m[shape] = timings
+                entry = {"choices": choices, "timings": timings, "version": CACHE_VERSION,
+                         "tuned": time.strftime("%Y-%m-%d %H:%M:%S")}
+                self.save_cache(key, entry)
+            choices = {stage: entry["choices"][stage] for stage in STAGE_BACKENDS}
+            choices.update(self.overrides_m)
+            self.choices_m[shape] = choices
+        self.apply(self.choices_m[shape])
+        return self.choices_m[shape]
+
+    def apply(self, choices):
+        """
+            Sets the pipeline parameters of a backend per stage, only those
+            that differ so the pipeline keeps its state otherwise
+        """
+        params = {}
+        for stage, backend in choices.items():
+            params.update(STAGE_BACKENDS[stage][backend])
+        current = self.pipeline_m.params_m
+        changed = {name: value for name, value in params.items() if current[name] != value}
+        if changed:
+            self.pipeline_m.set_params(**changed)
+
+    def run_pipeline(self, frame):
+        """
+            LanePipeline.run_pipeline() with the backends selected for the
+            frame's shape on the first frame of each shape
+        """
+        if frame.shape not in self.choices_m:
+            self.select(frame)
+        elif len(self.choices_m) > 1:
+            # Frames of several shapes, each with its own choice
+            self.apply(self.choices_m[frame.shape])
+        return self.pipeline_m.run_pipeline(frame)
+
+    def get_choices(self, frame_shape):
+        """
+            Returns the backend per stage selected for a frame shape, None if
+            not selected yet
+        """
+        return self.choices_m.get(tuple(frame_shape))
+
+    def display_report(self):
+        """
+            Displays to screen the backends selected per frame shape and the
+            timings of those tuned in this process
+        """
+        for shape, choices in self.choices_m.items():
+            print("Resolution: %dx%d" %(shape[1], shape[0]))
+            for stage, backend in choices.items():
+                timings = self.timings_m.get(shape, {}).get(stage)
+                if timings is None:
+                    source = "cached"
+                    if stage in self.overrides_m:
+                        source = "forced"
+                    elif stage == "warp" and choices["undistort"] == "remap":
+                        source = "not used"
+                    print("%s = %s (%s)" %(stage, backend, source))
+                else:
+                    times = ", ".join(
+                        "%s %s" %(b, "differs" if s is None else "%.1f ms" %(s*1000)) for b, s in timings.items()
+                    )
+                    print("%s = %s (%s)" %(stage, backend, times))
+            print("\n")
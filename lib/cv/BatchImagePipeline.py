@@ -0,0 +1,221 @@
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing as mp
+import numpy as np
+import threading
+import time
+import csv
+import cv2
+import os
+
+# BatchImagePipeline runs a LanePipeline over a directory of still images:
+# - Decode: images are read ahead on a thread pool with cv2.imread, which
+#   gives uint8 for JPEG and PNG alike (8 or 16 bit, gray or with alpha), and
+#   turned to RGB. At most prefetch images are decoded and not yet processed.
+# - Process: each image is an independent still, lane lines aren't tracked
+#   from one to the next, so images are spread over a pool of worker
+#   processes
+# - Write: one writer thread saves the annotated images and appends each
+#   image's row to the metrics table (CSV) as results come in, in input order
+# Progress is displayed every progress_interval seconds and a throughput
+# report at the end.
+
+METRICS_FIELDS = [
+    "image", "error", "seconds",
+    "left_fit_a", "left_fit_b", "left_fit_c",
+    "right_fit_a", "right_fit_b", "right_fit_c",
+    "left_curverad", "right_curverad", "curverad_units",
+    "l_angle_curve", "r_angle_curve", "angle_units",
+    "dist_center", "position_units", "side_center",
+]
+
+# Worker process state, set once per worker by init_batch_worker()
+batch_state = {}
+
+
+def init_batch_worker(pipeline, render):
+    """
+        Worker process initializer: keeps the pipeline every image of this
+        worker is processed with
+    """
+    # Workers already fill the cores, OpenCV threads would oversubscribe them
+    cv2.setNumThreads(1)
+    pipeline.set_params(track = False, render_overlay = render)
+    batch_state["pipeline"] = pipeline
+
+
+def process_image(job):
+    """
+        Runs the worker's pipeline on one decoded image, returns its name,
+        annotated image (None when not rendered or on error), metrics row and
+        seconds spent
+    """
+    name, frame = job
+    pipeline = batch_state["pipeline"]
+    start = time.perf_counter()
+    row = {"image": name, "error": ""}
+    result = None
+    try:
+        result = pipeline.run_pipeline(frame)
+        lane_metrics = pipeline.get_lane_metrics()
+        for side in ("left", "right"):
+            for coeff, value in zip("abc", lane_metrics[side + "_fit"]):
+                row["%s_fit_%s" %(side, coeff)] = float(value)
+        for key in METRICS_FIELDS[9:]:
+            value = lane_metrics[key]
+            row[key] = value.item() if isinstance(value, np.generic) else value
+    except Exception as e:
+        # e.g. no lane line pixels found in the image
+        row["error"] = "%s: %s" %(type(e).__name__, e)
+        result = None
+    if not pipeline.params_m["render_overlay"]:
+        result = None
+    seconds = time.perf_counter() - start
+    row["seconds"] = seconds
+    return name, result, row, seconds
+
+
+class BatchImagePipeline:
+    def __init__(self, pipeline, nworkers = None, ndecoders = 4, prefetch = None, progress_interval = 5.0):
+        """
+            pipeline is a calibrated LanePipeline, nworkers the worker
+            processes (defaults to the cores available), ndecoders the decode
+            threads, prefetch the most images decoded ahead (defaults to 4 per
+            worker)
+        """
+        self.pipeline_m = pipeline
+        if nworkers is None:
+            nworkers = len(os.sched_getaffinity(0))
+        self.nworkers_m = nworkers
+        self.ndecoders_m = ndecoders
+        self.prefetch_m = 4*nworkers if prefetch is None else prefetch
+        self.progress_interval_m = progress_interval
+        self.report_m = None
+
+    def get_image_paths(self, image_dir, extensions = (".jpg", ".jpeg", ".png", ".bmp")):
+        """
+            Images of a directory in filename order
+        """
+        with os.scandir(image_dir) as it:
+            return sorted(entry.path for entry in it
+                          if entry.is_file() and entry.name.lower().endswith(extensions))
+
+    def decode_image(self, image_path):
+        """
+            Reads an image as uint8 RGB, None if it can't be read
+        """
+        start = time.perf_counter()
+        frame = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if frame is not None:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return frame, time.perf_counter() - start
+
+    def decoded_images(self, image_paths, decode_pool, slots, stats):
+        """
+            Yields (name, frame) jobs in order, decoding up to prefetch images
+            ahead. A job takes a slot, given back once its result is written.
+        """
+        pending = []
+        next_path = 0
+        while pending or next_path < len(image_paths):
+            while next_path < len(image_paths) and len(pending) < self.prefetch_m:
+                image_path = image_paths[next_path]
+                pending.append((image_path, decode_pool.submit(self.decode_image, image_path)))
+                next_path += 1
+            image_path, future = pending.pop(0)
+            frame, seconds = future.result()
+            stats["decode"] += seconds
+            if frame is None:
+                print("Error: Could not read image %s" %(image_path))
+                stats["unreadable"] += 1
+                continue
+            slots.acquire()
+            yield os.path.basename(image_path), frame
+
+    def write_result(self, output_dir, metrics_writer, name, result, row):
+        """
+            Writer thread: saves an annotated image and its metrics row
+        """
+        if output_dir is not None and result is not None:
+            cv2.imwrite(os.path.join(output_dir, name), cv2.cvtColor(result, cv2.COLOR_RGB2BGR))
+        if metrics_writer is not None:
+            metrics_writer.writerow(row)
+
+    def run(self, image_dir, output_dir = None, metrics_path = None):
+        """
+            Processes every image of image_dir, saves annotated images to
+            output_dir and the metrics table to metrics_path (either can be
+            None). Returns the throughput report.
+        """
+        image_paths = self.get_image_paths(image_dir)
+        if output_dir is not None and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        metrics_file = open(metrics_path, "w", newline = "") if metrics_path is not None else None
+        metrics_writer = None
+        if metrics_file is not None:
+            metrics_writer = csv.DictWriter(metrics_file, METRICS_FIELDS)
+            metrics_writer.writeheader()
+        stats = {"decode": 0.0, "process": 0.0, "unreadable": 0, "errors": 0, "done": 0}
+        # Bounds images decoded but not yet written, Pool.imap reads its jobs
+        # as fast as it can otherwise
+        slots = threading.BoundedSemaphore(self.prefetch_m)
+        start = time.perf_counter()
+        last_progress = start
+        try:
+            with ThreadPoolExecutor(self.ndecoders_m) as decode_pool, \
+                 ThreadPoolExecutor(1) as writer, \
+                 mp.Pool(self.nworkers_m, init_batch_worker, (self.pipeline_m, output_dir is not None)) as pool:
+                jobs = self.decoded_images(image_paths, decode_pool, slots, stats)
+                writes = []
+                for name, result, row, seconds in pool.imap(process_image, jobs):
+                    stats["process"] += seconds
+                    stats["done"] += 1
+                    if row["error"]:
+                        stats["errors"] += 1
+                    write = writer.submit(self.write_result, output_dir, metrics_writer, name, result, row)
+                    write.add_done_callback(lambda future: slots.release())
+                    writes.append(write)
+                    now = time.perf_counter()
+                    if now - last_progress >= self.progress_interval_m:
+                        self.display_progress(stats["done"], len(image_paths), now - start)
+                        last_progress = now
+                for write in writes:
+                    # Raises any error the writer hit
+                    write.result()
+        finally:
+            if metrics_file is not None:
+                metrics_file.close()
+        seconds = time.perf_counter() - start
+        self.report_m = {
+            "images": stats["done"],
+            "errors": stats["errors"],
+            "unreadable": stats["unreadable"],
+            "seconds": seconds,
+            "images_per_second": stats["done"]/seconds if seconds > 0 else 0.0,
+            "decode_seconds": stats["decode"],
+            "process_seconds": stats["process"],
+        }
+        return self.report_m
+
+    def display_progress(self, done, total, elapsed):
+        """
+            Displays to screen images done, rate and time left
+        """
+        rate = done/elapsed if elapsed > 0 else 0.0
+        eta = (total - done)/rate if rate > 0 else float("inf")
+        print("Images: %d/%d (%.1f %%), %.1f images/s, %.0f s left" %(done, total, 100*done/max(total, 1), rate, eta))
+
+    def get_report(self):
+        """
+            Returns the throughput report of the most recent run
+        """
+        return self.report_m
+
+    def display_report(self):
+        """
+            Displays to screen the throughput report of the most recent run
+        """
+        r = self.report_m
+        print("Images = %d, Errors = %d, Unreadable = %d" %(r["images"], r["errors"], r["unreadable"]))
+        print("Time = %.2f s, Throughput = %.1f images/s" %(r["seconds"], r["images_per_second"]))
+        print("Decode time = %.2f s, Process time = %.2f s (summed over threads and workers)" %(r["decode_seconds"], r["process_seconds"]))
+        print("\n")
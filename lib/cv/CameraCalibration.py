@@ -6,6 +6,9 @@ import pickle
 import glob
 import cv2
 import os
+
+import LaneFunctions
+
 # CameraCalibration class removes inherent distortions from the camera that can affect its perception of the world
 class CameraCalibration:
     def __init__(self, nx, ny, cam_cal_dfp):
@@ -107,7 +110,7 @@ class CameraCalibration:
 #         elif(self.dist_img_m == None):
 #             print("Error: self.dist_img_m = None")
         
-        undist_img = cv2.undistort(self.dist_img_m, mtx, dist_coeff, None, mtx)
+        undist_img = LaneFunctions.undistort(self.dist_img_m, mtx, dist_coeff)
         # Retrieve distorted image and undistorted image
         return self.dist_img_m, undist_img
     
@@ -6,6 +6,8 @@ import glob
 import cv2
 import os
 
+import LaneFunctions
+
 # Mathematically we can characterize perspective by saying that in real world 
 # coordinates (X, Y, Z), the greater the magnitude of an object's Z coordinate or
 # distance from the camera, the smaller it will appear in a 2D image
@@ -20,40 +22,79 @@ import os
 # CameraPerspective applies a perspective transform on camera images to warp it into
 # different perspectives: Bird's Eye View, etc
 class CameraPerspective:
-    def birds_eye_view(self, img):
+    def __init__(self, src_ratios = None, dst_ratios = None):
         """
-            Apply Bird's Eye View Transform to Camera Image for a Top-Down View
+            Source and destination points are given as (x, y) ratios of the
+            image width and height: bottom left, top left, top right, bottom
+            right. Defaults fit a camera mounted at the center top of the car.
         """
-        imshape = img.shape
-        
-        img_size = (img.shape[1], img.shape[0])
+        if src_ratios is None:
+            src_ratios = [[0.145, 1], [0.462, 0.62], [0.535, 0.62], [0.883, 1]]
+        if dst_ratios is None:
+            dst_ratios = [[0.24, 1], [0.24, 0], [0.75, 0], [0.75, 1]]
+        self.src_ratios_m = np.array(src_ratios, dtype = np.float32)
+        self.dst_ratios_m = np.array(dst_ratios, dtype = np.float32)
+        # (height, width) -> (M, Minv)
+        self.transforms_m = {}
         
-        # source points
-        src = np.array( 
-            [[imshape[1]*0.145, imshape[0]], # bottom left
-             [imshape[1]*0.462, imshape[0]*0.62], # top left
-             [imshape[1]*0.535, imshape[0]*0.62], # top right
-             [imshape[1]*0.883, imshape[0]]], # bottom right
-            dtype = np.float32 )      
+    def compute_transform(self, imshape):
+        """
+            Compute the perspective transform M and its inverse Minv for an
+            image shape, without warping an image. Both are cached per shape.
+        """
+        if imshape[:2] in self.transforms_m:
+            M, self.Minv_m = self.transforms_m[imshape[:2]]
+            return M, self.Minv_m
         
-        # destination points
-        dst = np.array(
-            [[imshape[1]*0.24, imshape[0]], # bottom left
-             [imshape[1]*0.24, imshape[0]*0], # top left
-             [imshape[1]*0.75, imshape[0]*0], # top right
-             [imshape[1]*0.75, imshape[0]]], # bottom right
-            dtype = np.float32)
+        # source and destination points: bottom left, top left, top right,
+        # bottom right. Minv could be computed also by swapping them.
+        M, self.Minv_m = LaneFunctions.perspective_transform(imshape, self.src_ratios_m, self.dst_ratios_m)
         
-        # Compute the perspective transform, M
-        M = cv2.getPerspectiveTransform(src, dst)
+        self.transforms_m[imshape[:2]] = (M, self.Minv_m)
+        return M, self.Minv_m
         
-        # Could compute the inverse also by swapping the input parameters
-        self.Minv_m = cv2.getPerspectiveTransform(dst, src)
+    def birds_eye_view(self, img):
+        """
+            Apply Bird's Eye View Transform to Camera Image for a Top-Down View
+        """
+        M, Minv = self.compute_transform(img.shape)
         
         # Create warped image - uses linear interpolation
-        warped = cv2.warpPerspective(img, M, img_size, flags=cv2.INTER_LINEAR)
-        
-        return warped
+        return LaneFunctions.warp(img, M)
+
+    def birds_eye_points(self, binary_img):
+        """
+            Sparse Bird's Eye View of a binary image: transforms only the
+            coordinates of its nonzero pixels with M, instead of warping the
+            dense image. Returns (nonzeroy, nonzerox) of the warped pixels in
+            the same row-major order binary_warped.nonzero() would give.
+            Pixels are mapped forward, so where the view stretches the road
+            (far away) the warped lane lines are sparser than a dense warp.
+        """
+        img_h, img_w = binary_img.shape[0], binary_img.shape[1]
+        M, Minv = self.compute_transform(binary_img.shape)
+        # Only pixels inside the view's corners mapped back through Minv can
+        # land inside the view, skip the rows above the road (sky)
+        corners = np.float32([[[0, 0]], [[img_w, 0]], [[img_w, img_h]], [[0, img_h]]])
+        corners = cv2.perspectiveTransform(corners, Minv)[:, 0, :]
+        y_low = int(np.clip(np.floor(corners[:, 1].min()), 0, img_h))
+        y_high = int(np.clip(np.ceil(corners[:, 1].max()) + 1, 0, img_h))
+        nonzero = binary_img[y_low:y_high].nonzero()
+        if len(nonzero[0]) == 0:
+            return nonzero
+        pts = np.empty((len(nonzero[0]), 1, 2), dtype = np.float32)
+        pts[:, 0, 0] = nonzero[1]
+        pts[:, 0, 1] = nonzero[0] + y_low
+        warped_pts = cv2.perspectiveTransform(pts, M)[:, 0, :]
+        warped_x = np.rint(warped_pts[:, 0]).astype(np.int64)
+        warped_y = np.rint(warped_pts[:, 1]).astype(np.int64)
+        # Keep points that land inside the view
+        inside = ((warped_x >= 0) & (warped_x < img_w) &
+                  (warped_y >= 0) & (warped_y < img_h))
+        # Several pixels landing on one warped pixel count once, sorting the
+        # flat index also restores row-major order
+        flat_idx = np.unique(warped_y[inside]*img_w + warped_x[inside])
+        return flat_idx // img_w, flat_idx % img_w
 
     def get_minv(self):
         """
@@ -0,0 +1,95 @@
+import numpy as np
+import cv2
+
+# CameraRemap folds Distortion Correction and the Bird's Eye View perspective
+# transform into one precomputed remap table per image size. Both are fixed
+# geometric mappings for a given camera, so a raw frame can go straight to the
+# warped view in a single resample, instead of cv2.undistort() followed by
+# cv2.warpPerspective() over the full frame.
+
+class CameraRemap:
+    def __init__(self, mtx, dist_coeff, cam_view):
+        """
+            Takes the camera calibration matrix, distortion coefficients and a
+            CameraPerspective with the source and destination points to use
+        """
+        self.mtx_m = mtx
+        self.dist_coeff_m = dist_coeff
+        self.cam_view_m = cam_view
+        # (height, width) -> undistortion remap table
+        self.undist_maps_m = {}
+        # (height, width) -> Minv
+        self.minv_m = {}
+        # (raw height, raw width, warped height, warped width) -> remap table
+        self.birds_eye_maps_m = {}
+
+    def get_undist_maps(self, imshape):
+        """
+            Returns the undistortion table for an image shape as float maps:
+            for each undistorted pixel, where to sample the raw image
+        """
+        img_size = (imshape[1], imshape[0])
+        return cv2.initUndistortRectifyMap(
+            self.mtx_m, self.dist_coeff_m, None, self.mtx_m, img_size, cv2.CV_32FC1
+        )
+
+    def build_birds_eye_maps(self, imshape, warped_shape):
+        """
+            Builds the composite table from a raw image to its bird's eye view
+            of warped_shape, which can be smaller than the raw image
+        """
+        undist_x, undist_y = self.get_undist_maps(imshape)
+        M, Minv = self.cam_view_m.compute_transform(imshape)
+        self.minv_m[imshape[:2]] = Minv
+        # Scale the warped view down to warped_shape in the same transform
+        scale = np.array([[warped_shape[1]/imshape[1], 0, 0],
+                          [0, warped_shape[0]/imshape[0], 0],
+                          [0, 0, 1]])
+        warped_size = (warped_shape[1], warped_shape[0])
+        # For each warped pixel, where to sample the raw image: the
+        # undistortion table itself warped with M, pixels outside the road
+        # area point out of the image and come out black
+        birds_eye_x = cv2.warpPerspective(undist_x, scale.dot(M), warped_size,
+                                          flags=cv2.INTER_LINEAR,
+                                          borderMode=cv2.BORDER_CONSTANT, borderValue=-1)
+        birds_eye_y = cv2.warpPerspective(undist_y, scale.dot(M), warped_size,
+                                          flags=cv2.INTER_LINEAR,
+                                          borderMode=cv2.BORDER_CONSTANT, borderValue=-1)
+        # Fixed point tables are smaller and faster to remap with
+        self.birds_eye_maps_m[imshape[:2] + warped_shape[:2]] = cv2.convertMaps(
+            birds_eye_x, birds_eye_y, cv2.CV_16SC2
+        )
+
+    def correct_distortion(self, img):
+        """
+            Apply Distortion Correction with the cached undistortion table
+        """
+        if img.shape[:2] not in self.undist_maps_m:
+            undist_x, undist_y = self.get_undist_maps(img.shape)
+            self.undist_maps_m[img.shape[:2]] = cv2.convertMaps(
+                undist_x, undist_y, cv2.CV_16SC2
+            )
+        map1, map2 = self.undist_maps_m[img.shape[:2]]
+        return cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
+
+    def birds_eye_view(self, img, warped_shape = None):
+        """
+            Raw (distorted) camera image straight to the Bird's Eye View in one
+            resample. warped_shape defaults to the raw image shape.
+        """
+        if warped_shape is None:
+            warped_shape = img.shape
+        key = img.shape[:2] + tuple(warped_shape[:2])
+        if key not in self.birds_eye_maps_m:
+            self.build_birds_eye_maps(img.shape, warped_shape)
+        map1, map2 = self.birds_eye_maps_m[key]
+        return cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
+
+    def get_minv(self, imshape):
+        """
+            Returns Minv, the inverse perspective transform from the full size
+            bird's eye view back to an image of imshape
+        """
+        if imshape[:2] not in self.minv_m:
+            self.minv_m[imshape[:2]] = self.cam_view_m.compute_transform(imshape)[1]
+        return self.minv_m[imshape[:2]]
@@ -4,6 +4,8 @@ import numpy as np
 import cv2
 import os
 
+import JitKernels
+
 # Color space is a specific organization of colors
 # They provide a way to categorize colors and represent them in digital images
 
@@ -62,6 +64,16 @@ class ColorThresholds:
             2: G Binary, B Binary
             3: R Binary, G Binary, B Binary
         """
+        if JitKernels.is_jit_enabled():
+            return JitKernels.combine_masks(
+                "rgb_thresh", self.apply_rgb_thresh_numpy, num_code, (rgb_r, rgb_g, rgb_b)
+            )
+        return self.apply_rgb_thresh_numpy(num_code, rgb_r, rgb_g, rgb_b)
+
+    def apply_rgb_thresh_numpy(self, num_code, rgb_r = None, rgb_g = None, rgb_b = None):
+        """
+            NumPy version of apply_rgb_thresh()
+        """
         combined = np.zeros_like(rgb_r)
         if num_code == 0:
             combined[ (rgb_r == 1) | (rgb_g == 1) ] = 1
@@ -111,6 +123,16 @@ class ColorThresholds:
             # 2: L Binary, S Binary
             # 3: H Binary, L Binary, S Binary  
         """
+        if JitKernels.is_jit_enabled():
+            return JitKernels.combine_masks(
+                "hls_thresh", self.apply_hls_thresh_numpy, num_code, (hls_h, hls_l, hls_s)
+            )
+        return self.apply_hls_thresh_numpy(num_code, hls_h, hls_l, hls_s)
+
+    def apply_hls_thresh_numpy(self, num_code, hls_h = None, hls_l = None, hls_s = None):
+        """
+            NumPy version of apply_hls_thresh()
+        """
         combined = np.zeros_like(hls_h)
         if num_code == 0:
             combined[ (hls_h == 1) & (hls_l == 1) ] = 1
@@ -0,0 +1,156 @@
+import numpy as np
+import cv2
+
+from StripeThresholds import StripeThresholds
+
+# CorridorThresholds applies a LanePipeline's Color & Gradient Thresholding
+# only around the lane lines the tracker expects, so thresholding costs scale
+# with the corridor's area instead of the whole frame.
+# - The corridor is each prior polynomial +/- margin in the bird's eye view,
+#   projected back through Minv to the frame being thresholded (or used as is
+#   when the frame already is the bird's eye view)
+# - The corridor is covered with tiles: bands of rows, each split into the
+#   runs of columns the corridor spans in it. Tiles are read with a halo as
+#   wide as the kernels reach, like StripeThresholds' stripes, and only the
+#   corridor's own pixels are kept.
+# - Sobel-X and Gradient Magnitude are scaled by their max over the whole
+#   frame, which the corridor alone doesn't give: scaling by the corridor's
+#   max brings up shadow edges near the lane lines and the tracker drifts. The
+#   max of the last frame thresholded whole is kept as a reference and the
+#   corridor is scaled by the larger of the reference and its own max. Frames
+#   are thresholded whole (mask None) while there is no reference and every
+#   refresh frames, to keep it current.
+
+class CorridorThresholds:
+    def __init__(self, band_height = 16, refresh = 30):
+        """
+            band_height is the rows per band of tiles, smaller bands follow the
+            corridor more closely at the cost of more, smaller tiles. A frame
+            is thresholded whole at least every refresh frames.
+        """
+        self.band_height_m = band_height
+        self.refresh_m = refresh
+        # Sobel-X and Gradient Magnitude max of the last whole frame and the
+        # corridor frames since
+        self.max_sobel_m = None
+        self.max_mag_m = None
+        self.corridor_frames_m = 0
+        # Halo and per tile thresholding phases are the same as for stripes
+        self.stripes_m = StripeThresholds(1)
+        # Fraction of the frame inside the corridor on the most recent frame
+        self.area_ratio_m = None
+
+    def needs_full_frame(self):
+        """
+            Returns whether the next frame must be thresholded whole: there is
+            no reference max yet or it is due for a refresh
+        """
+        return self.max_sobel_m is None or self.corridor_frames_m >= self.refresh_m
+
+    def reset(self):
+        """
+            Forgets the reference max, e.g. after thresholds changed
+        """
+        self.max_sobel_m = None
+        self.max_mag_m = None
+        self.corridor_frames_m = 0
+
+    def corridor_mask(self, img_shape, left_fit, right_fit, margin, Minv = None):
+        """
+            Mask of the pixels within +/- margin of the left and right
+            polynomials of a bird's eye view of img_shape, in the camera frame
+            when Minv is given, else in the bird's eye view itself
+        """
+        img_h, img_w = img_shape[0], img_shape[1]
+        mask = np.zeros((img_h, img_w), dtype = np.uint8)
+        # Polynomials are straight enough over 8 rows to be drawn as polygons
+        ploty = np.append(np.arange(0, img_h, 8), img_h - 1).astype(np.float64)
+        for fit in (left_fit, right_fit):
+            fitx = np.polyval(fit, ploty)
+            pts = np.concatenate([
+                np.stack([fitx - margin, ploty], axis = 1),
+                np.stack([fitx + margin, ploty], axis = 1)[::-1],
+            ]).astype(np.float32)
+            if Minv is not None:
+                pts = cv2.perspectiveTransform(pts[:, None, :], Minv)[:, 0, :]
+            cv2.fillPoly(mask, [np.round(pts).astype(np.int32)], 1)
+        return mask
+
+    def get_tiles(self, mask, halo):
+        """
+            Returns (start, stop, x_start, x_stop) per tile covering the
+            corridor: bands of rows split into runs of the columns it spans,
+            runs closer than two halos are merged
+        """
+        tiles = []
+        img_h = mask.shape[0]
+        for start in range(0, img_h, self.band_height_m):
+            stop = min(start + self.band_height_m, img_h)
+            cols = np.flatnonzero(mask[start:stop].any(axis = 0))
+            if len(cols) == 0:
+                continue
+            # Split where the gap between spanned columns is wider than 2 halos
+            breaks = np.flatnonzero(np.diff(cols) > 2*halo)
+            run_starts = np.concatenate([[cols[0]], cols[breaks + 1]])
+            run_stops = np.concatenate([cols[breaks], [cols[-1]]]) + 1
+            for x_start, x_stop in zip(run_starts, run_stops):
+                tiles.append((start, stop, int(x_start), int(x_stop)))
+        return tiles
+
+    def combine_thresholds(self, pipeline, undist_frame, mask = None):
+        """
+            Binary frame of pipeline.combine_thresholds() evaluated inside the
+            corridor mask only, zero outside of it. Without a mask the whole
+            frame is thresholded, the same as pipeline.combine_thresholds(),
+            and its max kept as the reference.
+        """
+        p = pipeline.params_m
+        img_h, img_w = undist_frame.shape[0], undist_frame.shape[1]
+        combined_binary = np.zeros((img_h, img_w), dtype = np.uint8)
+        # A tile reads columns as far as the Gaussian blur reaches too
+        halo = max(self.stripes_m.get_halo(p), p["sobel_kernel"][0]//2 + 1)
+        if mask is None:
+            # One tile, the whole frame
+            tiles = [(0, img_h, 0, img_w)]
+            self.area_ratio_m = 1.0
+        else:
+            tiles = self.get_tiles(mask, halo)
+            self.area_ratio_m = np.count_nonzero(mask)/mask.size
+            self.corridor_frames_m += 1
+        if not tiles:
+            return combined_binary
+        gradients = []
+        for start, stop, x_start, x_stop in tiles:
+            halo_x_start = max(x_start - halo, 0)
+            halo_x_stop = min(x_stop + halo, img_w)
+            cols = slice(x_start - halo_x_start, x_stop - halo_x_start)
+            stripe = (start, stop, max(start - halo, 0), min(stop + halo, img_h))
+            tile_gradients = self.stripes_m.stripe_gradients(
+                pipeline, undist_frame[:, halo_x_start:halo_x_stop], stripe
+            )
+            gradients.append([g[:, cols] for g in tile_gradients])
+        max_sobel = max(np.max(g[0]) for g in gradients)
+        max_mag = max(np.max(g[1]) for g in gradients)
+        if p["fast_gradients"]:
+            max_mag = int(max_mag)
+        if mask is None:
+            self.max_sobel_m, self.max_mag_m = max_sobel, max_mag
+            self.corridor_frames_m = 0
+        elif self.max_sobel_m is not None:
+            max_sobel = max(max_sobel, self.max_sobel_m)
+            max_mag = max(max_mag, self.max_mag_m)
+        for (start, stop, x_start, x_stop), tile_gradients in zip(tiles, gradients):
+            self.stripes_m.stripe_thresholds(
+                pipeline, tile_gradients, max_sobel, max_mag,
+                combined_binary[start:stop, x_start:x_stop]
+            )
+        if mask is not None:
+            # Tiles are rectangles, keep the corridor's own pixels
+            np.bitwise_and(combined_binary, mask, out = combined_binary)
+        return combined_binary
+
+    def get_area_ratio(self):
+        """
+            Returns the fraction of the most recent frame thresholded
+        """
+        return self.area_ratio_m
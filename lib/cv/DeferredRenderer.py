@@ -0,0 +1,165 @@
+import numpy as np
+import json
+import cv2
+import os
+
+from FrameSource import CaptureFrameSource
+from LaneService import lane_metrics_to_json
+
+# Deferred rendering splits lane finding from drawing its results:
+# - record_lane_metadata() runs a LanePipeline over a video without drawing
+#   the overlay and stores only each frame's lane fits and metrics
+# - DeferredRenderer later draws the annotated frames of any frame range from
+#   the original video and that metadata, so overlay and encoding are only
+#   paid for the clips someone looks at
+# The metadata file is JSON lines: a header with the frame shape, the inverse
+# perspective transform Minv the overlay is drawn with and the source's
+# identity, then one line per frame {"index", "method", "lane_metrics"}, or
+# {"index", "error"} when no lane was found in the frame.
+
+def record_lane_metadata(pipeline, source, metadata_path, max_frames = None):
+    """
+        Runs pipeline over the frames of a FrameSource (RGB order) in metadata
+        only mode and writes their lane metrics to metadata_path. Returns the
+        number of frames recorded and of frames without a lane.
+    """
+    render_overlay = pipeline.params_m["render_overlay"]
+    pipeline.set_params(render_overlay = False)
+    tmp_path = metadata_path + ".tmp"
+    nframes = 0
+    nerrors = 0
+    try:
+        with open(tmp_path, "w") as metadata_file:
+            for index, frame in enumerate(source):
+                if max_frames is not None and index >= max_frames:
+                    break
+                if index == 0:
+                    header = {
+                        "frame_shape": list(frame.shape),
+                        "Minv": get_minv(pipeline, frame.shape).tolist(),
+                        "source": source.describe(),
+                    }
+                    metadata_file.write(json.dumps(header) + "\n")
+                try:
+                    pipeline.run_pipeline(frame)
+                    record = {
+                        "index": index,
+                        "method": pipeline.get_stage_times()[1],
+                        "lane_metrics": lane_metrics_to_json(pipeline.get_lane_metrics()),
+                    }
+                except Exception as e:
+                    # e.g. no lane line pixels found in the frame
+                    pipeline.reset_tracker()
+                    record = {"index": index, "error": "%s: %s" %(type(e).__name__, e)}
+                    nerrors += 1
+                metadata_file.write(json.dumps(record) + "\n")
+                nframes += 1
+        os.replace(tmp_path, metadata_path)
+    finally:
+        pipeline.set_params(render_overlay = render_overlay)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return nframes, nerrors
+
+
+def get_minv(pipeline, frame_shape):
+    """
+        Inverse perspective transform the pipeline draws its overlay with for
+        frames of frame_shape
+    """
+    if pipeline.params_m["warp_first"]:
+        return pipeline.get_camera_remap().get_minv(frame_shape)
+    return pipeline.get_cam_view().compute_transform(tuple(frame_shape))[1]
+
+
+class DeferredRenderer:
+    def __init__(self, pipeline, metadata_path):
+        """
+            pipeline is a calibrated LanePipeline, its distortion correction
+            and overlay parameters (text properties, direct_overlay) are used
+            to draw the frames. metadata_path is a file written by
+            record_lane_metadata().
+        """
+        self.pipeline_m = pipeline
+        with open(metadata_path) as metadata_file:
+            self.header_m = json.loads(metadata_file.readline())
+            # frame index -> record
+            self.records_m = {}
+            for line in metadata_file:
+                record = json.loads(line)
+                self.records_m[record["index"]] = record
+        self.Minv_m = np.array(self.header_m["Minv"])
+        frame_h = self.header_m["frame_shape"][0]
+        self.ploty_m = np.linspace(0, frame_h-1, frame_h)
+
+    def get_record(self, index):
+        """
+            Returns the record of a frame, None if it wasn't recorded
+        """
+        return self.records_m.get(index)
+
+    def get_lane_metrics(self, index):
+        """
+            Returns the lane metrics of a frame with its fits as arrays, None
+            if no lane was found in it
+        """
+        record = self.records_m.get(index)
+        if record is None or "lane_metrics" not in record:
+            return None
+        lane_metrics = dict(record["lane_metrics"])
+        lane_metrics["left_fit"] = np.array(lane_metrics["left_fit"])
+        lane_metrics["right_fit"] = np.array(lane_metrics["right_fit"])
+        return lane_metrics
+
+    def render_frame(self, frame, index):
+        """
+            Annotated frame: the recorded lane of frame index drawn on the
+            undistorted frame (RGB order), the undistorted frame alone when no
+            lane was found in it
+        """
+        undist_frame = self.pipeline_m.correct_distortion(frame)
+        lane_metrics = self.get_lane_metrics(index)
+        if lane_metrics is None:
+            return undist_frame
+        # Only the shape of the bird's eye view is needed to draw the lane
+        lane_b_e_view = np.broadcast_to(np.uint8(0), frame.shape[:2])
+        return self.pipeline_m.overlay_lane(
+            undist_frame, lane_b_e_view, self.ploty_m, self.Minv_m, lane_metrics
+        )
+
+    def render_range(self, video_path, start = 0, stop = None):
+        """
+            Yields (index, annotated frame) for frames start to stop (not
+            included, None to the end) of the original video
+        """
+        size = self.header_m["source"].get("size")
+        if size is not None and size != os.stat(video_path).st_size:
+            print("Error: %s is not the video the metadata was recorded from" %(video_path))
+        source = CaptureFrameSource(video_path, "rgb", start)
+        for index, frame in enumerate(source, start):
+            if stop is not None and index >= stop:
+                break
+            yield index, self.render_frame(frame, index)
+
+    def write_clip(self, video_path, output_path, start = 0, stop = None, fps = None):
+        """
+            Renders frames start to stop of the original video into a video
+            file, at the original video's frame rate unless fps is given.
+            Returns the number of frames written.
+        """
+        if fps is None:
+            video_reader = cv2.VideoCapture(video_path)
+            fps = video_reader.get(cv2.CAP_PROP_FPS) or 25
+            video_reader.release()
+        frame_h, frame_w = self.header_m["frame_shape"][:2]
+        video_writer = cv2.VideoWriter(
+            output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (frame_w, frame_h)
+        )
+        nframes = 0
+        try:
+            for index, annotated_frame in self.render_range(video_path, start, stop):
+                video_writer.write(cv2.cvtColor(annotated_frame, cv2.COLOR_RGB2BGR))
+                nframes += 1
+        finally:
+            video_writer.release()
+        return nframes
@@ -0,0 +1,253 @@
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import numpy as np
+import queue
+import os
+
+# FrameRing is a ring buffer of fixed-size frame slots kept in shared memory.
+# Each slot has a sibling result slot of the same shape, so a decoder writes a
+# frame into a slot, a worker process reads it in place and writes its result
+# into the sibling slot. Only slot indices need to be passed between processes,
+# a 1280x720x3 frame is never pickled or copied through a queue.
+
+class FrameRing:
+    def __init__(self, nslots, frame_shape = (720, 1280, 3), dtype = np.uint8, name = None):
+        """
+            Creates nslots frame slots and nslots result slots in one shared
+            memory block. Pass name of an existing block to attach to it
+            instead of creating a new one.
+        """
+        self.nslots_m = nslots
+        self.frame_shape_m = tuple(frame_shape)
+        self.dtype_m = np.dtype(dtype)
+        self.slot_nbytes_m = int(np.prod(self.frame_shape_m)) * self.dtype_m.itemsize
+        # The process that created the block is the one that unlinks it, a
+        # forked worker inherits this object but not the ownership
+        self.owner_pid_m = os.getpid() if name is None else None
+        if name is None:
+            self.shm_m = shared_memory.SharedMemory(
+                create = True, size = 2 * self.nslots_m * self.slot_nbytes_m
+            )
+        else:
+            self.shm_m = shared_memory.SharedMemory(name = name)
+        self.map_slots()
+
+    def map_slots(self):
+        """
+            Maps frame slots and result slots as numpy arrays over the shared
+            memory buffer, no data is copied
+        """
+        slots_shape = (self.nslots_m,) + self.frame_shape_m
+        self.frames_m = np.ndarray(slots_shape, dtype = self.dtype_m,
+                                   buffer = self.shm_m.buf)
+        self.results_m = np.ndarray(slots_shape, dtype = self.dtype_m,
+                                    buffer = self.shm_m.buf,
+                                    offset = self.nslots_m * self.slot_nbytes_m)
+
+    def __getstate__(self):
+        """
+            Only the shared memory name and layout are pickled, so a FrameRing
+            can be passed to a worker process which re-attaches to the block
+        """
+        return (self.shm_m.name, self.nslots_m, self.frame_shape_m, self.dtype_m.str)
+
+    def __setstate__(self, state):
+        name, nslots, frame_shape, dtype = state
+        self.__init__(nslots, frame_shape, dtype, name)
+
+    def get_name(self):
+        return self.shm_m.name
+
+    def get_nslots(self):
+        return self.nslots_m
+
+    def write_frame(self, slot, frame):
+        """
+            Copies frame into the frame slot, frame must match the slot shape
+        """
+        self.frames_m[slot][...] = frame
+
+    def get_frame(self, slot):
+        """
+            Returns a view of the frame slot
+        """
+        return self.frames_m[slot]
+
+    def write_result(self, slot, result):
+        """
+            Copies result into the result slot that is sibling to frame slot
+        """
+        self.results_m[slot][...] = result
+
+    def get_result(self, slot):
+        """
+            Returns a view of the result slot, it is only valid until the slot
+            is released back to the ring
+        """
+        return self.results_m[slot]
+
+    def close(self):
+        """
+            Detaches from the shared memory block, the owner also unlinks it
+        """
+        # Views have to be dropped before the buffer can be released
+        self.frames_m = None
+        self.results_m = None
+        self.shm_m.close()
+        if self.owner_pid_m == os.getpid():
+            self.shm_m.unlink()
+
+
+def ring_worker(ring, pipeline, task_queue, done_queue):
+    """
+        Worker process loop: reads (slot, frame_id) from task_queue, runs the
+        pipeline on the frame slot in place, writes the result into the
+        sibling result slot and reports (slot, frame_id, error) on
+        done_queue, error is None unless the pipeline failed on the frame.
+        A None task stops the worker.
+    """
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        slot, frame_id = task
+        try:
+            result = pipeline.run_pipeline(ring.get_frame(slot))
+            ring.write_result(slot, result)
+            error = None
+        except Exception as e:
+            # e.g. no lane line pixels found in the frame, the worker goes on
+            # with the next frame
+            pipeline.reset_tracker()
+            error = "%s: %s" %(type(e).__name__, e)
+        done_queue.put((slot, frame_id, error))
+    ring.close()
+
+
+# FrameRingPool runs a LanePipeline over a sequence of frames on several
+# worker processes that share one FrameRing. The free slot queue bounds the
+# number of frames in flight, so the decoder blocks instead of buffering
+# frames when the workers fall behind.
+
+class FrameRingPool:
+    def __init__(self, pipeline, nworkers, nslots = None, frame_shape = (720, 1280, 3)):
+        """
+            Starts nworkers processes, each with its own copy of pipeline.
+            nslots defaults to two slots per worker so a worker always has a
+            frame waiting while its previous result is being consumed.
+        """
+        if nslots is None:
+            nslots = 2 * nworkers
+        self.ring_m = FrameRing(nslots, frame_shape)
+        self.free_slots_m = mp.Queue()
+        for slot in range(nslots):
+            self.free_slots_m.put(slot)
+        self.task_queue_m = mp.Queue()
+        self.done_queue_m = mp.Queue()
+        # (frame_id, error) of the frames the pipeline failed on in the last
+        # imap()
+        self.errors_m = []
+        self.workers_m = []
+        for counter_w in range(nworkers):
+            worker = mp.Process(
+                target = ring_worker,
+                args = (self.ring_m, pipeline, self.task_queue_m, self.done_queue_m),
+                daemon = True
+            )
+            worker.start()
+            self.workers_m.append(worker)
+
+    def submit(self, frame, frame_id):
+        """
+            Waits for a free slot, writes frame into it and queues it for the
+            workers. Returns the slot used.
+        """
+        slot = self.free_slots_m.get()
+        self.ring_m.write_frame(slot, frame)
+        self.task_queue_m.put((slot, frame_id))
+        return slot
+
+    def get_done(self, poll_interval = 1.0):
+        """
+            Waits for the next processed frame, returns (slot, frame_id,
+            error). The result stays in the ring until release() is called on
+            the slot. Raises RuntimeError when a worker died, the frames it
+            held would never come back.
+        """
+        while True:
+            try:
+                return self.done_queue_m.get(timeout = poll_interval)
+            except queue.Empty:
+                dead = [worker.pid for worker in self.workers_m if not worker.is_alive()]
+                if dead:
+                    raise RuntimeError("Ring worker process %s exited" %(dead))
+
+    def get_result(self, slot):
+        return self.ring_m.get_result(slot)
+
+    def release(self, slot):
+        """
+            Hands a slot back to the ring once its result has been consumed
+        """
+        self.free_slots_m.put(slot)
+
+    def imap(self, frames):
+        """
+            Runs the pipeline over an iterable of frames and yields a copy of
+            each result in input order, None for frames the pipeline failed on
+            (their errors are kept, see get_errors())
+        """
+        nslots = self.ring_m.get_nslots()
+        self.errors_m = []
+        # Results that came back out of order hold on to their slot until
+        # every earlier frame has been yielded
+        pending = {}
+        next_id = 0
+        in_flight = 0
+        frame_id = -1
+        for frame_id, frame in enumerate(frames):
+            # Every slot is in use, collect results before waiting on a slot
+            while in_flight + len(pending) == nslots:
+                slot, done_id, error = self.get_done()
+                pending[done_id] = (slot, error)
+                in_flight -= 1
+                while next_id in pending:
+                    yield self.take_result(next_id, *pending.pop(next_id))
+                    next_id += 1
+            self.submit(frame, frame_id)
+            in_flight += 1
+        while next_id <= frame_id:
+            slot, done_id, error = self.get_done()
+            pending[done_id] = (slot, error)
+            while next_id in pending:
+                yield self.take_result(next_id, *pending.pop(next_id))
+                next_id += 1
+
+    def take_result(self, frame_id, slot, error):
+        """
+            Copies a frame's result out of its slot and releases the slot.
+            Returns None and keeps the error when the pipeline failed on it.
+        """
+        result = None
+        if error is None:
+            result = self.get_result(slot).copy()
+        else:
+            self.errors_m.append((frame_id, error))
+        self.release(slot)
+        return result
+
+    def get_errors(self):
+        """
+            Returns (frame_id, error) of the frames the pipeline failed on
+        """
+        return list(self.errors_m)
+
+    def close(self):
+        """
+            Stops the workers and frees the shared memory ring
+        """
+        for worker in self.workers_m:
+            self.task_queue_m.put(None)
+        for worker in self.workers_m:
+            worker.join()
+        self.ring_m.close()
@@ -0,0 +1,308 @@
+from subprocess import Popen, PIPE, DEVNULL
+import numpy as np
+import json
+import mmap
+import time
+import cv2
+import os
+
+# FrameSource is a source of decoded frames for the lane finding pipeline with
+# interchangeable backends:
+# - CaptureFrameSource: video file or camera through cv2.VideoCapture
+# - FfmpegFrameSource: video file decoded by an ffmpeg process into a rawvideo
+#   pipe, frames are read straight into NumPy arrays
+# - ImageDirFrameSource: still images in a directory, in filename order
+# - MemmapFrameCache: decodes another source once into a memory-mapped uint8
+#   file, later runs over the same clip read frames from it without decoding
+# Frames come out as uint8 height x width x 3 in RGB order by default, which is
+# what the thresholds expect, or in BGR order with color = "bgr". Every source
+# times the reads it does and reports decode throughput.
+
+class FrameSource:
+    def __init__(self, color = "rgb"):
+        """
+            color is the channel order of the frames, "rgb" or "bgr"
+        """
+        if color not in ("rgb", "bgr"):
+            print("Error: Choose a supported color order, rgb or bgr")
+        self.color_m = color
+        # Frames read and seconds spent reading them
+        self.frame_count_m = 0
+        self.decode_time_m = 0.0
+
+    def read_frames(self):
+        """
+            Yields decoded frames, implemented by each backend
+        """
+        raise NotImplementedError
+
+    def describe(self):
+        """
+            Returns what identifies the frames of this source, used to tell
+            whether a MemmapFrameCache is still valid for it
+        """
+        raise NotImplementedError
+
+    def __iter__(self):
+        """
+            Yields frames, timing only the time spent reading them
+        """
+        frames = self.read_frames()
+        while True:
+            start = time.perf_counter()
+            frame = next(frames, None)
+            self.decode_time_m += time.perf_counter() - start
+            if frame is None:
+                break
+            self.frame_count_m += 1
+            yield frame
+
+    def to_color(self, bgr_frame):
+        """
+            Converts a frame decoded in BGR order to the source's color order
+        """
+        if self.color_m == "rgb":
+            return cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2RGB)
+        return bgr_frame
+
+    def get_throughput(self):
+        """
+            Returns frames read, seconds spent reading them and frames per
+            second
+        """
+        fps = self.frame_count_m/self.decode_time_m if self.decode_time_m > 0 else 0.0
+        return {
+            "frames": self.frame_count_m,
+            "seconds": self.decode_time_m,
+            "fps": fps,
+        }
+
+    def display_throughput(self):
+        """
+            Displays to screen the decode throughput of the source
+        """
+        throughput = self.get_throughput()
+        print("Source: %s" %(type(self).__name__))
+        print("Frames = %d, Decode time = %.2f s, Decode FPS = %.1f" %(throughput["frames"], throughput["seconds"], throughput["fps"]))
+        print("\n")
+
+
+def file_identity(path):
+    """
+        Returns path, size and modification time of a file
+    """
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class CaptureFrameSource(FrameSource):
+    def __init__(self, video_path, color = "rgb", start_frame = 0):
+        """
+            video_path is a video file, or a camera index. Reading a video file
+            starts at frame index start_frame.
+        """
+        FrameSource.__init__(self, color)
+        self.video_path_m = video_path
+        self.start_frame_m = start_frame
+
+    def read_frames(self):
+        video_reader = cv2.VideoCapture(self.video_path_m)
+        try:
+            if self.start_frame_m > 0:
+                video_reader.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame_m)
+                if int(video_reader.get(cv2.CAP_PROP_POS_FRAMES)) != self.start_frame_m:
+                    # The backend can't seek, skip frames up to the start
+                    video_reader.release()
+                    video_reader = cv2.VideoCapture(self.video_path_m)
+                    for i in range(self.start_frame_m):
+                        if not video_reader.grab():
+                            break
+            while True:
+                ret, frame = video_reader.read()
+                if ret == False:
+                    break
+                yield self.to_color(frame)
+        finally:
+            video_reader.release()
+
+    def describe(self):
+        identity = {"backend": "capture"}
+        if isinstance(self.video_path_m, str):
+            identity.update(file_identity(self.video_path_m))
+        else:
+            identity["camera"] = self.video_path_m
+        return identity
+
+
+class FfmpegFrameSource(FrameSource):
+    def __init__(self, video_path, color = "rgb", ffmpeg = "ffmpeg", ffprobe = "ffprobe", threads = 0):
+        """
+            video_path is a video file, ffmpeg and ffprobe are the executables
+            to run, threads is ffmpeg decode threads (0 lets ffmpeg choose)
+        """
+        FrameSource.__init__(self, color)
+        self.video_path_m = video_path
+        self.ffmpeg_m = ffmpeg
+        self.ffprobe_m = ffprobe
+        self.threads_m = threads
+
+    def probe_size(self):
+        """
+            Returns (width, height) of the video's first video stream
+        """
+        p = Popen((self.ffprobe_m, "-v", "error", "-select_streams", "v:0",
+                   "-show_entries", "stream=width,height", "-of", "csv=p=0",
+                   self.video_path_m),
+                  shell = False, stdout = PIPE, close_fds = True, encoding = "utf8")
+        output = p.communicate()[0]
+        width, height = output.strip().split(",")[:2]
+        return int(width), int(height)
+
+    def read_frames(self):
+        width, height = self.probe_size()
+        pix_fmt = "rgb24" if self.color_m == "rgb" else "bgr24"
+        frame_bytes = width*height*3
+        p = Popen((self.ffmpeg_m, "-v", "error", "-threads", str(self.threads_m),
+                   "-i", self.video_path_m, "-f", "rawvideo", "-pix_fmt", pix_fmt, "-"),
+                  shell = False, stdout = PIPE, stdin = DEVNULL, close_fds = True,
+                  bufsize = frame_bytes)
+        try:
+            while True:
+                # Read the frame straight into the array it is yielded as
+                frame = np.empty((height, width, 3), dtype = np.uint8)
+                if p.stdout.readinto(memoryview(frame).cast("B")) < frame_bytes:
+                    break
+                yield frame
+        finally:
+            p.stdout.close()
+            p.kill()
+            p.wait()
+
+    def describe(self):
+        identity = {"backend": "ffmpeg"}
+        identity.update(file_identity(self.video_path_m))
+        return identity
+
+
+class ImageDirFrameSource(FrameSource):
+    def __init__(self, image_dir, color = "rgb", extensions = (".jpg", ".jpeg", ".png", ".bmp")):
+        """
+            image_dir is a directory of still images, read in filename order,
+            only files with one of extensions are read
+        """
+        FrameSource.__init__(self, color)
+        self.image_dir_m = image_dir
+        self.extensions_m = extensions
+
+    def get_image_paths(self):
+        return [os.path.join(self.image_dir_m, filename)
+                for filename in sorted(os.listdir(self.image_dir_m))
+                if filename.lower().endswith(self.extensions_m)]
+
+    def read_frames(self):
+        for image_path in self.get_image_paths():
+            frame = cv2.imread(image_path, cv2.IMREAD_COLOR)
+            if frame is None:
+                print("Error: Could not read image %s" %(image_path))
+                continue
+            yield self.to_color(frame)
+
+    def describe(self):
+        return {
+            "backend": "image_dir",
+            "images": [file_identity(image_path) for image_path in self.get_image_paths()],
+        }
+
+
+class MemmapFrameCache(FrameSource):
+    def __init__(self, source, cache_path):
+        """
+            source is the FrameSource decoded on the first run, cache_path is
+            the file its decoded frames are kept in, next to a cache_path.json
+            describing them. Frames read from the cache are read-only.
+        """
+        FrameSource.__init__(self, source.color_m)
+        self.source_m = source
+        self.cache_path_m = cache_path
+        self.meta_path_m = cache_path + ".json"
+
+    def load_meta(self):
+        """
+            Returns the cache description if the cache was made from the same
+            source and color order, None otherwise
+        """
+        if not os.path.exists(self.meta_path_m) or not os.path.exists(self.cache_path_m):
+            return None
+        with open(self.meta_path_m) as meta_file:
+            meta = json.load(meta_file)
+        if meta["source"] != json.loads(json.dumps(self.source_m.describe())) or meta["color"] != self.color_m:
+            return None
+        return meta
+
+    def is_cached(self):
+        return self.load_meta() is not None
+
+    def read_frames(self):
+        meta = self.load_meta()
+        if meta is None:
+            yield from self.decode_to_cache()
+            return
+        if meta["frames"] == 0:
+            return
+        frames = np.memmap(self.cache_path_m, dtype = np.uint8, mode = "r",
+                           shape = (meta["frames"],) + tuple(meta["shape"]))
+        for frame in frames:
+            # A frame is a view of the mapping, read one byte per page so it
+            # is paged in here, in the read timed by __iter__(), rather than
+            # on its first use by the pipeline
+            frame.reshape(-1)[::mmap.PAGESIZE].max()
+            yield frame
+
+    def decode_to_cache(self):
+        """
+            Decodes the source, writing each frame to the cache as it is
+            yielded. The cache is only kept once the source was read to its end.
+        """
+        tmp_path = self.cache_path_m + ".tmp"
+        cache_dir = os.path.dirname(self.cache_path_m)
+        # If filepath doesn't exist, create it
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        frame_count = 0
+        frame_shape = None
+        cache_file = open(tmp_path, "wb")
+        completed = False
+        try:
+            for frame in self.source_m.read_frames():
+                if cache_file is not None:
+                    if frame_shape is None:
+                        frame_shape = frame.shape
+                    if frame.shape == frame_shape:
+                        cache_file.write(np.ascontiguousarray(frame, dtype = np.uint8).data)
+                        frame_count += 1
+                    else:
+                        print("Error: Frames of different shapes cannot be cached")
+                        cache_file.close()
+                        cache_file = None
+                yield frame
+            completed = True
+        finally:
+            if cache_file is not None:
+                cache_file.close()
+            if not completed or cache_file is None:
+                # Partly decoded source or no cache possible, nothing to keep
+                os.remove(tmp_path)
+        if cache_file is None:
+            return
+        os.replace(tmp_path, self.cache_path_m)
+        meta = {
+            "source": self.source_m.describe(),
+            "color": self.color_m,
+            "frames": frame_count,
+            "shape": list(frame_shape) if frame_shape is not None else None,
+        }
+        with open(self.meta_path_m, "w") as meta_file:
+            json.dump(meta, meta_file)
+
+    def describe(self):
+        return self.source_m.describe()
@@ -2,6 +2,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 import cv2
 import os
+
+import JitKernels
 # Gradient Thresholds and Color Spaces can be used to more easily
 # identify lane markings on the road
 # GradientThresholds:
@@ -22,6 +24,14 @@ class GradientThresholds:
             binary_output array is 1 where gradients are in threshold range,
             0 everywhere else.
         """
+        abs_sobel = self.sobel_abs(img, orient, ksize)
+        return self.scale_sobel_thresh(abs_sobel, np.max(abs_sobel), thresh)
+    
+    def sobel_abs(self, img, orient='x', ksize=(3,3)):
+        """
+            Absolute x or y gradient of the blurred grayscale image, before it
+            is scaled by its max in apply_sobel_thresh()
+        """
         # Convert to Grayscale
         gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
         
@@ -36,9 +46,15 @@ class GradientThresholds:
             # Apply sobel for the y direction
             sobel = cv2.Sobel(gray, cv2.CV_64F, 0, 1)
         # Take absolute value of the derivative or gradient
-        abs_sobel = np.absolute(sobel)
+        return np.absolute(sobel)
+    
+    def scale_sobel_thresh(self, abs_sobel, max_sobel, thresh=(0, 255)):
+        """
+            Thresholds an absolute gradient scaled to 8-bit by max_sobel, the
+            max over the whole image
+        """
         # Scale the result to an 8-bit range (0-255)
-        scaled_sobel = np.uint8(255*abs_sobel/np.max(abs_sobel))
+        scaled_sobel = np.uint8(255*abs_sobel/max_sobel)
         # Apply lower and upper thresholds to mask scaled gradient
         binary_image = np.zeros_like(scaled_sobel)
         # Apply 1's when scaled gradient is within threshold
@@ -52,15 +68,29 @@ class GradientThresholds:
         """
             Calculate gradient magnitude
         """
+        grad_mag = self.grad_mag(img, sobel_kernel)
+        return self.scale_grad_mag_thresh(grad_mag, np.max(grad_mag), mag_thresh)
+        
+    def grad_mag(self, img, sobel_kernel=3):
+        """
+            Gradient magnitude, before it is scaled by its max in
+            apply_grad_mag_thresh()
+        """
         # Convert to grayscale
         gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
         # Take gradient in x and y separately
         sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize = sobel_kernel)
         sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize = sobel_kernel)
         # Calculate the gradient magnitude in both x and y direction
-        grad_mag = np.sqrt( (sobelx**2) + (sobely**2) )
+        return np.sqrt( (sobelx**2) + (sobely**2) )
+        
+    def scale_grad_mag_thresh(self, grad_mag, max_mag, mag_thresh=(0, 255)):
+        """
+            Thresholds a gradient magnitude scaled to 8-bit by max_mag, the max
+            over the whole image
+        """
         # Scale to 8-bit and convert to type = np.uint8
-        scale_factor = np.max(grad_mag)/255
+        scale_factor = max_mag/255
         scaled_grad_mag = (grad_mag/scale_factor).astype(np.uint8)
         # Create a binary mask where mag thresholds are met
         binary_image = np.zeros_like(scaled_grad_mag)
@@ -92,6 +122,125 @@ class GradientThresholds:
         # Return binary_image
         return binary_image
         
+    def sobel_xy_exact(self, gray, sobel_kernel=3):
+        """
+            Takes gradient in x and y of a grayscale image as exact integers:
+            int16 Sobel for kernels up to 5, which cannot overflow on 8-bit
+            images, float32 (still exact) for larger kernels
+        """
+        if sobel_kernel <= 5:
+            sobelx = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize = sobel_kernel)
+            sobely = cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize = sobel_kernel)
+            # Squared magnitudes up to 2*24480**2 fit in int32
+            return sobelx.astype(np.int32), sobely.astype(np.int32)
+        sobelx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize = sobel_kernel)
+        sobely = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize = sobel_kernel)
+        return sobelx.astype(np.int64), sobely.astype(np.int64)
+        
+    def apply_grad_mag_thresh_fast(self, img, sobel_kernel=3, mag_thresh=(0, 255)):
+        """
+            Same mask as apply_grad_mag_thresh() without sqrt or float64: the
+            scaled magnitude floor(255*mag/max) is in [t0, t1] exactly when
+            t0**2*max**2 <= 255**2*mag**2 < (t1+1)**2*max**2, so the squared
+            magnitude is compared to integer bounds computed once per image
+        """
+        grad_mag2 = self.grad_mag2(img, sobel_kernel)
+        return self.grad_mag2_thresh(grad_mag2, int(grad_mag2.max()), mag_thresh)
+        
+    def grad_mag2(self, img, sobel_kernel=3):
+        """
+            Squared gradient magnitude as exact integers
+        """
+        # Convert to grayscale
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        # Take gradient in x and y separately
+        sobelx, sobely = self.sobel_xy_exact(gray, sobel_kernel)
+        # Squared gradient magnitude
+        sobelx *= sobelx
+        sobely *= sobely
+        return np.add(sobelx, sobely, out = sobelx)
+        
+    def grad_mag2_thresh(self, grad_mag2, max_mag2, mag_thresh=(0, 255)):
+        """
+            Thresholds a squared gradient magnitude like
+            scale_grad_mag_thresh(), max_mag2 is the max over the whole image
+        """
+        if max_mag2 == 0:
+            # Flat image, every scaled magnitude is 0
+            low, high = (0, 0) if mag_thresh[0] <= 0 <= mag_thresh[1] else (1, 0)
+        else:
+            # Integer bounds on the squared magnitude, ceil of the low bound and
+            # the largest value strictly under the high bound
+            low = -(-int(mag_thresh[0])**2*max_mag2//255**2)
+            high = -(-(int(mag_thresh[1]) + 1)**2*max_mag2//255**2) - 1
+        # Create a binary mask where mag thresholds are met
+        binary_image = np.zeros(grad_mag2.shape, dtype = np.uint8)
+        binary_image[(grad_mag2 >= low) & (grad_mag2 <= high)] = 1
+        if max_mag2 == 0:
+            return binary_image
+        # A magnitude scaling exactly to a bound, e.g. the max itself to 255,
+        # can come out one under it in floating point. Those are set as
+        # scale_grad_mag_thresh() would.
+        scale_factor = np.sqrt(np.float64(max_mag2))/255
+        for bound, on_bound in ((int(mag_thresh[0]), low), (int(mag_thresh[1]) + 1, high + 1)):
+            if 0 < bound <= 255 and on_bound*255**2 == bound**2*max_mag2:
+                exact = grad_mag2 == on_bound
+                if exact.any():
+                    scaled = np.uint8(np.sqrt(np.float64(on_bound))/scale_factor)
+                    binary_image[exact] = mag_thresh[0] <= scaled <= mag_thresh[1]
+
+        # Return this mask as binary_image
+        return binary_image
+        
+    def apply_grad_dir_thresh_fast(self, img, sobel_kernel=3, dir_thresh=(0, np.pi/2)):
+        """
+            Same mask as apply_grad_dir_thresh() without arctan2 or float64
+            images: for angles in [0, pi/2), arctan2(|sy|, |sx|) >= t exactly
+            when |sy| >= tan(t)*|sx|, so the direction bounds become two cross
+            multiplied comparisons, made in float32. The few pixels whose
+            comparison is within float32 rounding of a bound get arctan2 in
+            float64. Returns a uint8 mask.
+        """
+        # Convert to grayscale
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        # Take gradient in x and y, absolute values (exact in float32)
+        sobelx, sobely = self.sobel_xy_exact(gray, sobel_kernel)
+        abs_sobelx = np.abs(sobelx).astype(np.float32)
+        abs_sobely = np.abs(sobely).astype(np.float32)
+        
+        # Create a binary image where direction thresholds are met
+        in_range = np.ones(gray.shape, dtype = bool)
+        near_bound = np.zeros(gray.shape, dtype = bool)
+        for bound, is_low in ((dir_thresh[0], True), (dir_thresh[1], False)):
+            if (bound > np.pi/2) if is_low else (bound < 0):
+                in_range[:] = False
+                continue
+            if (bound <= 0) if is_low else (bound >= np.pi/2):
+                # Every direction is on this side of the bound
+                continue
+            bound_sobelx = np.float32(np.tan(bound))*abs_sobelx
+            diff = abs_sobely - bound_sobelx
+            if is_low:
+                # A zero gradient has direction 0, under the low bound
+                in_range &= (diff >= 0) & (abs_sobely > 0)
+            else:
+                in_range &= diff <= 0
+            # float32 tan and products are within a few 1e-7 of exact
+            bound_sobelx *= np.float32(1e-5)
+            near_bound |= np.abs(diff) <= bound_sobelx
+        near_rows, near_cols = np.nonzero(near_bound)
+        if len(near_rows):
+            dir_grad = np.arctan2(
+                abs_sobely[near_rows, near_cols].astype(np.float64),
+                abs_sobelx[near_rows, near_cols].astype(np.float64)
+            )
+            in_range[near_rows, near_cols] = (dir_grad >= dir_thresh[0]) & (dir_grad <= dir_thresh[1])
+        binary_image = np.zeros(gray.shape, dtype = np.uint8)
+        binary_image[in_range] = 1
+        
+        # Return binary_image
+        return binary_image
+        
     def apply_combined_thresh(self, combination_code, grad_x = None, grad_y = None, grad_mag = None, grad_dir = None):
         """
             Combine Gradient Thresholding binary images based on the gradients 
@@ -102,6 +251,17 @@ class GradientThresholds:
             2: X-Sobel, Gradient Magnitude, Gradient Direction
             3: X-Sobel, Y-Sobel, Gradient Magnitude, Gradient Direction
         """
+        if JitKernels.is_jit_enabled():
+            return JitKernels.combine_masks(
+                "combined_thresh", self.apply_combined_thresh_numpy, combination_code,
+                (grad_x, grad_y, grad_mag, grad_dir)
+            )
+        return self.apply_combined_thresh_numpy(combination_code, grad_x, grad_y, grad_mag, grad_dir)
+
+    def apply_combined_thresh_numpy(self, combination_code, grad_x = None, grad_y = None, grad_mag = None, grad_dir = None):
+        """
+            NumPy version of apply_combined_thresh()
+        """
         combined = np.zeros_like(grad_x)
         if combination_code == 0:
             combined[ (grad_x == 1) & (grad_mag == 1) ] = 1
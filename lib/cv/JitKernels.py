@@ -0,0 +1,200 @@
+import numpy as np
+
+# JitKernels are optional compiled versions of hot loops, used when Numba is
+# installed and the NumPy implementations otherwise:
+# - slide_windows: the Sliding Windows Search in one pass over the nonzero
+#   pixels bucketed by window, instead of masking every nonzero pixel against
+#   every window
+# - combine_masks: any combination of up to 4 binary masks as one fused loop
+#   over a 16 entry truth table, instead of temporary boolean arrays. The table
+#   is made by running the NumPy combine function itself on every combination
+#   of inputs, so both paths agree by construction.
+# cross_check() runs both paths on the same inputs and compares their outputs.
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+jit_enabled = numba is not None
+
+
+def set_jit_enabled(enabled):
+    """
+        Turns the compiled kernels on or off, they stay off without Numba
+    """
+    global jit_enabled
+    jit_enabled = enabled and numba is not None
+
+
+def is_jit_enabled():
+    return jit_enabled
+
+
+def slide_windows_kernel(nonzeroy, nonzerox, img_h, nwindows, window_height, margin, minpix, leftx_current, rightx_current):
+    """
+        Sliding Windows Search over the nonzero pixels. Returns the left and
+        right lane pixel indices, window by window in pixel order like the
+        NumPy version, and the left and right window centers per window.
+    """
+    npoints = nonzeroy.shape[0]
+    # Bucket the pixels by window (0 is the bottom window), keeping their order
+    window_of = np.empty(npoints, dtype = np.int64)
+    counts = np.zeros(nwindows + 1, dtype = np.int64)
+    for i in range(npoints):
+        window = (img_h - 1 - nonzeroy[i])//window_height
+        if nonzeroy[i] < img_h - nwindows*window_height or window < 0 or window >= nwindows:
+            window = nwindows
+        window_of[i] = window
+        counts[window] += 1
+    starts = np.zeros(nwindows + 2, dtype = np.int64)
+    for window in range(nwindows + 1):
+        starts[window + 1] = starts[window] + counts[window]
+    fill = starts[:nwindows + 1].copy()
+    bucketed = np.empty(npoints, dtype = np.int64)
+    for i in range(npoints):
+        bucketed[fill[window_of[i]]] = i
+        fill[window_of[i]] += 1
+
+    left_inds = np.empty(npoints, dtype = np.int64)
+    right_inds = np.empty(npoints, dtype = np.int64)
+    left_centers = np.empty(nwindows, dtype = np.int64)
+    right_centers = np.empty(nwindows, dtype = np.int64)
+    nleft = 0
+    nright = 0
+    for window in range(nwindows):
+        left_centers[window] = leftx_current
+        right_centers[window] = rightx_current
+        left_count = 0
+        right_count = 0
+        left_sum = 0.0
+        right_sum = 0.0
+        for j in range(starts[window], starts[window + 1]):
+            i = bucketed[j]
+            x = nonzerox[i]
+            if x >= leftx_current - margin and x < leftx_current + margin:
+                left_inds[nleft + left_count] = i
+                left_count += 1
+                left_sum += x
+            if x >= rightx_current - margin and x < rightx_current + margin:
+                right_inds[nright + right_count] = i
+                right_count += 1
+                right_sum += x
+        nleft += left_count
+        nright += right_count
+        # Recenter next window on the mean position of the pixels found
+        if left_count > minpix:
+            leftx_current = int(left_sum/left_count)
+        if right_count > minpix:
+            rightx_current = int(right_sum/right_count)
+    return left_inds[:nleft], right_inds[:nright], left_centers, right_centers
+
+
+def combine_masks_kernel(table, a, b, c, d, out):
+    """
+        out = table[a + 2*b + 4*c + 8*d] for each pixel, where a mask counts
+        as set when it equals 1
+    """
+    for i in range(out.shape[0]):
+        index = 0
+        if a[i] == 1:
+            index += 1
+        if b[i] == 1:
+            index += 2
+        if c[i] == 1:
+            index += 4
+        if d[i] == 1:
+            index += 8
+        out[i] = table[index]
+
+
+if numba is not None:
+    slide_windows_kernel = numba.njit(cache = True, nogil = True)(slide_windows_kernel)
+    combine_masks_kernel = numba.njit(cache = True, nogil = True)(combine_masks_kernel)
+
+# (name, code, number of masks) -> truth table
+truth_tables = {}
+
+
+def get_truth_table(name, combine, code, nmasks):
+    """
+        Truth table of a NumPy combine function taking nmasks masks (up to
+        4), made by running it on the 16 combinations of inputs
+    """
+    key = (name, code, nmasks)
+    if key not in truth_tables:
+        index = np.arange(16)
+        inputs = [((index >> bit) & 1).astype(np.uint8) for bit in range(nmasks)]
+        truth_tables[key] = np.asarray(combine(code, *inputs), dtype = np.uint8)
+    return truth_tables[key]
+
+
+def combine_masks(name, combine, code, masks):
+    """
+        Fused version of combine(code, *masks), combine being the NumPy
+        version named name, for up to 4 masks, masks the code doesn't use may
+        be given as None. Raises ValueError when a mask the code uses is
+        None. The result has the dtype of the first mask, like
+        np.zeros_like() in the NumPy version.
+    """
+    table = get_truth_table(name, combine, code, len(masks))
+    index = np.arange(len(table))
+    for bit, mask in enumerate(masks):
+        # The code uses a mask when flipping it changes the result somewhere
+        if mask is None and np.any(table != table[index ^ (1 << bit)]):
+            raise ValueError("%s code %s uses mask %d, which is None" %(name, code, bit))
+    masks = list(masks) + [None]*(4 - len(masks))
+    first = masks[0]
+    out = np.zeros(first.shape, dtype = first.dtype)
+    flat = [np.ascontiguousarray(m).reshape(-1) if m is not None else None for m in masks]
+    # Unused inputs still need an array to be passed, any is read the same
+    flat = [f if f is not None else flat[0] for f in flat]
+    combine_masks_kernel(table.astype(first.dtype), flat[0], flat[1], flat[2], flat[3], out.reshape(-1))
+    return out
+
+
+def cross_check(nframes = 4, img_shape = (720, 1280), seed = 0):
+    """
+        Runs the NumPy and compiled versions of each kernel on the same random
+        inputs, returns whether their outputs are identical per kernel
+    """
+    from LaneLineDetection import LaneLineDetection
+    from GradientThresholds import GradientThresholds
+    from ColorThresholds import ColorThresholds
+
+    rng = np.random.default_rng(seed)
+    enabled = jit_enabled
+    results = {"slide_windows": True, "combined_thresh": True, "rgb_thresh": True, "hls_thresh": True}
+    try:
+        for i in range(nframes):
+            # Lane-like binary warped image: two noisy curves plus noise
+            binary_warped = (rng.random(img_shape) < 0.01).astype(np.uint8)
+            rows = np.arange(img_shape[0])
+            for base in (img_shape[1]//4, 3*img_shape[1]//4):
+                cols = (base + 40*np.sin(rows/150.0 + i) + rng.normal(0, 5, rows.size)).astype(int)
+                for offset in range(-8, 9):
+                    binary_warped[rows, np.clip(cols + offset, 0, img_shape[1] - 1)] = 1
+            outputs = []
+            for use_jit in (False, True):
+                set_jit_enabled(use_jit)
+                find_lane_lines = LaneLineDetection()
+                histogram = find_lane_lines.histogram_peaks(binary_warped)
+                out_img = find_lane_lines.find_lane_pixels(binary_warped, histogram)
+                outputs.append((find_lane_lines.leftx_m, find_lane_lines.lefty_m,
+                                find_lane_lines.rightx_m, find_lane_lines.righty_m, out_img))
+            results["slide_windows"] &= all(np.array_equal(a, b) for a, b in zip(*outputs))
+
+            masks = [(rng.random(img_shape) < 0.5).astype(np.uint8) for j in range(4)]
+            for code in range(4):
+                for name, combine in (("combined_thresh", lambda: GradientThresholds().apply_combined_thresh(code, *masks)),
+                                      ("rgb_thresh", lambda: ColorThresholds().apply_rgb_thresh(code, *masks[:3])),
+                                      ("hls_thresh", lambda: ColorThresholds().apply_hls_thresh(code, *masks[:3]))):
+                    set_jit_enabled(False)
+                    expected = combine()
+                    set_jit_enabled(True)
+                    results[name] &= np.array_equal(expected, combine()) and expected.dtype == combine().dtype
+    finally:
+        set_jit_enabled(enabled)
+    if numba is None:
+        print("Error: Numba is not installed, only the NumPy versions were run")
+    return results
@@ -22,6 +22,10 @@ class LaneBoundaries:
         
         # Overlayed undistorted image with lane boundaries detected
         self.result_m = None
+
+        # Lane polygon warped back to the image, as (y_low, y_high, x_low,
+        # x_high, green channel of that box), so it can be blended again
+        self.lane_layer_m = None
         
     def set_warped_binary_img(self, binary_warped):
         self.binary_warped_m = binary_warped
@@ -87,10 +91,11 @@ class LaneBoundaries:
         """
         self.result_m = lane_boundary_img
         
-    def overlay_lane_boundaries(self):
+    def overlay_lane_boundaries(self, keep_layer = True):
         """
             Warps the detected lane boundaries onto the original image
-            binary_warped, left_fitx, right_fitx, ploty
+            binary_warped, left_fitx, right_fitx, ploty. keep_layer keeps a
+            copy of the warped lane for get_lane_layer().
         """
         # Establish original image size as tuple
         undist_img_size = (self.undist_img_m.shape[1], self.undist_img_m.shape[0])
@@ -110,8 +115,95 @@ class LaneBoundaries:
         newwarp = cv2.warpPerspective(color_warp, self.Minv_m, undist_img_size)
         
         # Combine the result with the original image for lane boundaries to appear
-        self.result_m = cv2.addWeighted(self.undist_img_m, 1, newwarp, 0.3, 0)   
-        
+        self.result_m = cv2.addWeighted(self.undist_img_m, 1, newwarp, 0.3, 0)
+        if keep_layer:
+            self.lane_layer_m = (0, newwarp.shape[0], 0, newwarp.shape[1], np.ascontiguousarray(newwarp[:, :, 1]))
+        else:
+            self.lane_layer_m = None
+
+    def overlay_lane_boundaries_direct(self, in_place = False):
+        """
+            Same overlay as overlay_lane_boundaries() without warping and
+            blending a full frame: the lane polygon's vertices are projected
+            through Minv to find its bounding box in the image, and only that
+            box is warped back and blended. With in_place, the undistorted
+            image itself is drawn on.
+        """
+        img_h, img_w = self.undist_img_m.shape[0], self.undist_img_m.shape[1]
+        if in_place:
+            self.result_m = self.undist_img_m
+        else:
+            self.result_m = self.undist_img_m.copy()
+
+        # Lane polygon in warped space, drawn on one channel as the full
+        # frame overlay does on its green channel, but only over the
+        # polygon's bounding box clipped to the warped image
+        pts_left = np.array([np.transpose(np.vstack([self.left_fitx_m, self.ploty_m]))])
+        pts_right = np.array([np.flipud(np.transpose(np.vstack([self.right_fitx_m, self.ploty_m])))])
+        poly = np.int_(np.hstack((pts_left, pts_right)))[0]
+        warp_h, warp_w = self.binary_warped_m.shape[0], self.binary_warped_m.shape[1]
+        src_x_low, src_y_low = np.maximum(poly.min(axis = 0), 0)
+        src_x_high = min(poly[:, 0].max() + 1, warp_w)
+        src_y_high = min(poly[:, 1].max() + 1, warp_h)
+        if src_x_low >= src_x_high or src_y_low >= src_y_high:
+            self.lane_layer_m = None
+            return
+
+        # Image pixels blending any of the polygon's warped pixels: the
+        # polygon a pixel wider on each side for the bilinear warp's reach,
+        # its vertices projected through Minv. Within the projection of the
+        # box above, in case the vertices outside the warped image project
+        # further out, then a pixel wider again and clipped to the image.
+        reach = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]])
+        vertices = np.float32(np.concatenate([
+            (poly[np.newaxis, :, :] + reach[:, np.newaxis, :]).reshape(-1, 2),
+            [[src_x_low - 1, src_y_low - 1], [src_x_high, src_y_low - 1],
+             [src_x_high, src_y_high], [src_x_low - 1, src_y_high]]
+        ]))
+        img_pts = cv2.perspectiveTransform(vertices.reshape(-1, 1, 2), self.Minv_m).reshape(-1, 2)
+        poly_pts, box_pts = img_pts[:-4], img_pts[-4:]
+        x_low = int(np.clip(np.floor(max(poly_pts[:, 0].min(), box_pts[:, 0].min())) - 1, 0, img_w))
+        x_high = int(np.clip(np.ceil(min(poly_pts[:, 0].max(), box_pts[:, 0].max())) + 2, 0, img_w))
+        y_low = int(np.clip(np.floor(max(poly_pts[:, 1].min(), box_pts[:, 1].min())) - 1, 0, img_h))
+        y_high = int(np.clip(np.ceil(min(poly_pts[:, 1].max(), box_pts[:, 1].max())) + 2, 0, img_h))
+        if x_low >= x_high or y_low >= y_high:
+            self.lane_layer_m = None
+            return
+        warp_lane = np.zeros((src_y_high - src_y_low, src_x_high - src_x_low), dtype = np.uint8)
+        cv2.fillPoly(warp_lane, [poly], 255, offset = (-int(src_x_low), -int(src_y_low)))
+
+        # Warp back only the image box from the polygon's box. warpPerspective()
+        # maps each image pixel through the inverse of Minv, inverted the same
+        # way here, with the image box's offset moved into its last column
+        # and the polygon box's offset taken off its first two rows
+        M = cv2.invert(self.Minv_m)[1]
+        M[:, 2] += M[:, 0]*x_low + M[:, 1]*y_low
+        M[0] -= M[2]*src_x_low
+        M[1] -= M[2]*src_y_low
+        green = cv2.warpPerspective(
+            warp_lane, M, (x_high - x_low, y_high - y_low), flags = cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+        )
+        self.lane_layer_m = (y_low, y_high, x_low, x_high, green)
+        self.overlay_lane_layer(self.lane_layer_m)
+
+    def overlay_lane_layer(self, lane_layer):
+        """
+            Blends a lane layer (y_low, y_high, x_low, x_high, green channel
+            of the box) at 0.3 weight like overlay_lane_boundaries(), outside
+            the box the full frame blend leaves the image as it is
+        """
+        y_low, y_high, x_low, x_high, green = lane_layer
+        roi = self.result_m[y_low:y_high, x_low:x_high]
+        zeros = np.zeros_like(green)
+        roi[...] = cv2.addWeighted(roi, 1, cv2.merge((zeros, green, zeros)), 0.3, 0)
+
+    def get_lane_layer(self):
+        """
+            Returns the lane polygon warped back by the last overlay, see
+            overlay_lane_layer()
+        """
+        return self.lane_layer_m
+
     def overlay_radius_curvature(self):
         """
             Adds Lane Curvature Radius text onto the overlayed lane boundaries image
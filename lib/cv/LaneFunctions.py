@@ -0,0 +1,298 @@
+from collections import namedtuple
+import numpy as np
+import cv2
+
+import JitKernels
+
+# LaneFunctions are the lane finding stages as pure functions: they take their
+# inputs and an immutable config and return small namedtuple records, keeping
+# nothing between calls. Any number of threads can call them with no locks or
+# per-thread copies, and a result only depends on the inputs given, not on
+# what was called before. The classes (LaneLineDetection, LaneLineCurvature,
+# LaneVehiclePosition, CameraPerspective, CameraCalibration) are thin wrappers
+# keeping results in their attributes for the notebook's step by step use.
+# Tracking is explicit: find_lane() and lane_result() take the previous
+# frame's LaneFit. LanePipeline keeps its tracker and output rates on the
+# instance, one pipeline per stream; LanePipeline.lane_result() is its entry
+# point that only runs these functions and keeps nothing.
+
+# Sliding Windows Search hyperparameters
+SlidingWindowConfig = namedtuple("SlidingWindowConfig", ["nwindows", "margin", "minpix"])
+SlidingWindowConfig.__new__.__defaults__ = (9, 100, 50)
+
+# Pixels of each lane line and their indices into the nonzero pixels
+LanePixels = namedtuple("LanePixels", ["leftx", "lefty", "rightx", "righty", "left_inds", "right_inds"])
+
+# Lane pixels found by Sliding Windows Search, window centers per window
+# (bottom window first) for drawing the windows
+SlidingWindows = namedtuple("SlidingWindows", ["lane_pixels", "left_centers", "right_centers", "window_height"])
+
+# Second order polynomial x = A*y**2 + B*y + C per lane line, ploty the y values
+LaneFit = namedtuple("LaneFit", ["ploty", "left_fit", "right_fit"])
+
+CurvatureRadius = namedtuple("CurvatureRadius", ["left_curverad", "right_curverad", "units"])
+
+CurvatureAngle = namedtuple("CurvatureAngle", ["l_angle_curve", "r_angle_curve", "units"])
+
+VehiclePosition = namedtuple("VehiclePosition", ["dist_center", "units", "side_center"])
+
+PerspectiveTransform = namedtuple("PerspectiveTransform", ["M", "Minv"])
+
+# Lane Line Detection and measurements of one frame: lane_fit is the LaneFit
+# to pass as the next frame's prior, method "prior" or "search"
+LaneResult = namedtuple("LaneResult", ["lane_fit", "method", "curvature_radius", "curvature_angle", "vehicle_position"])
+
+# Default conversions from bird's eye view pixels to meters: 30 m by 3.7 m of
+# road span 720 by 700 pixels
+YM_PER_PIX = 30/720
+XM_PER_PIX = 3.7/700
+
+
+# Distortion Correction and Perspective Transform
+
+def undistort(img, mtx, dist_coeff):
+    """
+        Distortion Correction with the camera matrix and distortion
+        coefficients
+    """
+    return cv2.undistort(img, mtx, dist_coeff, None, mtx)
+
+
+def perspective_transform(imshape, src_ratios, dst_ratios):
+    """
+        Perspective transform M and its inverse Minv for an image shape, source
+        and destination points given as (x, y) ratios of width and height
+    """
+    size = np.float32([imshape[1], imshape[0]])
+    src = np.float32(src_ratios) * size
+    dst = np.float32(dst_ratios) * size
+    return PerspectiveTransform(cv2.getPerspectiveTransform(src, dst),
+                                cv2.getPerspectiveTransform(dst, src))
+
+
+def warp(img, M):
+    """
+        Warps an image with a perspective transform, keeping its size
+    """
+    return cv2.warpPerspective(img, M, (img.shape[1], img.shape[0]), flags=cv2.INTER_LINEAR)
+
+
+# Histogram Peaks
+
+def histogram_peaks(binary_warped):
+    """
+        Sum of the pixels of each column in the bottom half of the image
+    """
+    return np.sum(binary_warped[binary_warped.shape[0]//2:,:], axis = 0)
+
+
+def histogram_peaks_points(nonzeroy, nonzerox, img_shape):
+    """
+        histogram_peaks() from the nonzero pixels of an image of img_shape
+    """
+    bottom_half = nonzeroy >= img_shape[0]//2
+    return np.bincount(nonzerox[bottom_half], minlength = img_shape[1])
+
+
+def split_histogram(histogram):
+    """
+        x-positions of the left and right lane line bases: the peaks of the
+        left and right halves of the histogram
+    """
+    midpoint = int(histogram.shape[0]//2)
+    return np.argmax(histogram[:midpoint]), np.argmax(histogram[midpoint:]) + midpoint
+
+
+# Lane pixels
+
+def sliding_window_search(nonzeroy, nonzerox, img_h, leftx_base, rightx_base, config = SlidingWindowConfig()):
+    """
+        Sliding Windows Search up an image of height img_h from the lane line
+        bases, over its nonzero pixels. Returns SlidingWindows.
+    """
+    window_height = int(img_h//config.nwindows)
+    if JitKernels.is_jit_enabled():
+        left_inds, right_inds, left_centers, right_centers = JitKernels.slide_windows_kernel(
+            nonzeroy, nonzerox, img_h, config.nwindows, window_height,
+            config.margin, config.minpix, int(leftx_base), int(rightx_base)
+        )
+    else:
+        leftx_current = leftx_base
+        rightx_current = rightx_base
+        left_lane_inds = []
+        right_lane_inds = []
+        left_centers = []
+        right_centers = []
+        for window in range(config.nwindows):
+            # Window boundaries in x and y (and right and left)
+            win_y_low = img_h - (window+1)*window_height
+            win_y_high = img_h - window*window_height
+            left_centers.append(leftx_current)
+            right_centers.append(rightx_current)
+            in_rows = (nonzeroy >= win_y_low) & (nonzeroy < win_y_high)
+            # Nonzero pixels within the window
+            good_left_inds = (in_rows &
+                              (nonzerox >= leftx_current - config.margin) &
+                              (nonzerox < leftx_current + config.margin)).nonzero()[0]
+            good_right_inds = (in_rows &
+                               (nonzerox >= rightx_current - config.margin) &
+                               (nonzerox < rightx_current + config.margin)).nonzero()[0]
+            left_lane_inds.append(good_left_inds)
+            right_lane_inds.append(good_right_inds)
+            # Recenter next window on the mean position of the pixels found
+            if len(good_left_inds) > config.minpix:
+                leftx_current = int(np.mean(nonzerox[good_left_inds]))
+            if len(good_right_inds) > config.minpix:
+                rightx_current = int(np.mean(nonzerox[good_right_inds]))
+        left_inds = np.concatenate(left_lane_inds)
+        right_inds = np.concatenate(right_lane_inds)
+        left_centers = np.array(left_centers, dtype = np.int64)
+        right_centers = np.array(right_centers, dtype = np.int64)
+    lane_pixels = LanePixels(nonzerox[left_inds], nonzeroy[left_inds],
+                             nonzerox[right_inds], nonzeroy[right_inds],
+                             left_inds, right_inds)
+    return SlidingWindows(lane_pixels, left_centers, right_centers, window_height)
+
+
+def search_around_poly(nonzeroy, nonzerox, left_fit, right_fit, margin = 100):
+    """
+        Search from Prior: the nonzero pixels within +/- margin of the
+        previous polynomials. Returns LanePixels (indices as boolean masks).
+    """
+    left_fitx = left_fit[0]*(nonzeroy**2) + left_fit[1]*nonzeroy + left_fit[2]
+    right_fitx = right_fit[0]*(nonzeroy**2) + right_fit[1]*nonzeroy + right_fit[2]
+    left_inds = (nonzerox > left_fitx - margin) & (nonzerox < left_fitx + margin)
+    right_inds = (nonzerox > right_fitx - margin) & (nonzerox < right_fitx + margin)
+    return LanePixels(nonzerox[left_inds], nonzeroy[left_inds],
+                      nonzerox[right_inds], nonzeroy[right_inds],
+                      left_inds, right_inds)
+
+
+# Polynomial fit
+
+def fit_lane_polynomials(lane_pixels, img_h):
+    """
+        Fits a second order polynomial to each lane line with np.polyfit.
+        Returns LaneFit.
+    """
+    left_fit = np.polyfit(lane_pixels.lefty, lane_pixels.leftx, 2)
+    right_fit = np.polyfit(lane_pixels.righty, lane_pixels.rightx, 2)
+    return LaneFit(np.linspace(0, img_h-1, img_h), left_fit, right_fit)
+
+
+def find_lane(binary_warped, config = SlidingWindowConfig(), prior = None):
+    """
+        Lane Line Detection on a binary warped image: Search from Prior around
+        the prior LaneFit when given and both lines keep more than minpix
+        pixels, Histogram Peaks and Sliding Windows Search otherwise, then a
+        Search from Prior around the first fit. Returns (LaneFit, method) where
+        method is "prior" or "search".
+    """
+    img_h = binary_warped.shape[0]
+    nonzeroy, nonzerox = binary_warped.nonzero()
+    if prior is not None:
+        lane_pixels = search_around_poly(nonzeroy, nonzerox, prior.left_fit, prior.right_fit, config.margin)
+        if len(lane_pixels.leftx) > config.minpix and len(lane_pixels.rightx) > config.minpix:
+            return fit_lane_polynomials(lane_pixels, img_h), "prior"
+    leftx_base, rightx_base = split_histogram(histogram_peaks(binary_warped))
+    windows = sliding_window_search(nonzeroy, nonzerox, img_h, leftx_base, rightx_base, config)
+    lane_fit = fit_lane_polynomials(windows.lane_pixels, img_h)
+    lane_pixels = search_around_poly(nonzeroy, nonzerox, lane_fit.left_fit, lane_fit.right_fit, config.margin)
+    return fit_lane_polynomials(lane_pixels, img_h), "search"
+
+
+# Lane Curvature and Vehicle Position
+
+def measure_radius_curvature(ploty, left_fit, right_fit, unit_type = "meters", ym_per_pix = YM_PER_PIX, xm_per_pix = XM_PER_PIX):
+    """
+        Radius of curvature of each lane line at the bottom of the image, in
+        "pixels" or "meters". Returns CurvatureRadius.
+    """
+    # y-value for where we want radius of curvature, the bottom of the image
+    y_eval = np.max(ploty)
+    if unit_type == "pixels":
+        left_curverad = ((1 + (2*left_fit[0]*y_eval + left_fit[1])**2)**1.5) / np.absolute(2*left_fit[0])
+        right_curverad = ((1 + (2*right_fit[0]*y_eval + right_fit[1])**2)**1.5) / np.absolute(2*right_fit[0])
+        return CurvatureRadius(left_curverad, right_curverad, "(p)")
+    # Fit new polynomials to x, y in real world space
+    left_fitx = left_fit[0]*ploty**2 + left_fit[1]*ploty + left_fit[2]
+    right_fitx = right_fit[0]*ploty**2 + right_fit[1]*ploty + right_fit[2]
+    left_fit_rw = np.polyfit(ploty*ym_per_pix, left_fitx*xm_per_pix, 2)
+    right_fit_rw = np.polyfit(ploty*ym_per_pix, right_fitx*xm_per_pix, 2)
+    left_curverad = ((1 + (2*left_fit_rw[0]*y_eval*ym_per_pix + left_fit_rw[1])**2)**1.5) / np.absolute(2*left_fit_rw[0])
+    right_curverad = ((1 + (2*right_fit_rw[0]*y_eval*ym_per_pix + right_fit_rw[1])**2)**1.5) / np.absolute(2*right_fit_rw[0])
+    return CurvatureRadius(left_curverad, right_curverad, "(m)")
+
+
+def measure_angle_curvature(left_curverad, right_curverad, curve_type = "arc"):
+    """
+        Angle of curvature in degrees over a 100 m arc from radii in meters.
+        Returns CurvatureAngle.
+    """
+    if curve_type != "arc":
+        return CurvatureAngle(None, None, None)
+    # (100m/(2*(pi)*radius_curvature_meters))*360deg
+    return CurvatureAngle((100/(2*(np.pi)*left_curverad))*360,
+                          (100/(2*(np.pi)*right_curverad))*360, "(deg)")
+
+
+def measure_vehicle_position(img_shape, left_fit, right_fit, unit_type = "meters", xm_per_pix = XM_PER_PIX):
+    """
+        Vehicle's distance from the lane center at the bottom of a bird's eye
+        view of img_shape, camera at the center of the car. Returns
+        VehiclePosition.
+    """
+    img_h, img_w = img_shape[0], img_shape[1]
+    vehicle_position = img_w/2
+    # x-intercept of the left and right polynomial
+    left_fit_x_int = left_fit[0]*img_h**2 + left_fit[1]*img_h + left_fit[2]
+    right_fit_x_int = right_fit[0]*img_h**2 + right_fit[1]*img_h + right_fit[2]
+    lane_center_position = (left_fit_x_int + right_fit_x_int)/2
+    if unit_type == "pixels":
+        dist_center, units = np.abs(vehicle_position - lane_center_position), "(p)"
+    elif unit_type == "meters":
+        dist_center, units = np.abs(vehicle_position - lane_center_position)*xm_per_pix, "(m)"
+    else:
+        dist_center, units = "undefined", None
+    if lane_center_position > vehicle_position:
+        side_center = "left of center"
+    else:
+        side_center = "right of center"
+    return VehiclePosition(dist_center, units, side_center)
+
+
+# Lane Line Detection to measurements in one call
+
+def scale_lane_fit(lane_fit, from_shape, to_shape):
+    """
+        Scales a LaneFit fit in an image of from_shape to the pixels of an
+        image of to_shape
+    """
+    sy = from_shape[0]/to_shape[0]
+    sx = from_shape[1]/to_shape[1]
+    # x = sx*X and y = sy*Y, so X = (A*sy**2/sx)*Y**2 + (B*sy/sx)*Y + C/sx
+    fit_scale = np.array([sy*sy/sx, sy/sx, 1/sx])
+    ploty = np.linspace(0, to_shape[0]-1, to_shape[0])
+    return LaneFit(ploty, np.asarray(lane_fit.left_fit)*fit_scale, np.asarray(lane_fit.right_fit)*fit_scale)
+
+
+def lane_result(binary_warped, config = SlidingWindowConfig(), prior = None, unit_type = "meters", curve_type = "arc", view_shape = None):
+    """
+        Lane Line Detection with find_lane(), then Lane Curvature and Vehicle
+        Position in pixels of a bird's eye view of view_shape (binary_warped's
+        shape by default), meters per pixel scaled to it. Returns LaneResult,
+        its lane_fit in binary_warped's pixels.
+    """
+    lane_fit, method = find_lane(binary_warped, config, prior)
+    measured_fit = lane_fit
+    if view_shape is None:
+        view_shape = binary_warped.shape
+    elif tuple(view_shape[:2]) != binary_warped.shape[:2]:
+        measured_fit = scale_lane_fit(lane_fit, binary_warped.shape, view_shape)
+    # 30 m by 3.7 m of road span 720 by 700 pixels of a 1280x720 view
+    ym_per_pix = YM_PER_PIX*(720/view_shape[0])
+    xm_per_pix = XM_PER_PIX*(1280/view_shape[1])
+    curvature_radius = measure_radius_curvature(*measured_fit, unit_type, ym_per_pix, xm_per_pix)
+    curvature_angle = measure_angle_curvature(curvature_radius.left_curverad, curvature_radius.right_curverad, curve_type)
+    vehicle_position = measure_vehicle_position(view_shape, measured_fit.left_fit, measured_fit.right_fit, unit_type, xm_per_pix)
+    return LaneResult(lane_fit, method, curvature_radius, curvature_angle, vehicle_position)
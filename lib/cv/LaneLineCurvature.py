@@ -5,6 +5,8 @@ import math
 import cv2
 import os
 
+import LaneFunctions
+
 class LaneLineCurvature:
     def __init__(self):
         """
@@ -22,38 +24,24 @@ class LaneLineCurvature:
         # 200 pixels were used on the left and 900 on the right
         self.xm_per_pix_m = 3.7/700 # Meters per Pixel in x dimension
         
+    def set_meters_per_pixel(self, ym_per_pix, xm_per_pix):
+        """
+            Overrides conversions from pixels to meters, needed when the
+            polynomials are not in the 1280x720 bird's eye view pixels
+        """
+        self.ym_per_pix_m = ym_per_pix
+        self.xm_per_pix_m = xm_per_pix
+        
     def measure_radius_curvature(self, ploty, left_fit, right_fit, unit_type):
         """
             Calculates the curvature of polynomial functions in pixels or meters.
         """
-        # y-value for where we want radius of curvature
-        # Chose the max y-value,corresponding to bottom of image
-        y_eval = np.max(ploty)
-
-        # Generate x and y values for plotting
-        left_fitx = left_fit[0]*ploty**2 + left_fit[1]*ploty + left_fit[2]
-        right_fitx = right_fit[0]*ploty**2 + right_fit[1]*ploty + right_fit[2]       
-
-        # Fit new polynomials to x, y in real world space
-        left_fit_rw = np.polyfit(ploty*self.ym_per_pix_m, left_fitx*self.xm_per_pix_m, 2)
-        right_fit_rw = np.polyfit(ploty*self.ym_per_pix_m, right_fitx*self.xm_per_pix_m, 2)
-        
-        if(unit_type == "pixels"):
-            # Calculates R-curve (radius of curvature)
-            # Left Line R-curve
-            self.left_curverad_m = ((1 + (2*left_fit[0]*y_eval + left_fit[1])**2)**1.5) / np.absolute(2*left_fit[0])
-        
-            # Right Line R-curve
-            self.right_curverad_m = ((1 + (2*right_fit[0]*y_eval + right_fit[1])**2)**1.5) / np.absolute(2*right_fit[0])
-            self.units_m = "(p)"
-        elif(unit_type == "meters"):
-            # Calculates R-curve (radius of curvature)
-            # Left Line R-curve
-            self.left_curverad_m = ((1 + (2*left_fit_rw[0]*y_eval*self.ym_per_pix_m + left_fit_rw[1])**2)**1.5) / np.absolute(2*left_fit_rw[0])
-        
-            # Right Line R-curve
-            self.right_curverad_m = ((1 + (2*right_fit_rw[0]*y_eval*self.ym_per_pix_m + right_fit_rw[1])**2)**1.5) / np.absolute(2*right_fit_rw[0])
-            self.units_m = "(m)"
+        # Radius at the max y-value, corresponding to bottom of image
+        curvature = LaneFunctions.measure_radius_curvature(
+            ploty, left_fit, right_fit, unit_type, self.ym_per_pix_m, self.xm_per_pix_m
+        )
+        if unit_type in ("pixels", "meters"):
+            self.left_curverad_m, self.right_curverad_m, self.units_m = curvature
         
         # Returns radius of lane curvature
         return self.left_curverad_m, self.right_curverad_m, self.units_m
@@ -63,21 +51,12 @@ class LaneLineCurvature:
             Calculates angle of curvature in degrees by using radius of
             curvature computed in the measure_radius_curvature().
         """
-        # While calculating angle of curvature, choose conversion.
-        # If radius of curvature is inches units, then choose "inches to feet"
-        # If radius of curvature is meters units, then choose "staying in meters"
-        conversion = "staying in meters"
         self.curve_type_m = curve_type
         if curve_type == "arc":
-            if conversion == "inches to feet":
-                # (100ft/(2*(pi)*radius_curvature_inches))*(12inches/1ft)*360deg
-                self.l_angle_curve_m = (100/(2*(np.pi)*self.left_curverad_m))*12*360
-                self.r_angle_curve_m = (100/(2*(np.pi)*self.right_curverad_m))*12*360
-            elif conversion == "staying in meters":
-                # (100m/(2*(pi)*radius_curvature_meters))*360deg
-                self.l_angle_curve_m = (100/(2*(np.pi)*self.left_curverad_m))*360
-                self.r_angle_curve_m = (100/(2*(np.pi)*self.right_curverad_m))*360                
-            self.angle_units_m = "(deg)"
+            # (100m/(2*(pi)*radius_curvature_meters))*360deg
+            self.l_angle_curve_m, self.r_angle_curve_m, self.angle_units_m = LaneFunctions.measure_angle_curvature(
+                self.left_curverad_m, self.right_curverad_m, curve_type
+            )
         # Returns angle of lane curvature in degrees
         return self.l_angle_curve_m, self.r_angle_curve_m, self.angle_units_m    
 
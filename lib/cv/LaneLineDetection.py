@@ -4,6 +4,9 @@ import numpy as np
 import cv2
 import os
 
+from MomentPolyFitter import MomentPolyFitter
+import LaneFunctions
+
 # Prerequisite: Have applied camera calibration, thresholding and perspective
     # transform to a road image, results in a binary warped image where lane lines
     # stand out
@@ -38,6 +41,15 @@ class LaneLineDetection:
         # 200 pixels were used on the left and 900 on the right
         self.xm_per_pix_m = 3.7/700 # Meters per Pixel in x dimension        
         
+        # Polynomial fitting: "polyfit" or "moments", see setup_fitter()
+        self.fit_method_m = "polyfit"
+        self.fit_decay_m = None
+        self.fit_row_cap_m = None
+        self.left_fitter_m = None
+        self.right_fitter_m = None
+        # y values for plotting, kept while the image height doesn't change
+        self.ploty_m = None
+        
     # Histogram Peaks
         
     def histogram_peaks(self, binary_warped):
@@ -48,15 +60,16 @@ class LaneLineDetection:
             base of the lane lines. With this info, we can determine where the 
             lane lines are.
         """
-        # Grabs only the bottom half of the image
-        # Why? Lane lines are likely to be vertical nearest to the car
-        bottom_half = binary_warped[binary_warped.shape[0]//2:,:]
-        
-        # Histogram is the sum of pixel values along each column in the image
-        # i.e. the highest areas of vertical lines should be larger values
-        histogram = np.sum(bottom_half, axis = 0)
-        
-        return histogram
+        # Only the bottom half of the image is summed, lane lines are likely
+        # to be vertical nearest to the car
+        return LaneFunctions.histogram_peaks(binary_warped)
+    
+    def histogram_peaks_points(self, nonzeroy, nonzerox, img_shape):
+        """
+            Same histogram as histogram_peaks() built from the coordinates of
+            the nonzero pixels of a binary warped image of img_shape
+        """
+        return LaneFunctions.histogram_peaks_points(nonzeroy, nonzerox, img_shape)
     
     def visualize_hist(self, dst_title, histogram):
         """
@@ -87,9 +100,8 @@ class LaneLineDetection:
         """
         # Find the peak of the left and right halves of the histogram
         # These will be the starting point for the left and right lines
-        self.midpoint_m = np.int(histogram.shape[0]//2)
-        self.leftx_base_m = np.argmax(histogram[:self.midpoint_m])
-        self.rightx_base_m = np.argmax(histogram[self.midpoint_m:]) + self.midpoint_m
+        self.midpoint_m = int(histogram.shape[0]//2)
+        self.leftx_base_m, self.rightx_base_m = LaneFunctions.split_histogram(histogram)
         
     def get_xint_polynomials(self):
         """
@@ -110,16 +122,41 @@ class LaneLineDetection:
         # Set minimum number of pixels found to recenter window
         self.minpix_m = minpix
     
+    def find_nonzero(self, binary_warped):
+        """
+            Identify x and y positions of all nonzero (i.e. activated) pixels
+            in image, search_around_poly() needs them for each new frame
+        """
+        nonzero = binary_warped.nonzero()
+        self.set_nonzero(nonzero[0], nonzero[1])
+
+    def set_nonzero(self, nonzeroy, nonzerox):
+        """
+            Sets x and y positions of the activated pixels directly, e.g. from
+            a sparse bird's eye view
+        """
+        self.nonzeroy_m = np.array(nonzeroy)
+        self.nonzerox_m = np.array(nonzerox)
+
+    def get_lane_pixel_counts(self):
+        """
+            Returns number of pixels found for the left and right lane line
+        """
+        return len(self.leftx_m), len(self.rightx_m)
+
     def setup_sw(self, binary_warped):
         """
             Set up sliding windows
         """
+        self.find_nonzero(binary_warped)
+        self.setup_windows(binary_warped.shape)
+    
+    def setup_windows(self, img_shape):
+        """
+            Set up sliding windows once the nonzero pixels are known
+        """
         # Set height of windows - based on nwindows above and image shape
-        self.window_height_m = np.int(binary_warped.shape[0]//self.nwindows_m)
-        # Identify x and y positions of all nonzero (i.e. activated) pixels in image
-        nonzero = binary_warped.nonzero()
-        self.nonzeroy_m = np.array(nonzero[0])
-        self.nonzerox_m = np.array(nonzero[1])
+        self.window_height_m = int(img_shape[0]//self.nwindows_m)
         # Current positions to be updated later for each window in nwindows
         self.leftx_current_m = self.leftx_base_m
         self.rightx_current_m = self.rightx_base_m
@@ -136,58 +173,41 @@ class LaneLineDetection:
         """
         # Create a class member output image to draw on and visualize result
         out_img = np.dstack((binary_warped, binary_warped, binary_warped))
-        # Step through the windows one by one
-        for window in range(self.nwindows_m):
-            # Identify window boundaries in x and y (and right and left)
-            win_y_low = binary_warped.shape[0] - (window+1)*self.window_height_m
-            win_y_high = binary_warped.shape[0] - window*self.window_height_m
-            # Find the four below boundaries of the window
-            win_xleft_low = self.leftx_current_m - self.margin_m
-            win_xleft_high = self.leftx_current_m + self.margin_m
-            win_xright_low = self.rightx_current_m - self.margin_m
-            win_xright_high = self.rightx_current_m + self.margin_m
-            
-            # Draw the window boundaries on the visualization image
-            cv2.rectangle(out_img, (win_xleft_low, win_y_low), (win_xleft_high, win_y_high), (0, 255, 0), 2)
-            cv2.rectangle(out_img, (win_xright_low, win_y_low), (win_xright_high, win_y_high), (0, 255, 0), 2)
-            
-            # Identifies the nonzero pixels in x and y within the window
-            good_left_inds = ((self.nonzeroy_m >= win_y_low) & 
-                              (self.nonzeroy_m < win_y_high) & 
-                              (self.nonzerox_m >= win_xleft_low) & 
-                              (self.nonzerox_m < win_xleft_high)).nonzero()[0]
-            
-            good_right_inds = ((self.nonzeroy_m >= win_y_low) &
-                               (self.nonzeroy_m < win_y_high) &
-                               (self.nonzerox_m >= win_xright_low) &
-                               (self.nonzerox_m < win_xright_high)).nonzero()[0]
-    
-            # Append these indices to the lists
-            self.left_lane_inds_m.append(good_left_inds)
-            self.right_lane_inds_m.append(good_right_inds)
-            
-            # If the number of pixels found > minpix pixels, recenter next window
-            # `rightx_current` or `leftx_current` on their mean position
-            if len(good_left_inds) > self.minpix_m:
-                self.leftx_current_m = np.int(np.mean(self.nonzerox_m[good_left_inds]))
-            if len(good_right_inds) > self.minpix_m:
-                self.rightx_current_m = np.int(np.mean(self.nonzerox_m[good_right_inds]))
-         
-        # Concatenate arrays of indices (previously was a list of lists of pixels)
-        try:
-            self.left_lane_inds_m = np.concatenate(self.left_lane_inds_m)
-            self.right_lane_inds_m = np.concatenate(self.right_lane_inds_m)
-        except ValueError:
-            # Avoids error if the above isn't implemented fully
-            pass
-        
-        # Extract left and right line pixel positions
-        self.leftx_m = self.nonzerox_m[self.left_lane_inds_m]
-        self.lefty_m = self.nonzeroy_m[self.left_lane_inds_m]
-        self.rightx_m = self.nonzerox_m[self.right_lane_inds_m]
-        self.righty_m = self.nonzeroy_m[self.right_lane_inds_m]
-        
+        self.slide_windows(binary_warped.shape[0], out_img)
         return out_img
+    
+    def slide_windows(self, img_h, out_img = None):
+        """
+            Steps the windows up an image of height img_h, the window
+            boundaries are drawn on out_img when one is given
+        """
+        config = LaneFunctions.SlidingWindowConfig(self.nwindows_m, self.margin_m, self.minpix_m)
+        windows = LaneFunctions.sliding_window_search(
+            self.nonzeroy_m, self.nonzerox_m, img_h,
+            self.leftx_current_m, self.rightx_current_m, config
+        )
+        # Draw the window boundaries on the visualization image
+        if out_img is not None:
+            for window in range(self.nwindows_m):
+                win_y_low = img_h - (window+1)*self.window_height_m
+                win_y_high = img_h - window*self.window_height_m
+                leftx_current = int(windows.left_centers[window])
+                rightx_current = int(windows.right_centers[window])
+                cv2.rectangle(out_img, (leftx_current - self.margin_m, win_y_low), (leftx_current + self.margin_m, win_y_high), (0, 255, 0), 2)
+                cv2.rectangle(out_img, (rightx_current - self.margin_m, win_y_low), (rightx_current + self.margin_m, win_y_high), (0, 255, 0), 2)
+        self.set_lane_pixels(windows.lane_pixels)
+
+    def set_lane_pixels(self, lane_pixels):
+        """
+            Keeps the left and right line pixel positions (and their indices)
+            of a LaneFunctions.LanePixels record
+        """
+        self.left_lane_inds_m = lane_pixels.left_inds
+        self.right_lane_inds_m = lane_pixels.right_inds
+        self.leftx_m = lane_pixels.leftx
+        self.lefty_m = lane_pixels.lefty
+        self.rightx_m = lane_pixels.rightx
+        self.righty_m = lane_pixels.righty
 
     def find_lane_pixels(self, binary_warped, histogram):
         """
@@ -198,20 +218,64 @@ class LaneLineDetection:
         self.setup_sw(binary_warped)
         return self.track_curvature(binary_warped)
     
-    def fit_polynomial(self, binary_warped):
+    def find_lane_pixels_points(self, nonzeroy, nonzerox, img_shape, histogram):
+        """
+            Same as find_lane_pixels() from the coordinates of the nonzero
+            pixels of a binary warped image of img_shape, nothing is drawn
+        """
+        self.split_histogram(histogram)
+        self.set_nonzero(nonzeroy, nonzerox)
+        self.setup_windows(img_shape)
+        self.slide_windows(img_shape[0])
+    
+    def setup_fitter(self, fit_method, decay = None, row_cap = None):
+        """
+            Optional: Choose how polynomials are fit. "polyfit" uses np.polyfit,
+            "moments" uses a MomentPolyFitter per line, which can weight rows
+            (row_cap) and smooth fits over frames (decay)
+        """
+        self.fit_method_m = fit_method
+        self.fit_decay_m = decay
+        self.fit_row_cap_m = row_cap
+        self.left_fitter_m = None
+        self.right_fitter_m = None
+
+    def set_fitters(self, left_fitter, right_fitter):
+        """
+            Optional: Fit with MomentPolyFitters kept by the caller, so their
+            statistics carry over frames fit by other LaneLineDetections
+        """
+        self.left_fitter_m = left_fitter
+        self.right_fitter_m = right_fitter
+    
+    def fit_polynomial(self, binary_warped, final = True):
         """
-            Fits a polynomial to each lane line
+            Fits a polynomial to each lane line. final tells the pixels are
+            the frame's final selection, which the moment fitters accumulate
+            for later frames.
         """
+        img_h = binary_warped.shape[0]
         # Find our lane pixels
-        # Fit a second order polynomial to each line using `np.polyfit`
-        self.left_fit_m = np.polyfit(self.lefty_m, self.leftx_m, 2)
-        self.right_fit_m = np.polyfit(self.righty_m, self.rightx_m, 2)
+        if self.fit_method_m == "moments":
+            # Fit a second order polynomial to each line from its moments
+            if self.left_fitter_m is None or self.left_fitter_m.img_h_m != img_h:
+                self.left_fitter_m = MomentPolyFitter(img_h, self.fit_decay_m, self.fit_row_cap_m)
+                self.right_fitter_m = MomentPolyFitter(img_h, self.fit_decay_m, self.fit_row_cap_m)
+            self.left_fit_m = self.left_fitter_m.fit(self.lefty_m, self.leftx_m, final)
+            self.right_fit_m = self.right_fitter_m.fit(self.righty_m, self.rightx_m, final)
+        else:
+            # Fit a second order polynomial to each line using `np.polyfit`
+            lane_pixels = LaneFunctions.LanePixels(self.leftx_m, self.lefty_m, self.rightx_m, self.righty_m, None, None)
+            lane_fit = LaneFunctions.fit_lane_polynomials(lane_pixels, img_h)
+            self.left_fit_m = lane_fit.left_fit
+            self.right_fit_m = lane_fit.right_fit
         
         # Generate x and y values for plotting
-        self.ploty_m = np.linspace(0, binary_warped.shape[0]-1, binary_warped.shape[0])
+        if self.ploty_m is None or len(self.ploty_m) != img_h:
+            self.ploty_m = np.linspace(0, img_h-1, img_h)
         try:
-            left_fitx = self.left_fit_m[0]*self.ploty_m**2 + self.left_fit_m[1]*self.ploty_m + self.left_fit_m[2]
-            right_fitx = self.right_fit_m[0]*self.ploty_m**2 + self.right_fit_m[1]*self.ploty_m + self.right_fit_m[2]
+            left_fitx = np.polyval(self.left_fit_m, self.ploty_m)
+            right_fitx = np.polyval(self.right_fit_m, self.ploty_m)
         except TypeError:
             # Avoids an error if `left_fit` and `right_fit` 
             # are still none or incorrect
@@ -252,35 +316,23 @@ class LaneLineDetection:
         """
             Uses polynomial left_fit and right_fit values from the previous frame
         """
-        # Set the area of search based on activated x-values within the
-        # +/- margin of our polynomial function
-        self.left_lane_inds_m = ((self.nonzerox_m > 
-                           (self.left_fit_m[0]*(self.nonzeroy_m**2) +
-                            self.left_fit_m[1]*self.nonzeroy_m +
-                            self.left_fit_m[2] - self.margin_m)) & 
-                          (self.nonzerox_m < 
-                           (self.left_fit_m[0]*(self.nonzeroy_m**2) +
-                            self.left_fit_m[1]*self.nonzeroy_m +
-                            self.left_fit_m[2] + self.margin_m)))
-        
-        self.right_lane_inds_m = ((self.nonzerox_m >
-                            (self.right_fit_m[0]*(self.nonzeroy_m**2) +
-                             self.right_fit_m[1]*self.nonzeroy_m +
-                             self.right_fit_m[2] - self.margin_m)) &
-                           (self.nonzerox_m < 
-                            (self.right_fit_m[0]*(self.nonzeroy_m**2) +
-                             self.right_fit_m[1]*self.nonzeroy_m +
-                             self.right_fit_m[2] + self.margin_m)))
-        
-        # Again, extract left and right line pixel positions
-        self.leftx_m = self.nonzerox_m[self.left_lane_inds_m]
-        self.lefty_m = self.nonzeroy_m[self.left_lane_inds_m]
-        self.rightx_m = self.nonzerox_m[self.right_lane_inds_m]
-        self.righty_m = self.nonzeroy_m[self.right_lane_inds_m]
+        self.select_around_poly()
         
         # Fit new polynomials
         left_fitx, right_fitx = self.fit_polynomial(binary_warped)
         return left_fitx, right_fitx
+    
+    def select_around_poly(self):
+        """
+            Selects the lane pixels within +/- margin of the previous polynomials
+            without fitting new ones, so the caller can check enough pixels were
+            found first
+        """
+        # Set the area of search based on activated x-values within the
+        # +/- margin of our polynomial function
+        self.set_lane_pixels(LaneFunctions.search_around_poly(
+            self.nonzeroy_m, self.nonzerox_m, self.left_fit_m, self.right_fit_m, self.margin_m
+        ))
         
     def visualize_sap(self, binary_warped, left_fitx, right_fitx):
         """
@@ -0,0 +1,1039 @@
+import numpy as np
+import time
+import cv2
+
+from GradientThresholds import GradientThresholds
+from ColorThresholds import ColorThresholds
+from CameraPerspective import CameraPerspective
+from CameraRemap import CameraRemap
+from StripeThresholds import StripeThresholds
+from CorridorThresholds import CorridorThresholds
+from LaneLineDetection import LaneLineDetection
+from MomentPolyFitter import MomentPolyFitter
+from LaneLineCurvature import LaneLineCurvature
+from LaneVehiclePosition import LaneVehiclePosition
+from LaneBoundaries import LaneBoundaries
+import LaneFunctions
+from SceneChangeDetector import SceneChangeDetector
+
+# LanePipeline runs the full lane finding flow on a single frame:
+# Distortion Correction, Color & Gradient Thresholding, Bird's Eye View,
+# Lane Line Detection, Lane Curvature, Vehicle Position and Lane Boundaries.
+# It holds the pipeline parameters, so one configured instance can be handed
+# to another process and reproduce the same result as run_pipeline(frame)
+
+# Parameters the state kept from previous frames depends on, set_params()
+# drops that state when one of them is set
+CORRIDOR_PARAMS = (
+    "corridor_thresholds", "corridor_band", "corridor_refresh",
+    "sobel_orient", "sobel_kernel", "mag_kernel", "fast_gradients",
+    "detect_scale", "warp_first", "perspective_src", "perspective_dst",
+)
+STATIC_SCENE_PARAMS = (
+    "skip_static", "static_threshold", "static_max_reuse",
+    "perspective_src", "perspective_dst", "unit_type", "curve_type",
+)
+OUTPUT_AGE_PARAMS = (
+    "curvature_interval", "overlay_interval",
+    "perspective_src", "perspective_dst", "unit_type", "curve_type",
+)
+
+class LanePipeline:
+    def __init__(self, calibrate_cam, mtx, dist_coeff, **params):
+        """
+            Takes a CameraCalibration instance with its computed camera
+            calibration matrix and distortion coefficients. Any pipeline
+            parameter (thresholds, kernels, combination codes, sliding window
+            hyperparameters, text properties) can be overridden by keyword
+        """
+        self.calibrate_cam_m = calibrate_cam
+        self.mtx_m = mtx
+        self.dist_coeff_m = dist_coeff
+
+        # Pipeline parameters, defaults are the values tuned on project_video
+        self.params_m = {
+            # Gradient Thresholding
+            "sobel_orient": 'x',
+            "sobel_kernel": (7, 7),
+            "sobel_thresh": (30, 100),
+            "mag_kernel": 5,
+            "mag_thresh": (36, 100),
+            "dir_kernel": 3,
+            "dir_thresh": (0.3, 1.3),
+            "grad_code": 2,
+            # Same magnitude and direction masks with integer Sobel and
+            # comparisons instead of sqrt/arctan2 over float64 images
+            "fast_gradients": False,
+            # Threshold horizontal stripes of the frame on this many threads
+            # (1 is off), stripes default to one per thread
+            "threshold_threads": 1,
+            "threshold_stripes": None,
+            # While tracking, threshold only within corridor_margin (defaults
+            # to margin) of the tracked lane lines, projected to the frame,
+            # in bands of corridor_band rows. The whole frame is thresholded
+            # again when the lane lines are lost in the corridor and every
+            # corridor_refresh frames.
+            "corridor_thresholds": False,
+            "corridor_margin": None,
+            "corridor_band": 16,
+            "corridor_refresh": 30,
+            # RGB Thresholding: for identifying white lane line pixels
+            "r_thresh": (130, 255),
+            "g_thresh": (130, 255),
+            "b_thresh": (195, 255),
+            "rgb_code": 3,
+            # HLS Thresholding: for identifying yellow lane line pixels
+            "h_thresh": (20, 90),
+            "l_thresh": (120, 200),
+            "s_thresh": (100, 255),
+            "hls_code": 3,
+            # Bird's Eye View source and destination points as ratios of the
+            # image size, None uses the CameraPerspective defaults
+            "perspective_src": None,
+            "perspective_dst": None,
+            # Sliding Window Hyperparameters
+            "nwindows": 9,
+            "margin": 100,
+            "minpix": 50,
+            # Polynomial fitting: "polyfit" or "moments", the moment fitter can
+            # cap pixels counted per row and decay statistics across frames
+            "fit_method": "polyfit",
+            "fit_row_cap": None,
+            "fit_decay": None,
+            # Keep lane lines across frames and Search from Prior while the
+            # previous polynomials still find enough pixels
+            "track": False,
+            # Quality settings a real-time controller can lower:
+            # Search from Prior only, never redo the Sliding Windows Search
+            "prior_search_only": False,
+            # Threshold a frame downscaled by this integer factor
+            "threshold_decimation": 1,
+            # Draw lane boundaries and text, else return the undistorted frame
+            "render_overlay": True,
+            # Threshold, warp and search lane lines on the frame downscaled by
+            # this fraction, fits are scaled back to full resolution
+            "detect_scale": 1.0,
+            # Go from the raw frame straight to the bird's eye view with one
+            # composite remap and threshold there, the undistorted frame is
+            # only produced for the overlay
+            "warp_first": False,
+            # Transform only the nonzero pixel coordinates of the thresholded
+            # frame to the bird's eye view instead of warping the dense image
+            "sparse_warp": False,
+            # Fill the lane polygon projected to image space in place, instead
+            # of warping a full frame overlay back with Minv
+            "direct_overlay": False,
+            # Reuse the lane metrics of the last processed frame while frames
+            # stay static (largest block difference of their downsampled gray
+            # signatures under static_threshold gray levels), for at most
+            # static_max_reuse frames in a row. With static_reuse_overlay the
+            # lane polygon last warped back to the image is blended onto the
+            # new frame as is, else the reused lane is drawn again
+            "skip_static": False,
+            "static_threshold": 3.0,
+            "static_max_reuse": 30,
+            "static_reuse_overlay": False,
+            # Multi-rate outputs: Vehicle Position is measured on every frame,
+            # Lane Curvature (radius and angle) every curvature_interval
+            # frames and the overlay drawn every overlay_interval frames. In
+            # between, the last values are carried forward and the last lane
+            # overlay is blended onto the new frames, get_output_ages() tells
+            # how many frames old they are.
+            "curvature_interval": 1,
+            "overlay_interval": 1,
+            # Lane Curvature and Vehicle Position
+            "unit_type": "meters",
+            "curve_type": "arc",
+            # Image text properties
+            "font_family": cv2.FONT_HERSHEY_SIMPLEX,
+            "font_color": (255, 255, 255),
+            "font_size": 1.6,
+            "font_thickness": 3,
+            "line_type": cv2.LINE_AA,
+        }
+        self.params_m.update(params)
+
+        # Lane metrics of the most recent frame
+        self.lane_metrics_m = None
+
+        # Tracker state: lane line detection kept from the previous frame
+        self.find_lane_lines_m = None
+        # Moment fitters of the left and right lines, kept across frames and
+        # searches so fit_decay smooths over frames, made on first use
+        self.lane_fitters_m = None
+
+        # Bird's Eye View with its transforms cached per frame size and the
+        # composite undistort and bird's eye view remap tables, built on first
+        # use by the warp_first mode
+        self.cam_view_m = None
+        self.camera_remap_m = None
+
+        # Seconds spent per stage on the most recent frame and the lane line
+        # detection method that ran: "search", "prior", "reuse" or "static"
+        self.stage_times_m = {}
+        self.detect_method_m = None
+
+        # Thread pool thresholding stripes of a frame, made on first use
+        self.stripe_thresholds_m = None
+        # Thresholding inside the tracked lane corridor, made on first use
+        self.corridor_thresholds_m = None
+
+        # Optional StageCache memoizing stage outputs, see set_stage_cache()
+        self.stage_cache_m = None
+
+        # Static scene skipping: change detector made on first use and what
+        # the last processed frame's overlay was drawn from
+        self.scene_detector_m = None
+        self.static_overlay_m = None
+
+        # Lane layer of the last overlay drawn, with the lane metrics of its
+        # text and the frame shape, see overlay_lane()
+        self.overlay_layer_m = None
+
+        # Multi-rate outputs: frames since each output was last computed
+        self.output_ages_m = None
+
+    def set_params(self, **params):
+        """
+            Overrides pipeline parameters after construction
+        """
+        # Tracked polynomials are in detection pixels, which a new scale changes
+        if params.get("detect_scale", self.params_m["detect_scale"]) != self.params_m["detect_scale"]:
+            self.reset_tracker()
+        if "perspective_src" in params or "perspective_dst" in params:
+            self.cam_view_m = None
+            self.camera_remap_m = None
+        if "threshold_threads" in params or "threshold_stripes" in params:
+            self.close()
+        if "fit_method" in params or "fit_decay" in params or "fit_row_cap" in params:
+            self.lane_fitters_m = None
+        # The corridor's gradient scale comes from frames thresholded before,
+        # with the same gradients on the same view
+        if any(name in params for name in CORRIDOR_PARAMS):
+            self.corridor_thresholds_m = None
+        # Static frames reuse the lane metrics and Minv of the last processed
+        # frame, which no longer hold
+        if any(name in params for name in STATIC_SCENE_PARAMS):
+            self.scene_detector_m = None
+        # Carried forward outputs are measured and drawn the old way
+        if any(name in params for name in OUTPUT_AGE_PARAMS):
+            self.output_ages_m = None
+        elif "render_overlay" in params and self.output_ages_m is not None:
+            # Frames rendered without overlay don't age the last one, draw it
+            # again when rendering comes back
+            self.output_ages_m["overlay"] = None
+        self.params_m.update(params)
+
+    def get_params(self):
+        """
+            Returns a copy of the pipeline parameters
+        """
+        return dict(self.params_m)
+
+    def correct_distortion(self, frame):
+        """
+            Apply Distortion Correction to a raw lane line frame
+        """
+        # CameraCalibration keeps the frame it corrects, call the function so
+        # threads sharing the pipeline do not swap frames
+        return LaneFunctions.undistort(frame, self.mtx_m, self.dist_coeff_m)
+
+    def apply_gradient_thresholds(self, undist_frame):
+        """
+            Combined Gradient Thresholding (Sobel-X, Gradient Magnitude,
+            Gradient Direction)
+        """
+        p = self.params_m
+        gradient_cam = GradientThresholds()
+        sx_binary_frame = gradient_cam.apply_sobel_thresh(
+            undist_frame, p["sobel_orient"], p["sobel_kernel"], p["sobel_thresh"]
+        )
+        if p["fast_gradients"]:
+            grad_mag_binary_frame = gradient_cam.apply_grad_mag_thresh_fast(
+                undist_frame, p["mag_kernel"], p["mag_thresh"]
+            )
+            grad_dir_binary_frame = gradient_cam.apply_grad_dir_thresh_fast(
+                undist_frame, p["dir_kernel"], p["dir_thresh"]
+            )
+        else:
+            grad_mag_binary_frame = gradient_cam.apply_grad_mag_thresh(
+                undist_frame, p["mag_kernel"], p["mag_thresh"]
+            )
+            grad_dir_binary_frame = gradient_cam.apply_grad_dir_thresh(
+                undist_frame, p["dir_kernel"], p["dir_thresh"]
+            )
+        return gradient_cam.apply_combined_thresh(
+            p["grad_code"], grad_x = sx_binary_frame,
+            grad_mag = grad_mag_binary_frame, grad_dir = grad_dir_binary_frame
+        )
+
+    def apply_color_thresholds(self, undist_frame):
+        """
+            Combined RGB (white lane line pixels) or HLS (yellow lane line
+            pixels) Color Thresholding
+        """
+        comb_rgb_binary_frame = self.apply_rgb_thresholds(undist_frame)
+        comb_hls_binary_frame = self.apply_hls_thresholds(undist_frame)
+        # Combine RGB and HLS binary thresholds
+        comb_rgb_hls_binary_frame = np.zeros_like(comb_hls_binary_frame)
+        comb_rgb_hls_binary_frame[ (comb_hls_binary_frame == 1) |
+                                   (comb_rgb_binary_frame == 1) ] = 1
+        return comb_rgb_hls_binary_frame
+
+    def apply_rgb_thresholds(self, undist_frame):
+        """
+            Combined RGB Color Thresholding
+        """
+        p = self.params_m
+        color_cam = ColorThresholds()
+        red_binary_frame = color_cam.apply_r_thresh(undist_frame, p["r_thresh"])
+        green_binary_frame = color_cam.apply_g_thresh(undist_frame, p["g_thresh"])
+        blue_binary_frame = color_cam.apply_b_thresh(undist_frame, p["b_thresh"])
+        comb_rgb_binary_frame = color_cam.apply_rgb_thresh(
+            p["rgb_code"], rgb_r = red_binary_frame, rgb_g = green_binary_frame,
+            rgb_b = blue_binary_frame
+        )
+        return comb_rgb_binary_frame
+
+    def apply_hls_thresholds(self, undist_frame):
+        """
+            Combined HLS Color Thresholding
+        """
+        p = self.params_m
+        color_cam = ColorThresholds()
+        hue_binary_frame = color_cam.apply_h_thresh(undist_frame, p["h_thresh"])
+        light_binary_frame = color_cam.apply_l_thresh(undist_frame, p["l_thresh"])
+        sat_binary_frame = color_cam.apply_s_thresh(undist_frame, p["s_thresh"])
+        comb_hls_binary_frame = color_cam.apply_hls_thresh(
+            p["hls_code"], hls_h = hue_binary_frame, hls_l = light_binary_frame,
+            hls_s = sat_binary_frame
+        )
+        return comb_hls_binary_frame
+
+    def apply_thresholds(self, undist_frame, frame_key = None):
+        """
+            Combine the Combined Gradient and RGB-HLS Threshold. With
+            threshold_decimation > 1, thresholds are applied to a downscaled
+            frame and the binary frame is scaled back up. frame_key is the
+            stage cache key of undist_frame, if already known.
+        """
+        decimation = self.params_m["threshold_decimation"]
+        if decimation > 1:
+            if frame_key is not None:
+                frame_key = self.stage_cache_m.make_key(
+                    "decimate", frame_key, {"threshold_decimation": decimation}
+                )
+            img_h, img_w = undist_frame.shape[0], undist_frame.shape[1]
+            small_frame = cv2.resize(
+                undist_frame, (img_w//decimation, img_h//decimation),
+                interpolation=cv2.INTER_AREA
+            )
+            small_binary = self.combine_thresholds(small_frame, frame_key)
+            return cv2.resize(small_binary, (img_w, img_h),
+                              interpolation=cv2.INTER_NEAREST)
+        return self.combine_thresholds(undist_frame, frame_key)
+
+    def combine_thresholds(self, undist_frame, frame_key = None):
+        """
+            Combine the Combined Gradient and RGB-HLS Threshold at the frame's
+            own resolution
+        """
+        if self.stage_cache_m is not None:
+            return self.combine_thresholds_cached(undist_frame, frame_key)
+        if self.params_m["threshold_threads"] > 1:
+            return self.get_stripe_thresholds().combine_thresholds(self, undist_frame)
+        comb_grad_binary_frame = self.apply_gradient_thresholds(undist_frame)
+        comb_rgb_hls_binary_frame = self.apply_color_thresholds(undist_frame)
+        combined_binary = np.zeros_like(comb_grad_binary_frame)
+        combined_binary[ (comb_grad_binary_frame == 1) |
+                         (comb_rgb_hls_binary_frame == 1) ] = 1
+        return combined_binary
+
+    def set_stage_cache(self, stage_cache):
+        """
+            Memoizes Distortion Correction and the expensive parts of Color &
+            Gradient Thresholding in a StageCache (None turns it off). Meant
+            for tuning parameters over the same frames, stripe thresholding is
+            not used while a cache is set.
+        """
+        self.stage_cache_m = stage_cache
+
+    def cached(self, stage, input_key, param_names, compute, extra_params = None):
+        """
+            Returns (output, key) of a stage from the stage cache, keyed by
+            input_key and the pipeline parameters in param_names
+        """
+        params = {name: self.params_m[name] for name in param_names}
+        if extra_params is not None:
+            params.update(extra_params)
+        return self.stage_cache_m.get_or_compute(stage, input_key, params, compute)
+
+    def combine_thresholds_cached(self, undist_frame, frame_key = None):
+        """
+            combine_thresholds() with Sobel-X and Gradient Magnitude before
+            scaling, the Gradient Direction, RGB and HLS binaries taken from
+            the stage cache
+        """
+        p = self.params_m
+        if frame_key is None:
+            frame_key = self.stage_cache_m.frame_key(undist_frame)
+        gradient_cam = GradientThresholds()
+        abs_sobel = self.cached(
+            "sobel_abs", frame_key, ("sobel_orient", "sobel_kernel"),
+            lambda: gradient_cam.sobel_abs(undist_frame, p["sobel_orient"], p["sobel_kernel"])
+        )[0]
+        sx_binary_frame = gradient_cam.scale_sobel_thresh(
+            abs_sobel, np.max(abs_sobel), p["sobel_thresh"]
+        )
+        if p["fast_gradients"]:
+            grad_mag2 = self.cached(
+                "grad_mag2", frame_key, ("mag_kernel",),
+                lambda: gradient_cam.grad_mag2(undist_frame, p["mag_kernel"])
+            )[0]
+            grad_mag_binary_frame = gradient_cam.grad_mag2_thresh(
+                grad_mag2, int(grad_mag2.max()), p["mag_thresh"]
+            )
+            grad_dir_binary_frame = self.cached(
+                "grad_dir_fast", frame_key, ("dir_kernel", "dir_thresh"),
+                lambda: gradient_cam.apply_grad_dir_thresh_fast(
+                    undist_frame, p["dir_kernel"], p["dir_thresh"]
+                )
+            )[0]
+        else:
+            grad_mag = self.cached(
+                "grad_mag", frame_key, ("mag_kernel",),
+                lambda: gradient_cam.grad_mag(undist_frame, p["mag_kernel"])
+            )[0]
+            grad_mag_binary_frame = gradient_cam.scale_grad_mag_thresh(
+                grad_mag, np.max(grad_mag), p["mag_thresh"]
+            )
+            grad_dir_binary_frame = self.cached(
+                "grad_dir", frame_key, ("dir_kernel", "dir_thresh"),
+                lambda: gradient_cam.apply_grad_dir_thresh(
+                    undist_frame, p["dir_kernel"], p["dir_thresh"]
+                )
+            )[0]
+        comb_grad_binary_frame = gradient_cam.apply_combined_thresh(
+            p["grad_code"], grad_x = sx_binary_frame,
+            grad_mag = grad_mag_binary_frame, grad_dir = grad_dir_binary_frame
+        )
+        comb_rgb_binary_frame = self.cached(
+            "rgb", frame_key, ("r_thresh", "g_thresh", "b_thresh", "rgb_code"),
+            lambda: self.apply_rgb_thresholds(undist_frame)
+        )[0]
+        comb_hls_binary_frame = self.cached(
+            "hls", frame_key, ("h_thresh", "l_thresh", "s_thresh", "hls_code"),
+            lambda: self.apply_hls_thresholds(undist_frame)
+        )[0]
+        combined_binary = np.zeros_like(comb_grad_binary_frame)
+        combined_binary[ (comb_grad_binary_frame == 1) |
+                         (comb_hls_binary_frame == 1) |
+                         (comb_rgb_binary_frame == 1) ] = 1
+        return combined_binary
+
+    def detect_lane_lines(self, lane_b_e_view, lane_points = None, search = True):
+        """
+            Histogram Peaks, Sliding Windows Search, then Search from Prior
+            Returns ploty, left_fit and right_fit. lane_points are the
+            (nonzeroy, nonzerox) of the warped binary frame when it was warped
+            sparsely, lane_b_e_view then only gives the frame shape. Without
+            search, returns None instead of searching when the tracker lost
+            the lane lines.
+        """
+        p = self.params_m
+        if p["track"] and self.find_lane_lines_m is not None:
+            # Search from Prior using last frame polynomials, unless the
+            # tracker lost the lane lines
+            find_lane_lines = self.find_lane_lines_m
+            if lane_points is None:
+                find_lane_lines.find_nonzero(lane_b_e_view)
+            else:
+                find_lane_lines.set_nonzero(*lane_points)
+            find_lane_lines.select_around_poly()
+            left_count, right_count = find_lane_lines.get_lane_pixel_counts()
+            minpix = p["minpix"]*p["detect_scale"]*p["detect_scale"]
+            if left_count > minpix and right_count > minpix:
+                self.setup_fitter(find_lane_lines, lane_b_e_view.shape[0])
+                find_lane_lines.fit_polynomial(lane_b_e_view)
+                self.detect_method_m = "prior"
+                return find_lane_lines.get_fit_polynomial_data()
+            if p["prior_search_only"]:
+                # Keep last frame polynomials rather than pay for a search
+                self.detect_method_m = "reuse"
+                return find_lane_lines.get_fit_polynomial_data()
+        if not search:
+            return None
+        # Window margin is a width and minpix an area in detection pixels
+        scale = p["detect_scale"]
+        find_lane_lines = LaneLineDetection()
+        find_lane_lines.setup_sw_hyperparameters(
+            p["nwindows"], int(round(p["margin"]*scale)),
+            int(round(p["minpix"]*scale*scale))
+        )
+        self.setup_fitter(find_lane_lines, lane_b_e_view.shape[0])
+        if lane_points is None:
+            histo = find_lane_lines.histogram_peaks(lane_b_e_view)
+            find_lane_lines.find_lane_pixels(lane_b_e_view, histo)
+        else:
+            histo = find_lane_lines.histogram_peaks_points(
+                lane_points[0], lane_points[1], lane_b_e_view.shape
+            )
+            find_lane_lines.find_lane_pixels_points(
+                lane_points[0], lane_points[1], lane_b_e_view.shape, histo
+            )
+        # The sliding windows' fit only selects the pixels around it, the
+        # fit of those is the frame's
+        find_lane_lines.fit_polynomial(lane_b_e_view, False)
+        find_lane_lines.search_around_poly(lane_b_e_view)
+        if p["track"]:
+            self.find_lane_lines_m = find_lane_lines
+        self.detect_method_m = "search"
+        return find_lane_lines.get_fit_polynomial_data()
+
+    def setup_fitter(self, find_lane_lines, img_h):
+        """
+            Sets the fit method of a lane line detection, with the pipeline's
+            moment fitters for binary warped frames of height img_h
+        """
+        p = self.params_m
+        find_lane_lines.setup_fitter(p["fit_method"], p["fit_decay"], p["fit_row_cap"])
+        if p["fit_method"] != "moments":
+            return
+        if self.lane_fitters_m is None or self.lane_fitters_m[0].img_h_m != img_h:
+            self.lane_fitters_m = (
+                MomentPolyFitter(img_h, p["fit_decay"], p["fit_row_cap"]),
+                MomentPolyFitter(img_h, p["fit_decay"], p["fit_row_cap"]),
+            )
+        find_lane_lines.set_fitters(*self.lane_fitters_m)
+
+    def rescale_fits(self, left_fit, right_fit, detect_shape, full_shape):
+        """
+            Scales polynomials x = A*y**2 + B*y + C fit in detection pixels to
+            full resolution pixels. Returns ploty for full resolution and the
+            scaled left_fit and right_fit.
+        """
+        return LaneFunctions.scale_lane_fit(
+            LaneFunctions.LaneFit(None, left_fit, right_fit), detect_shape, full_shape
+        )
+
+    def reset_tracker(self):
+        """
+            Forgets the lane lines of previous frames, the next frame starts
+            again with Histogram Peaks and Sliding Windows Search
+        """
+        self.find_lane_lines_m = None
+        self.lane_fitters_m = None
+        # Carried forward outputs belong to the lane lines just forgotten
+        self.output_ages_m = None
+
+    def measure_lane(self, lane_b_e_view, ploty, left_fit, right_fit):
+        """
+            Measures Lane Curvature (radius and angle) and Vehicle Position
+            with respect to lane center, returns them as a lane metrics dict
+        """
+        p = self.params_m
+        # 30 m by 3.7 m of road span 720 by 700 pixels of a 1280x720 view
+        ym_per_pix = (30/720)*(720/lane_b_e_view.shape[0])
+        xm_per_pix = (3.7/700)*(1280/lane_b_e_view.shape[1])
+        calc_lane_curve = LaneLineCurvature()
+        calc_lane_curve.set_meters_per_pixel(ym_per_pix, xm_per_pix)
+        left_curverad, right_curverad, curverad_units = calc_lane_curve.measure_radius_curvature(
+            ploty, left_fit, right_fit, p["unit_type"]
+        )
+        l_angle_curve, r_angle_curve, angle_units = calc_lane_curve.measure_angle_curvature(
+            p["curve_type"]
+        )
+        lane_vehicle = LaneVehiclePosition()
+        lane_vehicle.set_meters_per_pixel(ym_per_pix, xm_per_pix)
+        dist_center, position_units, side_center = lane_vehicle.measure_vehicle_position(
+            lane_b_e_view, left_fit, right_fit, p["unit_type"]
+        )
+        return {
+            "left_fit": left_fit, "right_fit": right_fit,
+            "left_curverad": left_curverad, "right_curverad": right_curverad,
+            "curverad_units": curverad_units,
+            "l_angle_curve": l_angle_curve, "r_angle_curve": r_angle_curve,
+            "angle_units": angle_units,
+            "dist_center": dist_center, "position_units": position_units,
+            "side_center": side_center,
+        }
+
+    def measure_lane_scheduled(self, lane_b_e_view, ploty, left_fit, right_fit):
+        """
+            Lane metrics of the current frame at each output's rate: fits and
+            Vehicle Position always, Lane Curvature when due, else carried
+            forward from the frame it was last measured on
+        """
+        p = self.params_m
+        ages = self.output_ages_m
+        if ages is None:
+            ages = {"position": 0, "curvature": None, "overlay": None}
+            self.output_ages_m = ages
+        if ages["curvature"] is None or ages["curvature"] + 1 >= p["curvature_interval"]:
+            ages["position"] = 0
+            ages["curvature"] = 0
+            return self.measure_lane(lane_b_e_view, ploty, left_fit, right_fit)
+        # Only the fits at the bottom row are needed for the position
+        xm_per_pix = (3.7/700)*(1280/lane_b_e_view.shape[1])
+        lane_vehicle = LaneVehiclePosition()
+        lane_vehicle.set_meters_per_pixel((30/720)*(720/lane_b_e_view.shape[0]), xm_per_pix)
+        dist_center, position_units, side_center = lane_vehicle.measure_vehicle_position(
+            lane_b_e_view, left_fit, right_fit, p["unit_type"]
+        )
+        lane_metrics = dict(self.lane_metrics_m)
+        lane_metrics.update({
+            "left_fit": left_fit, "right_fit": right_fit,
+            "dist_center": dist_center, "position_units": position_units,
+            "side_center": side_center,
+        })
+        ages["position"] = 0
+        ages["curvature"] += 1
+        return lane_metrics
+
+    def age_outputs(self, outputs):
+        """
+            Counts one more frame on outputs carried forward
+        """
+        if self.output_ages_m is None:
+            return
+        for output in outputs:
+            if self.output_ages_m[output] is not None:
+                self.output_ages_m[output] += 1
+
+    def get_output_ages(self):
+        """
+            Returns frames since Vehicle Position, Lane Curvature and the
+            overlay were last computed (0 is the most recent frame, None
+            never), None before the first frame
+        """
+        if self.output_ages_m is None:
+            return None
+        return dict(self.output_ages_m)
+
+    def overlay_lane(self, undist_frame, lane_b_e_view, ploty, Minv, lane_metrics, lane_layer = None):
+        """
+            Overlay Lane Boundaries, Lane Curvature and Vehicle Position onto
+            the undistorted frame. A lane_layer from an earlier overlay is
+            blended as is instead of drawing and warping back the lane
+            polygon, lane_b_e_view, ploty and Minv are not used then.
+        """
+        p = self.params_m
+        lane_boundary = LaneBoundaries()
+        lane_boundary.set_original_undist_img(undist_frame)
+        if lane_layer is not None:
+            # undist_frame is this frame's own copy, as for direct_overlay
+            if not p["direct_overlay"]:
+                undist_frame = undist_frame.copy()
+            lane_boundary.set_overlayed_lane_boundary(undist_frame)
+            lane_boundary.overlay_lane_layer(lane_layer)
+        else:
+            lane_boundary.set_warped_binary_img(lane_b_e_view)
+            lane_boundary.set_fit_lines_poly(
+                ploty, lane_metrics["left_fit"], lane_metrics["right_fit"]
+            )
+            lane_boundary.set_minv(Minv)
+            if p["direct_overlay"]:
+                # undist_frame is this frame's own copy, so it can be drawn on
+                lane_boundary.overlay_lane_boundaries_direct(in_place = True)
+            else:
+                # The full frame lane layer is only copied out to be blended
+                # again onto later frames
+                lane_boundary.overlay_lane_boundaries(
+                    p["static_reuse_overlay"] or p["overlay_interval"] > 1
+                )
+            lane_layer = lane_boundary.get_lane_layer()
+        # Kept to blend again onto later frames, with the metrics of its text
+        self.overlay_layer_m = (lane_layer, lane_metrics, undist_frame.shape)
+        lane_boundary.set_img_text_properties(
+            p["font_family"], p["font_color"], p["font_size"],
+            p["font_thickness"], p["line_type"]
+        )
+        lane_boundary.set_lane_curvature_radius(
+            lane_metrics["left_curverad"], lane_metrics["right_curverad"],
+            lane_metrics["curverad_units"]
+        )
+        lane_boundary.overlay_radius_curvature()
+        lane_boundary.set_lane_curvature_angle(
+            lane_metrics["l_angle_curve"], lane_metrics["r_angle_curve"],
+            lane_metrics["angle_units"]
+        )
+        lane_boundary.overlay_angle_curvature()
+        lane_boundary.set_vehicle_position(
+            lane_metrics["dist_center"], lane_metrics["position_units"],
+            lane_metrics["side_center"]
+        )
+        lane_boundary.overlay_vehicle_position()
+        return lane_boundary.get_overlayed_image()
+
+    def get_cam_view(self):
+        """
+            Returns the Bird's Eye View perspective, creating it on first use
+        """
+        if self.cam_view_m is None:
+            self.cam_view_m = CameraPerspective(
+                self.params_m["perspective_src"], self.params_m["perspective_dst"]
+            )
+        return self.cam_view_m
+
+    def get_camera_remap(self):
+        """
+            Returns the composite undistort and bird's eye view remap, creating
+            it on first use
+        """
+        if self.camera_remap_m is None:
+            self.camera_remap_m = CameraRemap(
+                self.mtx_m, self.dist_coeff_m, self.get_cam_view()
+            )
+        return self.camera_remap_m
+
+    def get_stripe_thresholds(self):
+        """
+            Returns the stripe thresholding thread pool, creating it on first
+            use
+        """
+        if self.stripe_thresholds_m is None:
+            self.stripe_thresholds_m = StripeThresholds(
+                self.params_m["threshold_threads"], self.params_m["threshold_stripes"]
+            )
+        return self.stripe_thresholds_m
+
+    def get_corridor_thresholds(self):
+        """
+            Returns the corridor thresholding, creating it on first use
+        """
+        if self.corridor_thresholds_m is None:
+            self.corridor_thresholds_m = CorridorThresholds(
+                self.params_m["corridor_band"], self.params_m["corridor_refresh"]
+            )
+        return self.corridor_thresholds_m
+
+    def corridor_enabled(self):
+        """
+            Returns whether corridor thresholding applies: it is on, lane lines
+            are tracked, and thresholds run neither on a decimated frame nor
+            from the stage cache
+        """
+        p = self.params_m
+        return (p["corridor_thresholds"] and p["track"] and
+                p["threshold_decimation"] == 1 and self.stage_cache_m is None)
+
+    def get_corridor(self, detect_shape):
+        """
+            Mask of the pixels of the detection frame to threshold around the
+            tracked lane lines, or None to threshold the whole frame: corridor
+            thresholding doesn't apply, nothing is tracked yet, or a whole
+            frame is due to refresh the gradient scale
+        """
+        p = self.params_m
+        if (not self.corridor_enabled() or self.find_lane_lines_m is None or
+                self.get_corridor_thresholds().needs_full_frame()):
+            return None
+        ploty, left_fit, right_fit = self.find_lane_lines_m.get_fit_polynomial_data()
+        margin = p["margin"] if p["corridor_margin"] is None else p["corridor_margin"]
+        Minv = None
+        if not p["warp_first"]:
+            Minv = self.get_cam_view().compute_transform(detect_shape)[1]
+        return self.get_corridor_thresholds().corridor_mask(
+            detect_shape, left_fit, right_fit, margin*p["detect_scale"], Minv
+        )
+
+    def close(self):
+        """
+            Shuts down the stripe thresholding thread pool, if any
+        """
+        if self.stripe_thresholds_m is not None:
+            self.stripe_thresholds_m.close()
+            self.stripe_thresholds_m = None
+
+    def lane_binary_view(self, frame):
+        """
+            Stages that keep no state between frames: Distortion Correction,
+            Color & Gradient Thresholding and Bird's Eye View. Returns the
+            warped binary frame at detection size.
+        """
+        p = self.params_m
+        img_h, img_w = frame.shape[0], frame.shape[1]
+        scale = p["detect_scale"]
+        detect_shape = (int(round(img_h*scale)), int(round(img_w*scale)))
+        if p["warp_first"]:
+            warped_frame = self.get_camera_remap().birds_eye_view(frame, detect_shape)
+            return self.apply_thresholds(warped_frame)
+        detect_frame = self.correct_distortion(frame)
+        if scale != 1.0:
+            detect_frame = cv2.resize(
+                detect_frame, (detect_shape[1], detect_shape[0]),
+                interpolation=cv2.INTER_AREA
+            )
+        return self.get_cam_view().birds_eye_view(self.apply_thresholds(detect_frame))
+
+    def lane_result(self, frame, prior = None):
+        """
+            Distortion Correction through Vehicle Position of a raw frame with
+            LaneFunctions only, reading the pipeline's params and writing no
+            state, so threads and streams can share one pipeline: Search from
+            Prior around the prior LaneFit when given. Returns
+            LaneFunctions.LaneResult, measured in full resolution pixels, its
+            lane_fit in detection pixels to pass as the next frame's prior.
+            Polynomials are fit with np.polyfit whatever fit_method is, and
+            the stage cache, if set, is shared like the params.
+        """
+        p = self.params_m
+        scale = p["detect_scale"]
+        config = LaneFunctions.SlidingWindowConfig(
+            p["nwindows"], int(round(p["margin"]*scale)),
+            int(round(p["minpix"]*scale*scale))
+        )
+        return LaneFunctions.lane_result(
+            self.lane_binary_view(frame), config, prior, p["unit_type"],
+            p["curve_type"], frame.shape
+        )
+
+    def lane_metrics_from_view(self, lane_b_e_view, frame_shape):
+        """
+            Stages that use the tracker: Lane Line Detection on a warped
+            binary frame from lane_binary_view(), then Lane Curvature and
+            Vehicle Position in pixels of a frame of frame_shape. Returns the
+            lane metrics.
+        """
+        ploty, left_fit, right_fit = self.detect_lane_lines(lane_b_e_view)
+        if lane_b_e_view.shape[:2] != tuple(frame_shape[:2]):
+            ploty, left_fit, right_fit = self.rescale_fits(
+                left_fit, right_fit, lane_b_e_view.shape, frame_shape
+            )
+            lane_b_e_view = np.broadcast_to(np.uint8(0), tuple(frame_shape[:2]))
+        self.lane_metrics_m = self.measure_lane_scheduled(
+            lane_b_e_view, ploty, left_fit, right_fit
+        )
+        return self.lane_metrics_m
+
+    def get_scene_detector(self):
+        """
+            Returns the static scene change detector, creating it on first use
+        """
+        if self.scene_detector_m is None:
+            self.scene_detector_m = SceneChangeDetector(
+                self.params_m["static_threshold"], self.params_m["static_max_reuse"]
+            )
+        return self.scene_detector_m
+
+    def run_pipeline(self, frame):
+        """
+            Detects radius of lane curvature, vehicle position with respect to
+            center of lane and fills in the lane boundary over the original
+            undistorted frame. With warp_first and no overlay rendered, the
+            raw frame is returned. With skip_static, frames that barely differ
+            from the last processed frame reuse its lane metrics.
+        """
+        if not self.params_m["skip_static"]:
+            return self.process_frame(frame)
+        scene_detector = self.get_scene_detector()
+        static, signature = scene_detector.check(frame)
+        if static:
+            return self.reuse_result(frame)
+        result = self.process_frame(frame)
+        scene_detector.set_reference(signature)
+        return result
+
+    def reuse_result(self, frame):
+        """
+            Output of a static frame from the lane metrics of the last
+            processed frame, without thresholding or lane line detection
+        """
+        p = self.params_m
+        stage_start = time.perf_counter()
+        self.stage_times_m = {}
+        self.detect_method_m = "static"
+        self.age_outputs(("position", "curvature"))
+        undist_frame = None
+        if not p["warp_first"]:
+            undist_frame = self.correct_distortion(frame)
+            stage_start = self.time_stage("undistort", stage_start)
+        if p["static_reuse_overlay"] and self.has_overlay_layer(frame):
+            self.age_outputs(("overlay",))
+            return self.render_result(frame, undist_frame, None, None, None, stage_start, True)
+        lane_b_e_view, ploty, Minv = self.static_overlay_m
+        result = self.render_result(frame, undist_frame, lane_b_e_view, ploty, Minv, stage_start)
+        if p["render_overlay"] and self.output_ages_m is not None:
+            self.output_ages_m["overlay"] = 0
+        return result
+
+    def process_frame(self, frame):
+        """
+            Runs every stage of the pipeline on a frame, see run_pipeline()
+        """
+        p = self.params_m
+        scale = p["detect_scale"]
+        img_h, img_w = frame.shape[0], frame.shape[1]
+        detect_shape = (int(round(img_h*scale)), int(round(img_w*scale)))
+        stage_start = time.perf_counter()
+        self.stage_times_m.pop("detect_corridor", None)
+        stage_cache = self.stage_cache_m
+        frame_key = None
+        if stage_cache is not None:
+            frame_key = stage_cache.frame_key(frame)
+        # Corridor around the tracked lane lines, None thresholds it all
+        corridor = self.get_corridor(detect_shape)
+        if p["warp_first"]:
+            # Raw frame to bird's eye view at detection size in one resample,
+            # then threshold the road area only
+            camera_remap = self.get_camera_remap()
+            detect_frame = camera_remap.birds_eye_view(frame, detect_shape)
+            if stage_cache is not None:
+                frame_key = stage_cache.make_key("birds_eye_view", frame_key, {
+                    "perspective_src": p["perspective_src"],
+                    "perspective_dst": p["perspective_dst"],
+                    "detect_shape": detect_shape,
+                })
+            stage_start = self.time_stage("warp", stage_start)
+            Minv = camera_remap.get_minv(frame.shape)
+            undist_frame = None
+        else:
+            if stage_cache is None:
+                undist_frame = self.correct_distortion(frame)
+            else:
+                undist_frame, frame_key = self.cached(
+                    "undistort", frame_key, (), lambda: self.correct_distortion(frame),
+                    {"mtx": self.mtx_m.tolist(), "dist_coeff": self.dist_coeff_m.tolist()}
+                )
+            stage_start = self.time_stage("undistort", stage_start)
+            detect_frame = undist_frame
+            if scale != 1.0:
+                detect_frame = cv2.resize(
+                    undist_frame, (detect_shape[1], detect_shape[0]),
+                    interpolation=cv2.INTER_AREA
+                )
+                if stage_cache is not None:
+                    frame_key = stage_cache.make_key(
+                        "resize", frame_key, {"detect_shape": detect_shape}
+                    )
+            Minv = self.get_cam_view().compute_transform(frame.shape)[1]
+        lane_b_e_view, lane_points, stage_start = self.threshold_view(
+            detect_frame, frame_key, corridor, stage_start
+        )
+        lane_fit = self.detect_lane_lines(lane_b_e_view, lane_points, search = corridor is None)
+        if lane_fit is None:
+            # Tracker lost the lane lines inside the corridor, threshold the
+            # whole frame and search again
+            self.stage_times_m["detect_corridor"] = time.perf_counter() - stage_start
+            lane_b_e_view, lane_points, stage_start = self.threshold_view(
+                detect_frame, frame_key, None, time.perf_counter()
+            )
+            lane_fit = self.detect_lane_lines(lane_b_e_view, lane_points)
+        ploty, left_fit, right_fit = lane_fit
+        if scale != 1.0:
+            ploty, left_fit, right_fit = self.rescale_fits(
+                left_fit, right_fit, lane_b_e_view.shape, frame.shape
+            )
+            # Measure and overlay in full resolution pixels, only the shape of
+            # the full size bird's eye view is needed
+            lane_b_e_view = np.broadcast_to(np.uint8(0), frame.shape[:2])
+        stage_start = self.time_stage("detect", stage_start)
+        self.lane_metrics_m = self.measure_lane_scheduled(
+            lane_b_e_view, ploty, left_fit, right_fit
+        )
+        stage_start = self.time_stage("measure", stage_start)
+        if p["skip_static"]:
+            # Only the shape of the bird's eye view is needed to draw the lane
+            self.static_overlay_m = (
+                np.broadcast_to(np.uint8(0), lane_b_e_view.shape[:2]), ploty, Minv
+            )
+        ages = self.output_ages_m
+        if (p["render_overlay"] and ages["overlay"] is not None
+                and ages["overlay"] + 1 < p["overlay_interval"]
+                and self.has_overlay_layer(frame)):
+            # Overlay not due: the last lane layer and text are blended onto
+            # this frame, the lane polygon isn't drawn and warped back
+            ages["overlay"] += 1
+            return self.render_result(frame, undist_frame, None, None, None, stage_start, True)
+        result = self.render_result(frame, undist_frame, lane_b_e_view, ploty, Minv, stage_start)
+        if p["render_overlay"]:
+            ages["overlay"] = 0
+        return result
+
+    def threshold_view(self, detect_frame, frame_key, corridor, stage_start):
+        """
+            Color & Gradient Thresholding of the detection frame, inside the
+            corridor mask when one is given, then Bird's Eye View unless the
+            frame already is one. Returns the warped binary frame, its nonzero
+            pixel coordinates when warped sparsely (else None) and the time
+            the next stage starts.
+        """
+        p = self.params_m
+        if corridor is not None or self.corridor_enabled():
+            # Whole frames are thresholded by the corridor thresholding too,
+            # it keeps their gradient max to scale the corridor by
+            combined_binary = self.get_corridor_thresholds().combine_thresholds(
+                self, detect_frame, corridor
+            )
+        else:
+            combined_binary = self.apply_thresholds(detect_frame, frame_key)
+        stage_start = self.time_stage("threshold", stage_start)
+        if p["warp_first"]:
+            return combined_binary, None, stage_start
+        cam_view = self.get_cam_view()
+        if p["sparse_warp"]:
+            lane_points = cam_view.birds_eye_points(combined_binary)
+            lane_b_e_view = np.broadcast_to(np.uint8(0), combined_binary.shape)
+        else:
+            lane_points = None
+            lane_b_e_view = cam_view.birds_eye_view(combined_binary)
+        stage_start = self.time_stage("warp", stage_start)
+        return lane_b_e_view, lane_points, stage_start
+
+    def render_result(self, frame, undist_frame, lane_b_e_view, ploty, Minv, stage_start, reuse_layer = False):
+        """
+            Overlays the lane metrics on the undistorted frame, when rendered.
+            undist_frame is None when only the raw frame was used. With
+            reuse_layer, the last overlay's lane polygon and text metrics are
+            blended onto this frame instead.
+        """
+        p = self.params_m
+        if not p["render_overlay"]:
+            self.stage_times_m["overlay"] = 0.0
+            return frame if undist_frame is None else undist_frame
+        if undist_frame is None:
+            undist_frame = self.get_camera_remap().correct_distortion(frame)
+            stage_start = self.time_stage("undistort", stage_start)
+        if not undist_frame.flags.writeable:
+            # Cached frame, the overlay may draw on it
+            undist_frame = undist_frame.copy()
+        if reuse_layer:
+            lane_layer, lane_metrics, shape = self.overlay_layer_m
+            result = self.overlay_lane(undist_frame, None, None, None, lane_metrics, lane_layer)
+        else:
+            result = self.overlay_lane(
+                undist_frame, lane_b_e_view, ploty, Minv, self.lane_metrics_m
+            )
+        self.time_stage("overlay", stage_start)
+        return result
+
+    def has_overlay_layer(self, frame):
+        """
+            Returns whether an overlay was drawn on a frame of this frame's
+            shape, whose lane layer can be blended onto it
+        """
+        layer = self.overlay_layer_m
+        return layer is not None and layer[0] is not None and layer[2][:2] == frame.shape[:2]
+
+    def time_stage(self, stage, stage_start):
+        """
+            Records seconds spent in stage since stage_start, returns the time
+            the next stage starts
+        """
+        stage_end = time.perf_counter()
+        self.stage_times_m[stage] = stage_end - stage_start
+        return stage_end
+
+    def get_stage_times(self):
+        """
+            Returns seconds spent per stage on the most recent frame and the
+            lane line detection method used
+        """
+        return dict(self.stage_times_m), self.detect_method_m
+
+    def get_lane_metrics(self):
+        """
+            Returns lane metrics (fits, curvature, vehicle position) of the
+            most recent frame
+        """
+        return self.lane_metrics_m
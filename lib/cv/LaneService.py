@@ -0,0 +1,390 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import numpy as np
+import threading
+import asyncio
+import socket
+import struct
+import json
+import copy
+import time
+import cv2
+import os
+
+from LanePipeline import LanePipeline
+
+# LaneService shares one warm, calibrated LanePipeline with many local clients
+# over a Unix socket (or TCP). Clients send frames and get back lane fits,
+# curvature and vehicle position.
+# - asyncio front end: one coroutine per connection, requests on a connection
+#   are answered in order
+# - Micro-batching: requests arriving within batch_window of each other (up to
+#   max_batch) are dispatched together to a pool of worker processes, which run
+#   the stages that keep no state (lane_binary_view()) and return the warped
+#   binary frames bit-packed
+# - Sessions: a request with a session id is tracked across frames, the
+#   session's tracker state is kept by the service, idle sessions expire
+# Message framing, both ways: 4 byte big endian header length, JSON header,
+# then the payload bytes the header announces ("nbytes"). A request header is
+# {"op": "detect", "session": id or null, "shape": [h, w, 3]} with the uint8
+# frame as payload, or {"op": "close", "session": id}.
+
+HEADER_LEN = struct.Struct(">I")
+
+# Worker process state, set once per worker by init_service_worker()
+service_state = {}
+
+
+def init_service_worker(pipeline):
+    """
+        Worker process initializer: keeps the pipeline batches are run with
+    """
+    # Workers already fill the cores, OpenCV threads would oversubscribe them
+    cv2.setNumThreads(1)
+    service_state["pipeline"] = pipeline
+
+
+class FrameError(Exception):
+    """
+        A frame failed in a worker process, the message names the worker's
+        error
+    """
+
+
+def lane_views_batch(frames):
+    """
+        Runs the stateless stages over a batch of frames in a worker process,
+        returns each warped binary frame bit-packed with its shape and None,
+        or None, None and the error of a frame that failed, so one bad frame
+        fails only its own request
+    """
+    views = []
+    for frame in frames:
+        try:
+            view = service_state["pipeline"].lane_binary_view(frame)
+        except Exception as e:
+            # e.g. a grayscale frame
+            views.append((None, None, "%s: %s" %(type(e).__name__, e)))
+            continue
+        views.append((np.packbits(view), view.shape, None))
+    return views
+
+
+def lane_metrics_to_json(lane_metrics):
+    """
+        Lane metrics with NumPy values as plain lists and floats
+    """
+    result = {}
+    for key, value in lane_metrics.items():
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        elif isinstance(value, np.generic):
+            value = value.item()
+        result[key] = value
+    return result
+
+
+async def read_message(reader):
+    """
+        Reads one message from a stream, returns (header, payload) or None
+        when the other side closed the connection
+    """
+    try:
+        header_len = HEADER_LEN.unpack(await reader.readexactly(HEADER_LEN.size))[0]
+        header = json.loads(await reader.readexactly(header_len))
+        payload = await reader.readexactly(header.get("nbytes", 0))
+    except asyncio.IncompleteReadError:
+        return None
+    return header, payload
+
+
+def pack_message(header, payload = b""):
+    header = dict(header, nbytes = len(payload))
+    header_bytes = json.dumps(header).encode()
+    return HEADER_LEN.pack(len(header_bytes)) + header_bytes + payload
+
+
+class LaneService:
+    def __init__(self, pipeline, nworkers = None, max_batch = 8, batch_window = 0.005, session_timeout = 300,
+                 stats_window = 10000):
+        """
+            pipeline is a calibrated LanePipeline shared by every client,
+            nworkers the worker processes for the stateless stages (defaults
+            to the cores available), max_batch and batch_window bound a
+            micro-batch, sessions idle for session_timeout seconds expire,
+            latency and batch size stats are over the last stats_window
+        """
+        self.pipeline_m = pipeline
+        if nworkers is None:
+            nworkers = len(os.sched_getaffinity(0))
+        self.nworkers_m = nworkers
+        self.max_batch_m = max_batch
+        self.batch_window_m = batch_window
+        self.session_timeout_m = session_timeout
+        # session id -> {"pipeline", "lock", "last_used"}
+        self.sessions_m = {}
+        self.executor_m = None
+        self.batch_queue_m = None
+        self.batcher_m = None
+        self.server_m = None
+        # Reporting, bounded so a long running service doesn't grow
+        self.requests_m = 0
+        self.batch_sizes_m = deque(maxlen = stats_window)
+        self.latencies_m = deque(maxlen = stats_window)
+
+    def get_session(self, session_id):
+        """
+            Returns a session's state, creating it with its own tracker on
+            first use. Without a session id, frames are not tracked.
+        """
+        session = self.sessions_m.get(session_id) if session_id is not None else None
+        if session is None:
+            # A pipeline of its own built from the shared one's calibration and
+            # parameters, no Bird's Eye View, thread pool or stage cache is
+            # shared between sessions. CameraCalibration keeps the last frame
+            # it undistorted, each session gets its own.
+            base = self.pipeline_m
+            params = base.get_params()
+            params["track"] = session_id is not None
+            pipeline = LanePipeline(
+                copy.copy(base.calibrate_cam_m), base.mtx_m, base.dist_coeff_m, **params
+            )
+            session = {"pipeline": pipeline, "lock": asyncio.Lock(), "last_used": time.monotonic()}
+            if session_id is not None:
+                self.sessions_m[session_id] = session
+        session["last_used"] = time.monotonic()
+        return session
+
+    def expire_sessions(self):
+        now = time.monotonic()
+        for session_id in [s for s, session in self.sessions_m.items()
+                           if now - session["last_used"] > self.session_timeout_m]:
+            del self.sessions_m[session_id]
+
+    async def batcher(self):
+        """
+            Collects queued frames into micro-batches and runs each batch's
+            stateless stages on the worker pool, split across the workers
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.batch_queue_m.get()]
+            deadline = loop.time() + self.batch_window_m
+            while len(batch) < self.max_batch_m:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.batch_queue_m.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes_m.append(len(batch))
+            nchunks = min(self.nworkers_m, len(batch))
+            chunks = [batch[i::nchunks] for i in range(nchunks)]
+            for chunk in chunks:
+                asyncio.ensure_future(self.run_chunk(chunk))
+
+    async def run_chunk(self, chunk):
+        """
+            Runs part of a micro-batch on one worker, resolves its requests
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            views = await loop.run_in_executor(
+                self.executor_m, lane_views_batch, [frame for frame, future in chunk]
+            )
+        except Exception as e:
+            for frame, future in chunk:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (frame, future), (packed_view, view_shape, error) in zip(chunk, views):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(FrameError(error))
+            else:
+                future.set_result((packed_view, view_shape))
+
+    async def detect(self, header, payload):
+        """
+            Lane metrics of one frame: stateless stages batched on the worker
+            pool, then the session's tracker
+        """
+        frame = np.frombuffer(payload, dtype = np.uint8).reshape(header["shape"])
+        session = self.get_session(header.get("session"))
+        # Frames of a session reach its tracker in the order they were sent
+        async with session["lock"]:
+            future = asyncio.get_running_loop().create_future()
+            await self.batch_queue_m.put((frame, future))
+            packed_view, view_shape = await future
+            lane_b_e_view = np.unpackbits(packed_view, count = int(np.prod(view_shape))).reshape(view_shape)
+            lane_metrics = await asyncio.get_running_loop().run_in_executor(
+                None, session["pipeline"].lane_metrics_from_view, lane_b_e_view, frame.shape
+            )
+        return lane_metrics_to_json(lane_metrics)
+
+    async def handle_client(self, reader, writer):
+        """
+            Serves the requests of one connection in order
+        """
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                header, payload = message
+                start = time.perf_counter()
+                try:
+                    if header["op"] == "detect":
+                        response = {"ok": True, "lane_metrics": await self.detect(header, payload)}
+                    elif header["op"] == "close":
+                        self.sessions_m.pop(header.get("session"), None)
+                        response = {"ok": True}
+                    else:
+                        response = {"ok": False, "error": "Choose a supported op, detect or close"}
+                except FrameError as e:
+                    response = {"ok": False, "error": str(e)}
+                except Exception as e:
+                    # e.g. no lane line pixels found in the frame
+                    response = {"ok": False, "error": "%s: %s" %(type(e).__name__, e)}
+                latency = time.perf_counter() - start
+                self.requests_m += 1
+                self.latencies_m.append(latency)
+                response["latency"] = latency
+                writer.write(pack_message(response))
+                await writer.drain()
+                self.expire_sessions()
+        finally:
+            writer.close()
+
+    async def start(self, address):
+        """
+            Starts serving on address, a Unix socket path or a (host, port)
+            tuple, with the worker pool and batcher
+        """
+        self.executor_m = ProcessPoolExecutor(
+            self.nworkers_m, initializer = init_service_worker, initargs = (self.pipeline_m,)
+        )
+        self.batch_queue_m = asyncio.Queue()
+        self.batcher_m = asyncio.ensure_future(self.batcher())
+        if isinstance(address, str):
+            self.server_m = await asyncio.start_unix_server(self.handle_client, path = address)
+        else:
+            self.server_m = await asyncio.start_server(self.handle_client, address[0], address[1])
+
+    async def stop(self):
+        self.server_m.close()
+        await self.server_m.wait_closed()
+        self.batcher_m.cancel()
+        self.executor_m.shutdown()
+
+    def serve_forever(self, address):
+        """
+            Runs the service until interrupted
+        """
+        async def serve():
+            await self.start(address)
+            try:
+                await self.server_m.serve_forever()
+            finally:
+                await self.stop()
+        asyncio.run(serve())
+
+    def get_stats(self):
+        """
+            Returns requests served, latency percentiles and mean batch size
+            over the last stats_window
+        """
+        latencies = np.array(self.latencies_m) if self.latencies_m else np.zeros(1)
+        return {
+            "requests": self.requests_m,
+            "sessions": len(self.sessions_m),
+            "latency_p50": float(np.percentile(latencies, 50)),
+            "latency_p95": float(np.percentile(latencies, 95)),
+            "batch_mean": float(np.mean(self.batch_sizes_m)) if self.batch_sizes_m else 0.0,
+        }
+
+
+class LaneServiceClient:
+    def __init__(self, address):
+        """
+            Blocking client of a LaneService at address, a Unix socket path or
+            a (host, port) tuple
+        """
+        if isinstance(address, str):
+            self.sock_m = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock_m = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock_m.connect(address)
+
+    def recv_exactly(self, nbytes):
+        data = bytearray()
+        while len(data) < nbytes:
+            chunk = self.sock_m.recv(nbytes - len(data))
+            if not chunk:
+                raise ConnectionError("LaneService closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def request(self, header, payload = b""):
+        self.sock_m.sendall(pack_message(header, payload))
+        header_len = HEADER_LEN.unpack(self.recv_exactly(HEADER_LEN.size))[0]
+        response = json.loads(self.recv_exactly(header_len))
+        self.recv_exactly(response.get("nbytes", 0))
+        return response
+
+    def detect(self, frame, session = None):
+        """
+            Returns the service's response for a frame: ok, lane_metrics (or
+            error) and the service side latency
+        """
+        frame = np.ascontiguousarray(frame, dtype = np.uint8)
+        return self.request({"op": "detect", "session": session, "shape": list(frame.shape)}, frame.tobytes())
+
+    def close_session(self, session):
+        return self.request({"op": "close", "session": session})
+
+    def close(self):
+        self.sock_m.close()
+
+
+def run_load(address, frames, nclients = 4, requests_per_client = 20, sessions = True):
+    """
+        Load generator: nclients threads, each with its own connection (and
+        session), send requests_per_client frames back to back. Returns
+        throughput and client side latency percentiles.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client_loop(client_id):
+        client = LaneServiceClient(address)
+        session = "load-%d" %(client_id) if sessions else None
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            response = client.detect(frames[(client_id + i) % len(frames)], session)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if not response["ok"]:
+                    errors.append(response["error"])
+        if sessions:
+            client.close_session(session)
+        client.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target = client_loop, args = (i,)) for i in range(nclients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput": len(latencies)/seconds,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p95": float(np.percentile(latencies, 95)),
+        "latency_max": float(np.max(latencies)),
+    }
@@ -0,0 +1,241 @@
+import numpy as np
+import json
+import zlib
+import os
+
+# MaskArchive stores the warped binary frames Lane Line Detection works on,
+# so detection, fitting and curvature can be replayed over a clip without
+# redoing Distortion Correction, Thresholding and Bird's Eye View.
+# - Encodings: "packbits" packs 8 pixels per byte with np.packbits and
+#   deflates the result (zlib, fastest level), "rle" keeps the lengths of the
+#   alternating runs of 0 and 1 pixels (starting with 0) as uint32. A 1280x720
+#   mask of 900 KB takes 5 to 10 KB packed, runs take a few times more on
+#   noisy masks.
+# - Masks are appended one at a time as they are made: the data file holds
+#   the encoded masks back to back, archive_path.idx their (offset, nbytes) as
+#   int64 pairs for random access and archive_path.json the mask shape,
+#   encoding and the frame shape and source they were made from
+# - Decoded masks are uint8 0/1 of the archive's shape
+
+ENCODINGS = ("packbits", "rle")
+
+
+def encode_mask(mask, encoding = "packbits"):
+    """
+        Encodes a binary mask (any nonzero pixel is set) to bytes
+    """
+    bits = np.ascontiguousarray(mask, dtype = bool).ravel()
+    if encoding == "packbits":
+        return zlib.compress(np.packbits(bits).tobytes(), 1)
+    # Positions where the pixel value changes, runs are the gaps between them
+    changes = np.flatnonzero(bits[1:] != bits[:-1]) + 1
+    bounds = np.concatenate([[0], changes, [bits.size]])
+    runs = np.diff(bounds).astype(np.uint32)
+    if bits.size and bits[0]:
+        # Runs start with 0 pixels, the first run is empty
+        runs = np.concatenate([[0], runs]).astype(np.uint32)
+    return runs.tobytes()
+
+
+def decode_mask(data, shape, encoding = "packbits"):
+    """
+        Decodes bytes from encode_mask() to a uint8 0/1 mask of shape
+    """
+    npixels = int(np.prod(shape))
+    if encoding == "packbits":
+        packed = np.frombuffer(zlib.decompress(data), dtype = np.uint8)
+        return np.unpackbits(packed, count = npixels).reshape(shape)
+    runs = np.frombuffer(data, dtype = np.uint32)
+    values = np.arange(len(runs), dtype = np.uint8) & 1
+    return np.repeat(values, runs).reshape(shape)
+
+
+class MaskArchive:
+    def __init__(self, archive_path, mode = "r", encoding = "packbits"):
+        """
+            archive_path is the data file, mode "r" reads an archive, "w"
+            starts a new one and "a" appends to an existing one (or starts
+            it). encoding applies to new archives, appending keeps the
+            archive's own.
+        """
+        self.archive_path_m = archive_path
+        self.index_path_m = archive_path + ".idx"
+        self.meta_path_m = archive_path + ".json"
+        self.meta_m = None
+        if mode in ("r", "a") and os.path.exists(self.meta_path_m):
+            with open(self.meta_path_m) as meta_file:
+                self.meta_m = json.load(meta_file)
+        elif mode == "r":
+            print("Error: No mask archive at %s" %(archive_path))
+        if self.meta_m is None:
+            if encoding not in ENCODINGS:
+                print("Error: Choose a supported encoding, packbits or rle")
+            self.meta_m = {"encoding": encoding, "shape": None, "frame_shape": None, "source": None}
+        # (offset, nbytes) per mask
+        self.index_m = []
+        if mode in ("r", "a") and os.path.exists(self.index_path_m):
+            index = np.fromfile(self.index_path_m, dtype = np.int64)
+            # Without an entry cut short by an interrupted append
+            self.index_m = index[:len(index)//2*2].reshape(-1, 2).tolist()
+        self.data_file_m = None
+        self.index_file_m = None
+        if mode in ("w", "a"):
+            archive_dir = os.path.dirname(archive_path)
+            # If filepath doesn't exist, create it
+            if archive_dir and not os.path.exists(archive_dir):
+                os.makedirs(archive_dir)
+            file_mode = "wb" if mode == "w" else "ab"
+            self.data_file_m = open(archive_path, file_mode)
+            self.index_file_m = open(self.index_path_m, file_mode)
+            if mode == "a":
+                # Drop what an interrupted append wrote past the last complete
+                # index entry
+                self.index_file_m.truncate(16*len(self.index_m))
+                self.data_file_m.truncate(sum(self.index_m[-1]) if self.index_m else 0)
+                self.index_file_m.seek(0, os.SEEK_END)
+                self.data_file_m.seek(0, os.SEEK_END)
+        # Data file mapped on first read
+        self.data_m = None
+
+    def set_source(self, frame_shape, source = None):
+        """
+            Records the shape of the frames the masks were made from and what
+            identifies their source (FrameSource.describe())
+        """
+        self.meta_m["frame_shape"] = list(frame_shape)
+        self.meta_m["source"] = source
+
+    def append(self, mask):
+        """
+            Encodes and appends a mask, returns its index
+        """
+        if self.meta_m["shape"] is None:
+            self.meta_m["shape"] = list(mask.shape[:2])
+            self.write_meta()
+        elif list(mask.shape[:2]) != self.meta_m["shape"]:
+            print("Error: Masks of an archive must all be %dx%d" %(self.meta_m["shape"][1], self.meta_m["shape"][0]))
+            return None
+        data = encode_mask(mask, self.meta_m["encoding"])
+        offset = self.data_file_m.tell()
+        self.data_file_m.write(data)
+        self.index_file_m.write(np.array([offset, len(data)], dtype = np.int64).tobytes())
+        self.index_m.append([offset, len(data)])
+        self.data_m = None
+        return len(self.index_m) - 1
+
+    def write_meta(self):
+        with open(self.meta_path_m, "w") as meta_file:
+            json.dump(self.meta_m, meta_file)
+
+    def flush(self):
+        """
+            Makes the masks appended so far readable by other readers, data
+            before index so an indexed mask is always complete
+        """
+        if self.data_file_m is not None:
+            self.data_file_m.flush()
+            self.index_file_m.flush()
+
+    def close(self):
+        """
+            Closes the files of an archive being written
+        """
+        if self.data_file_m is not None:
+            self.flush()
+            self.write_meta()
+            self.data_file_m.close()
+            self.index_file_m.close()
+            self.data_file_m = None
+            self.index_file_m = None
+        self.data_m = None
+
+    def __len__(self):
+        return len(self.index_m)
+
+    def get_data(self):
+        """
+            Returns the data file mapped to memory, mapped on first read
+        """
+        if self.data_m is None:
+            self.flush()
+            if os.path.getsize(self.archive_path_m) == 0:
+                return np.zeros(0, dtype = np.uint8)
+            self.data_m = np.memmap(self.archive_path_m, dtype = np.uint8, mode = "r")
+        return self.data_m
+
+    def read_mask(self, index):
+        """
+            Decodes mask index (negative counts from the end)
+        """
+        offset, nbytes = self.index_m[index]
+        data = self.get_data()[offset:offset + nbytes]
+        return decode_mask(data.tobytes(), tuple(self.meta_m["shape"]), self.meta_m["encoding"])
+
+    def replay(self, start = 0, stop = None):
+        """
+            Yields (index, mask) for masks start to stop (not included, None
+            to the end)
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        for index in range(start, stop):
+            yield index, self.read_mask(index)
+
+    def get_frame_shape(self):
+        """
+            Returns the shape of the frames the masks were made from, the mask
+            shape when it wasn't recorded
+        """
+        frame_shape = self.meta_m["frame_shape"] or self.meta_m["shape"]
+        return tuple(frame_shape) if frame_shape is not None else None
+
+    def get_stats(self):
+        """
+            Returns masks stored, encoded bytes, mean bytes per mask and the
+            compression ratio against uint8 masks
+        """
+        nmasks = len(self)
+        nbytes = sum(entry[1] for entry in self.index_m)
+        raw_bytes = nmasks*int(np.prod(self.meta_m["shape"])) if nmasks else 0
+        return {
+            "masks": nmasks,
+            "bytes": nbytes,
+            "bytes_per_mask": nbytes/nmasks if nmasks else 0.0,
+            "ratio": raw_bytes/nbytes if nbytes else 0.0,
+        }
+
+
+def record_lane_masks(pipeline, source, archive_path, encoding = "packbits", max_frames = None):
+    """
+        Runs the stateless stages of pipeline (Distortion Correction,
+        Thresholding, Bird's Eye View) over the frames of a FrameSource (RGB
+        order) and archives their warped binary frames. Returns the number of
+        masks archived.
+    """
+    archive = MaskArchive(archive_path, "w", encoding)
+    try:
+        for index, frame in enumerate(source):
+            if max_frames is not None and index >= max_frames:
+                break
+            if index == 0:
+                archive.set_source(frame.shape, source.describe())
+            archive.append(pipeline.lane_binary_view(frame))
+    finally:
+        archive.close()
+    return len(archive)
+
+
+def replay_lane_metrics(pipeline, archive, start = 0, stop = None):
+    """
+        Runs the tracking stages of pipeline (Lane Line Detection, Lane
+        Curvature, Vehicle Position) over archived masks. Yields (index, lane
+        metrics), lane metrics are None when no lane was found in the mask.
+    """
+    frame_shape = archive.get_frame_shape()
+    for index, mask in archive.replay(start, stop):
+        try:
+            lane_metrics = pipeline.lane_metrics_from_view(mask, frame_shape)
+        except Exception:
+            # e.g. no lane line pixels found in the mask
+            pipeline.reset_tracker()
+            lane_metrics = None
+        yield index, lane_metrics
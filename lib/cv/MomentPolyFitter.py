@@ -0,0 +1,94 @@
+import numpy as np
+
+# MomentPolyFitter fits a second order polynomial x = A*y**2 + B*y + C to lane
+# line pixels from its sufficient statistics, instead of running np.polyfit
+# (an SVD over every pixel) each frame. Pixels are first reduced to per-row
+# counts and x sums with np.bincount, then the sums of y**k (k = 0..4) and
+# x*y**k (k = 0..2) are dot products over the image rows and the fit is the
+# solution of the 3x3 normal equations.
+# - row_cap caps the weight of any single row at row_cap pixels, so thick or
+#   noisy rows don't dominate the fit (stratified by row)
+# - decay keeps the statistics of previous frames with that weight per frame,
+#   giving a temporally smoothed fit. Only a frame's final pixel selection is
+#   accumulated, fits on the way there (e.g. on the sliding windows' pixels
+#   before searching around their polynomials) are of that frame's pixels
+#   alone and leave the statistics as they are.
+
+class MomentPolyFitter:
+    def __init__(self, img_h, decay = None, row_cap = None):
+        """
+            img_h is the height of the binary warped image, decay in (0, 1)
+            turns on temporal fitting, row_cap turns on per-row weighting
+        """
+        self.img_h_m = img_h
+        self.decay_m = decay
+        self.row_cap_m = row_cap
+        # Rows scaled to [0, 1] keep y**4 well conditioned
+        t = np.arange(img_h, dtype = np.float64)/img_h
+        self.row_powers_m = np.vstack([np.ones(img_h), t, t**2, t**3, t**4])
+        # Sums of t**k for k = 0..4 and x*t**k for k = 0..2
+        self.sum_t_m = None
+        self.sum_xt_m = None
+
+    def reset(self):
+        """
+            Forgets the statistics of previous frames
+        """
+        self.sum_t_m = None
+        self.sum_xt_m = None
+
+    def statistics(self, y, x):
+        """
+            Returns the sums of t**k and x*t**k of a frame's lane line pixels
+            (y, x)
+        """
+        row_count = np.bincount(y, minlength = self.img_h_m)[:self.img_h_m].astype(np.float64)
+        row_sum_x = np.bincount(y, weights = x, minlength = self.img_h_m)[:self.img_h_m]
+        if self.row_cap_m is not None:
+            # Rows with more than row_cap pixels count as row_cap pixels
+            row_weight = np.minimum(1.0, self.row_cap_m/np.maximum(row_count, 1))
+            row_count *= row_weight
+            row_sum_x *= row_weight
+        sum_t = self.row_powers_m.dot(row_count)
+        sum_xt = self.row_powers_m[:3].dot(row_sum_x)
+        return sum_t, sum_xt
+
+    def accumulate(self, y, x):
+        """
+            Adds the lane line pixels (y, x) of a frame to the statistics,
+            once per frame
+        """
+        sum_t, sum_xt = self.statistics(y, x)
+        if self.decay_m is not None and self.sum_t_m is not None:
+            sum_t += self.decay_m*self.sum_t_m
+            sum_xt += self.decay_m*self.sum_xt_m
+        self.sum_t_m = sum_t
+        self.sum_xt_m = sum_xt
+
+    def solve(self, sum_t = None, sum_xt = None):
+        """
+            Solves the normal equations of the statistics given, else of the
+            accumulated ones, returns [A, B, C] like np.polyfit
+        """
+        if sum_t is None:
+            sum_t, sum_xt = self.sum_t_m, self.sum_xt_m
+        s = sum_t
+        normal = np.array([[s[4], s[3], s[2]],
+                           [s[3], s[2], s[1]],
+                           [s[2], s[1], s[0]]])
+        rhs = sum_xt[::-1]
+        # lstsq instead of solve, so too few rows give a fit, not an error
+        fit_t = np.linalg.lstsq(normal, rhs, rcond = None)[0]
+        # Back from t = y/img_h to y
+        return fit_t/np.array([self.img_h_m**2, self.img_h_m, 1.0])
+
+    def fit(self, y, x, accumulate = True):
+        """
+            Returns the fit of a frame's lane line pixels. When they are the
+            frame's final selection they are accumulated and the fit is of the
+            statistics, else of these pixels alone.
+        """
+        if accumulate:
+            self.accumulate(y, x)
+            return self.solve()
+        return self.solve(*self.statistics(y, x))
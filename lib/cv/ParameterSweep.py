@@ -0,0 +1,175 @@
+import multiprocessing as mp
+import numpy as np
+import itertools
+import time
+import cv2
+import os
+
+from FrameSource import ImageDirFrameSource
+from PipelineBenchmark import PipelineBenchmark
+
+# ParameterSweep evaluates a LanePipeline over a frame set (the test_images by
+# default) for many parameter configurations on a pool of worker processes.
+# Each configuration gets a score from a metric (lower is better) and its
+# median per-frame latency, and the Pareto front of score against latency
+# shows which configurations are worth their cost.
+# Configurations come from a grid (every combination of values) or random
+# search (values drawn per configuration from a seeded generator).
+
+# Worker process state, set once per worker by init_sweep_worker()
+sweep_state = {}
+
+
+def init_sweep_worker(pipeline, frames, metric):
+    """
+        Worker process initializer: keeps the pipeline, frames and metric
+        every configuration of this worker is evaluated with
+    """
+    # Workers already fill the cores, OpenCV threads would oversubscribe them
+    cv2.setNumThreads(1)
+    sweep_state["pipeline"] = pipeline
+    sweep_state["frames"] = frames
+    sweep_state["metric"] = metric
+
+
+def evaluate_config(config):
+    """
+        Runs the worker's pipeline with config over every frame, returns the
+        config with its score, median seconds per frame and any error
+    """
+    pipeline = sweep_state["pipeline"]
+    saved_params = pipeline.get_params()
+    pipeline.set_params(**config)
+    pipeline.reset_tracker()
+    result = {"config": config, "score": float("inf"), "latency": float("inf"), "error": None}
+    try:
+        lane_metrics = []
+        frame_times = []
+        for frame in sweep_state["frames"]:
+            start = time.perf_counter()
+            pipeline.run_pipeline(frame)
+            frame_times.append(time.perf_counter() - start)
+            lane_metrics.append(pipeline.get_lane_metrics())
+        result["latency"] = float(np.median(frame_times))
+        result["score"] = float(sweep_state["metric"](lane_metrics))
+    except Exception as e:
+        # e.g. no lane line pixels found with these thresholds
+        result["error"] = "%s: %s" %(type(e).__name__, e)
+    pipeline.set_params(**saved_params)
+    return result
+
+
+class ReferenceFitError:
+    def __init__(self, reference, img_h = 720):
+        """
+            Metric: mean horizontal distance in pixels between the lane lines
+            of a configuration and those of a reference run, see
+            PipelineBenchmark.compare_metrics()
+        """
+        self.benchmark_m = PipelineBenchmark(None, [])
+        self.benchmark_m.reference_m = reference
+        self.img_h_m = img_h
+
+    def __call__(self, lane_metrics):
+        return self.benchmark_m.compare_metrics(lane_metrics, self.img_h_m)["fit_error_mean"]
+
+
+class ParameterSweep:
+    def __init__(self, pipeline, frames = None, metric = None, nworkers = None):
+        """
+            pipeline is a configured LanePipeline every configuration starts
+            from, frames defaults to data/input/image/test_images. metric takes
+            the list of lane metrics (one dict per frame) of a configuration
+            and returns its score, lower is better, and has to be picklable.
+            It defaults to ReferenceFitError against the pipeline as given.
+        """
+        self.pipeline_m = pipeline
+        if frames is None:
+            frames = list(ImageDirFrameSource("data/input/image/test_images"))
+        self.frames_m = frames
+        self.metric_m = metric
+        if nworkers is None:
+            nworkers = len(os.sched_getaffinity(0))
+        self.nworkers_m = nworkers
+        self.results_m = []
+
+    def grid_configs(self, param_grid):
+        """
+            Every combination of the values listed per parameter, e.g.
+            {"sobel_thresh": [(20, 100), (30, 100)], "margin": [80, 100]}
+        """
+        names = sorted(param_grid)
+        return [dict(zip(names, values))
+                for values in itertools.product(*(param_grid[name] for name in names))]
+
+    def random_configs(self, space, nconfigs, seed = 0):
+        """
+            nconfigs configurations drawn from space, which maps a parameter to
+            a list of values to choose from or to a function of a
+            np.random.Generator returning a value, e.g.
+            {"mag_thresh": lambda rng: (int(rng.integers(20, 60)), 100)}
+        """
+        rng = np.random.default_rng(seed)
+        configs = []
+        for i in range(nconfigs):
+            config = {}
+            for name in sorted(space):
+                values = space[name]
+                if callable(values):
+                    config[name] = values(rng)
+                else:
+                    config[name] = values[rng.integers(len(values))]
+            configs.append(config)
+        return configs
+
+    def get_metric(self):
+        """
+            Returns the metric, running the pipeline as given for the
+            reference of the default metric
+        """
+        if self.metric_m is None:
+            seconds, reference = PipelineBenchmark(self.pipeline_m, self.frames_m).run()
+            self.metric_m = ReferenceFitError(reference, self.frames_m[0].shape[0])
+        return self.metric_m
+
+    def run(self, configs):
+        """
+            Evaluates every configuration on the worker pool, returns one
+            result per configuration in order: config, score, latency (median
+            seconds per frame) and error (None if it ran)
+        """
+        metric = self.get_metric()
+        with mp.Pool(self.nworkers_m, initializer = init_sweep_worker,
+                     initargs = (self.pipeline_m, self.frames_m, metric)) as pool:
+            results = pool.map(evaluate_config, configs, chunksize = 1)
+        self.results_m.extend(results)
+        return results
+
+    def pareto_front(self, results = None):
+        """
+            Results no other result beats on both score and latency, from
+            fastest to most accurate. Defaults to every result so far.
+        """
+        if results is None:
+            results = self.results_m
+        ran = sorted((r for r in results if r["error"] is None),
+                     key = lambda r: (r["latency"], r["score"]))
+        front = []
+        for r in ran:
+            # Sorted by latency, so a result is on the front when it scores
+            # better than every faster one
+            if not front or r["score"] < front[-1]["score"]:
+                front.append(r)
+        return front
+
+    def display_results(self, results):
+        """
+            Displays to screen score and latency per configuration
+        """
+        for r in results:
+            print("Config: %s" %(r["config"],))
+            if r["error"] is not None:
+                print("Error: %s" %(r["error"]))
+            else:
+                print("Score = %.3f, Latency = %.1f ms" %(r["score"], r["latency"]*1000))
+        print("\n")
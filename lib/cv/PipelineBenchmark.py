@@ -0,0 +1,88 @@
+import numpy as np
+import time
+
+# PipelineBenchmark measures throughput of a LanePipeline over a set of frames
+# and the accuracy given up by faster settings, by comparing their lane fits,
+# curvature and vehicle position against a reference run at full quality.
+
+class PipelineBenchmark:
+    def __init__(self, pipeline, frames):
+        """
+            pipeline is a configured LanePipeline, frames is a list of frames
+            (e.g. the test_images) every configuration is run over
+        """
+        self.pipeline_m = pipeline
+        self.frames_m = frames
+        self.reference_m = None
+
+    def run(self, **params):
+        """
+            Runs the pipeline over every frame with params overridden.
+            Returns seconds per frame and the lane metrics of each frame.
+        """
+        saved_params = self.pipeline_m.get_params()
+        self.pipeline_m.set_params(**params)
+        self.pipeline_m.reset_tracker()
+        metrics = []
+        start = time.perf_counter()
+        for frame in self.frames_m:
+            self.pipeline_m.run_pipeline(frame)
+            metrics.append(self.pipeline_m.get_lane_metrics())
+        seconds_per_frame = (time.perf_counter() - start)/len(self.frames_m)
+        self.pipeline_m.set_params(**saved_params)
+        return seconds_per_frame, metrics
+
+    def compare_metrics(self, metrics, img_h = 720):
+        """
+            Accuracy loss against the reference run: mean and max horizontal
+            distance in pixels between lane lines over the image height, median
+            relative error of curvature radius (near straight lanes have huge,
+            noisy radii) and mean absolute error of the vehicle's distance from
+            center
+        """
+        ploty = np.linspace(0, img_h-1, img_h)
+        fit_errors = []
+        curverad_errors = []
+        position_errors = []
+        for ref, test in zip(self.reference_m, metrics):
+            for side in ("left_fit", "right_fit"):
+                fit_errors.append(np.abs(np.polyval(test[side], ploty) -
+                                         np.polyval(ref[side], ploty)))
+            for side in ("left_curverad", "right_curverad"):
+                curverad_errors.append(abs(test[side] - ref[side])/ref[side])
+            position_errors.append(abs(test["dist_center"] - ref["dist_center"]))
+        fit_errors = np.concatenate(fit_errors)
+        return {
+            "fit_error_mean": float(np.mean(fit_errors)),
+            "fit_error_max": float(np.max(fit_errors)),
+            "curverad_rel_error": float(np.median(curverad_errors)),
+            "position_error": float(np.mean(position_errors)),
+        }
+
+    def compare_scales(self, scales = (1.0, 0.75, 0.5, 0.33)):
+        """
+            Benchmarks the pipeline with detection at each fraction of the
+            input resolution, against detection at full resolution
+        """
+        img_h = self.frames_m[0].shape[0]
+        ref_seconds, self.reference_m = self.run(detect_scale = 1.0)
+        report = {}
+        for scale in scales:
+            seconds, metrics = self.run(detect_scale = scale)
+            report[scale] = {
+                "fps": 1/seconds,
+                "speedup": ref_seconds/seconds,
+            }
+            report[scale].update(self.compare_metrics(metrics, img_h))
+        return report
+
+    def display_report(self, report):
+        """
+            Displays to screen throughput and accuracy loss per setting
+        """
+        for setting, r in report.items():
+            print("Setting: %s" %(setting,))
+            print("FPS = %.1f, Speedup = %.2fx" %(r["fps"], r["speedup"]))
+            print("Fit error mean = %.1f (p), max = %.1f (p)" %(r["fit_error_mean"], r["fit_error_max"]))
+            print("Curvature radius error = %.1f %%, Position error = %.3f" %(r["curverad_rel_error"]*100, r["position_error"]))
+            print("\n")
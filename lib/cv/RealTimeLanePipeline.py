@@ -0,0 +1,255 @@
+import threading
+import time
+
+# RealTimeLanePipeline runs a tracking LanePipeline against a per-frame
+# deadline for live feeds. It measures the cost of each stage and when the
+# pipeline falls behind it degrades quality one level at a time:
+# 0: full        - pipeline as configured
+# 1: prior_only  - Search from Prior only, no Sliding Windows Search
+# 2: decimated   - also threshold a downscaled frame
+# 3: no_overlay  - also skip drawing the lane overlay
+# Frames that can no longer make their deadline are dropped instead of being
+# queued, so output latency stays bounded.
+
+class RealTimeLanePipeline:
+    def __init__(self, pipeline, deadline = 0.033, decimation = 2, recover_frames = 30):
+        """
+            pipeline is a configured LanePipeline, deadline is the per-frame
+            budget in seconds from capture to result, decimation is the
+            threshold downscale factor used from level 2 on, recover_frames is
+            the number of frames under budget before trying a better level
+        """
+        self.pipeline_m = pipeline
+        # Real-time mode only makes sense with the tracker on
+        self.pipeline_m.set_params(track = True)
+        self.deadline_m = deadline
+        self.recover_frames_m = recover_frames
+        self.level_names_m = ["full", "prior_only", "decimated", "no_overlay"]
+        # Pipeline settings per quality level
+        self.level_params_m = [
+            {"prior_search_only": False, "threshold_decimation": 1, "render_overlay": True},
+            {"prior_search_only": True, "threshold_decimation": 1, "render_overlay": True},
+            {"prior_search_only": True, "threshold_decimation": decimation, "render_overlay": True},
+            {"prior_search_only": True, "threshold_decimation": decimation, "render_overlay": False},
+        ]
+        self.level_m = 0
+        self.pipeline_m.set_params(**self.level_params_m[0])
+        # Smoothed seconds per stage and per level
+        self.stage_cost_m = {}
+        self.level_cost_m = [None] * len(self.level_names_m)
+        self.ema_alpha_m = 0.2
+        self.frames_under_budget_m = 0
+        # Reporting
+        self.frame_count_m = 0
+        self.dropped_count_m = 0
+        # Counts are also updated by run_live()'s capture thread
+        self.count_lock_m = threading.Lock()
+        self.level_frames_m = [0] * len(self.level_names_m)
+        # (frame_count, level_name) each time the level changed
+        self.level_changes_m = [(0, self.level_names_m[0])]
+        self.last_result_m = None
+
+    def smooth(self, previous, value):
+        """
+            Exponential moving average, first value is taken as is
+        """
+        if previous is None:
+            return value
+        return (1 - self.ema_alpha_m)*previous + self.ema_alpha_m*value
+
+    def set_level(self, level):
+        """
+            Switches the pipeline to a quality level and records the change
+        """
+        if level == self.level_m:
+            return
+        self.level_m = level
+        self.pipeline_m.set_params(**self.level_params_m[level])
+        self.level_changes_m.append((self.frame_count_m, self.level_names_m[level]))
+        self.frames_under_budget_m = 0
+
+    def predicted_cost(self, level):
+        """
+            Predicted seconds to process a frame at a level, from what was
+            measured at that level or estimated from the level above it (in
+            turn measured or estimated)
+        """
+        if self.level_cost_m[level] is not None:
+            return self.level_cost_m[level]
+        if level == 0:
+            return None
+        cost = self.predicted_cost(level - 1)
+        if cost is None:
+            return None
+        stage_cost = self.stage_cost_m
+        if level == 1:
+            # Sliding Windows Search replaced by Search from Prior
+            cost -= stage_cost.get("detect_search", 0.0) - stage_cost.get("detect_prior", 0.0)
+        elif level == 2:
+            decimation = self.level_params_m[2]["threshold_decimation"]
+            cost -= stage_cost.get("threshold", 0.0)*(1 - 1/decimation**2)
+        elif level == 3:
+            cost -= stage_cost.get("overlay", 0.0)
+        return max(cost, 0.0)
+
+    def update_costs(self, frame_cost):
+        """
+            Folds the stage times of the frame just processed into the smoothed
+            per-stage and per-level costs
+        """
+        stage_times, detect_method = self.pipeline_m.get_stage_times()
+        for stage, seconds in stage_times.items():
+            if stage == "detect":
+                stage = "detect_" + detect_method
+            elif stage == "threshold" and self.level_m >= 2:
+                stage = "threshold_decimated"
+            elif stage == "overlay" and self.level_m == 3:
+                continue
+            self.stage_cost_m[stage] = self.smooth(self.stage_cost_m.get(stage), seconds)
+        self.level_cost_m[self.level_m] = self.smooth(self.level_cost_m[self.level_m], frame_cost)
+
+    def adapt_level(self, budget):
+        """
+            Degrades one level when the current level doesn't fit the budget,
+            recovers one level after recover_frames frames with room to spare
+        """
+        level = self.level_m
+        if self.level_cost_m[level] > budget:
+            if level < len(self.level_names_m) - 1:
+                self.set_level(level + 1)
+            else:
+                # Even the lowest level is over budget, no room to recover
+                self.frames_under_budget_m = 0
+            return
+        self.frames_under_budget_m += 1
+        if level > 0 and self.frames_under_budget_m >= self.recover_frames_m:
+            better_cost = self.predicted_cost(level - 1)
+            if better_cost is None or better_cost < 0.8*budget:
+                self.set_level(level - 1)
+            else:
+                self.frames_under_budget_m = 0
+
+    def fitting_level(self, remaining):
+        """
+            Best level from the current one down whose predicted cost fits in
+            remaining seconds (a level not predicted yet is tried), the lowest
+            level when none does
+        """
+        lowest = len(self.level_names_m) - 1
+        for level in range(self.level_m, lowest):
+            cost = self.predicted_cost(level)
+            if cost is None or cost <= remaining:
+                return level
+        return lowest
+
+    def process(self, frame, capture_time = None):
+        """
+            Processes a frame captured at capture_time (time.perf_counter()
+            clock, defaults to now). Returns (result, status) where status has
+            the quality level, whether the frame was dropped and its latency.
+            A dropped frame returns the last result.
+        """
+        now = time.perf_counter()
+        if capture_time is None:
+            capture_time = now
+        remaining = self.deadline_m - (now - capture_time)
+        with self.count_lock_m:
+            self.frame_count_m += 1
+            # Only a frame already past its deadline is dropped
+            if remaining <= 0:
+                self.dropped_count_m += 1
+                return self.last_result_m, self.get_status(True, now - capture_time)
+        # When the current level can't make the time left, run at the best
+        # level below it predicted to make it, else at the lowest level, whose
+        # cost is then measured and can later recover. Dropping instead would
+        # never measure anything again.
+        self.set_level(self.fitting_level(remaining))
+        level = self.level_m
+        result = self.pipeline_m.run_pipeline(frame)
+        done = time.perf_counter()
+        self.update_costs(done - now)
+        self.level_frames_m[level] += 1
+        self.adapt_level(self.deadline_m)
+        self.last_result_m = result
+        status = self.get_status(False, done - capture_time)
+        status["level"] = self.level_names_m[level]
+        return result, status
+
+    def get_status(self, dropped, latency):
+        return {
+            "frame": self.frame_count_m,
+            "level": self.level_names_m[self.level_m],
+            "dropped": dropped,
+            "latency": latency,
+        }
+
+    def run_live(self, read_frame, on_result, max_frames = None):
+        """
+            Runs on a live source. read_frame() returns the next frame (or None
+            at the end) and is read on its own thread into a single slot, so a
+            frame that arrives while the pipeline is busy replaces the waiting
+            one instead of queueing behind it. on_result(result, status) is
+            called for every processed frame.
+        """
+        latest = {"frame": None, "time": None, "done": False}
+        cond = threading.Condition()
+
+        def capture():
+            while True:
+                frame = read_frame()
+                with cond:
+                    if frame is None:
+                        latest["done"] = True
+                    else:
+                        if latest["frame"] is not None:
+                            # Replaced in the slot, never reaches process()
+                            with self.count_lock_m:
+                                self.dropped_count_m += 1
+                                self.frame_count_m += 1
+                        latest["frame"] = frame
+                        latest["time"] = time.perf_counter()
+                    cond.notify()
+                if frame is None:
+                    break
+
+        capture_thread = threading.Thread(target = capture, daemon = True)
+        capture_thread.start()
+        processed = 0
+        while max_frames is None or processed < max_frames:
+            with cond:
+                while latest["frame"] is None and not latest["done"]:
+                    cond.wait()
+                if latest["frame"] is None:
+                    break
+                frame, capture_time = latest["frame"], latest["time"]
+                latest["frame"] = None
+            result, status = self.process(frame, capture_time)
+            processed += 1
+            on_result(result, status)
+
+    def get_quality_report(self):
+        """
+            Returns frames seen, frames dropped, frames processed per level,
+            level changes, the current level and smoothed per-stage costs
+        """
+        return {
+            "frames": self.frame_count_m,
+            "dropped": self.dropped_count_m,
+            "level_frames": dict(zip(self.level_names_m, self.level_frames_m)),
+            "level_changes": list(self.level_changes_m),
+            "level": self.level_names_m[self.level_m],
+            "stage_cost": dict(self.stage_cost_m),
+        }
+
+    def display_quality_report(self):
+        """
+            Displays to screen dropped frames and frames processed per quality
+            level
+        """
+        report = self.get_quality_report()
+        print("Frames = %d, Dropped = %d, Level = %s" %(report["frames"], report["dropped"], report["level"]))
+        for level_name, count in report["level_frames"].items():
+            print("Level %s: %d frames" %(level_name, count))
+        for stage, seconds in report["stage_cost"].items():
+            print("Stage %s: %.1f ms" %(stage, seconds*1000))
+        print("\n")
@@ -0,0 +1,79 @@
+import numpy as np
+import cv2
+
+# SceneChangeDetector tells when a frame is close enough to the last fully
+# processed frame that its lane metrics can be reused, e.g. while the vehicle
+# is stopped or crawling in traffic.
+# A frame's signature is the frame shrunk to a few gray blocks (each block the
+# mean of its pixels), cheap to compute and insensitive to sensor noise and
+# compression artifacts. A frame is static when no block of its signature
+# differs from the reference signature by more than threshold gray levels.
+# The reference is the last frame that was fully processed, not the previous
+# frame, so a slow drift still adds up to a change. After max_reuse static
+# frames in a row the next frame is processed anyway.
+
+class SceneChangeDetector:
+    def __init__(self, threshold = 3.0, max_reuse = 30, signature_size = (32, 18)):
+        """
+            threshold is the largest block difference in gray levels (0-255) of
+            a static frame, max_reuse the most frames in a row reusing a
+            result and signature_size the (width, height) of the signature
+        """
+        self.threshold_m = threshold
+        self.max_reuse_m = max_reuse
+        self.signature_size_m = signature_size
+        self.reference_m = None
+        self.reused_m = 0
+        # Reporting
+        self.frames_m = 0
+        self.static_frames_m = 0
+
+    def signature(self, frame):
+        """
+            Frame shrunk to signature_size gray blocks
+        """
+        small = cv2.resize(frame, self.signature_size_m, interpolation = cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = small.mean(axis = 2)
+        return small.astype(np.float32)
+
+    def check(self, frame):
+        """
+            Returns (static, signature) for a frame: static when its result
+            can be reused. A frame that is not static must be processed and
+            its signature passed to set_reference().
+        """
+        signature = self.signature(frame)
+        self.frames_m += 1
+        static = (self.reference_m is not None and
+                  self.reference_m.shape == signature.shape and
+                  self.reused_m < self.max_reuse_m and
+                  np.max(np.abs(signature - self.reference_m)) <= self.threshold_m)
+        if static:
+            self.reused_m += 1
+            self.static_frames_m += 1
+        return static, signature
+
+    def set_reference(self, signature):
+        """
+            Makes a fully processed frame's signature the reference
+        """
+        self.reference_m = signature
+        self.reused_m = 0
+
+    def reset(self):
+        """
+            Forgets the reference, the next frame is processed
+        """
+        self.reference_m = None
+        self.reused_m = 0
+
+    def get_stats(self):
+        """
+            Returns frames checked, static frames and the fraction reused
+        """
+        return {
+            "frames": self.frames_m,
+            "static_frames": self.static_frames_m,
+            "reuse_ratio": self.static_frames_m/self.frames_m if self.frames_m else 0.0,
+        }
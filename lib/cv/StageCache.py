@@ -0,0 +1,124 @@
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import os
+
+# StageCache memoizes the outputs of pipeline stages while tuning parameters
+# over the same frames. A stage output is keyed by the key of its input (the
+# frame's content hash for the first stage) and only the parameters that stage
+# depends on, so changing e.g. an HLS threshold recomputes the HLS binary and
+# what comes after it, not Distortion Correction or Sobel.
+# - Memory tier: LRU bounded by the bytes of the arrays it holds
+# - Disk tier (optional): every computed output is also saved as .npy under
+#   cache_dir, so it survives across runs and processes
+# Cached arrays are read-only, a stage that draws on its input copies it first.
+
+class StageCache:
+    def __init__(self, max_bytes = 512*1024*1024, cache_dir = None):
+        """
+            max_bytes bounds the memory tier, cache_dir turns on the disk tier
+        """
+        self.max_bytes_m = max_bytes
+        self.cache_dir_m = cache_dir
+        # key -> array, least recently used first
+        self.entries_m = OrderedDict()
+        self.nbytes_m = 0
+        # stage -> [memory hits, disk hits, misses]
+        self.stats_m = {}
+
+    def frame_key(self, frame):
+        """
+            Content hash of a frame, its shape and dtype
+        """
+        frame = np.ascontiguousarray(frame)
+        digest = hashlib.blake2b(frame.data, digest_size = 16)
+        digest.update(repr((frame.shape, frame.dtype.str)).encode())
+        return digest.hexdigest()
+
+    def make_key(self, stage, input_key, params):
+        """
+            Key of a stage output from its input key and the parameters the
+            stage depends on
+        """
+        digest = hashlib.blake2b(digest_size = 16)
+        digest.update(repr((stage, input_key, sorted(params.items()))).encode())
+        return digest.hexdigest()
+
+    def get_disk_path(self, stage, key):
+        return os.path.join(self.cache_dir_m, stage, key + ".npy")
+
+    def put(self, key, value):
+        """
+            Stores a stage output in the memory tier, evicting least recently
+            used outputs over max_bytes
+        """
+        value.flags.writeable = False
+        if key in self.entries_m:
+            self.nbytes_m -= self.entries_m.pop(key).nbytes
+        self.entries_m[key] = value
+        self.nbytes_m += value.nbytes
+        while self.nbytes_m > self.max_bytes_m and len(self.entries_m) > 1:
+            evicted_key, evicted = self.entries_m.popitem(last = False)
+            self.nbytes_m -= evicted.nbytes
+
+    def save(self, stage, key, value):
+        """
+            Stores a stage output in the disk tier
+        """
+        disk_path = self.get_disk_path(stage, key)
+        # If filepath doesn't exist, create it
+        if not os.path.exists(os.path.dirname(disk_path)):
+            os.makedirs(os.path.dirname(disk_path), exist_ok = True)
+        # Write then rename, so readers never see a partial file
+        tmp_path = disk_path + ".%d.tmp" %(os.getpid())
+        with open(tmp_path, "wb") as tmp_file:
+            np.save(tmp_file, value)
+        os.replace(tmp_path, disk_path)
+
+    def get_or_compute(self, stage, input_key, params, compute):
+        """
+            Returns (output, key) of a stage, compute() is only called when
+            the output is in neither tier
+        """
+        key = self.make_key(stage, input_key, params)
+        stats = self.stats_m.setdefault(stage, [0, 0, 0])
+        if key in self.entries_m:
+            self.entries_m.move_to_end(key)
+            stats[0] += 1
+            return self.entries_m[key], key
+        if self.cache_dir_m is not None and os.path.exists(self.get_disk_path(stage, key)):
+            value = np.load(self.get_disk_path(stage, key))
+            stats[1] += 1
+        else:
+            value = np.asarray(compute())
+            stats[2] += 1
+            if self.cache_dir_m is not None:
+                self.save(stage, key, value)
+        self.put(key, value)
+        return value, key
+
+    def clear(self):
+        """
+            Empties the memory tier, the disk tier is kept
+        """
+        self.entries_m.clear()
+        self.nbytes_m = 0
+
+    def get_stats(self):
+        """
+            Returns memory hits, disk hits and misses per stage and the bytes
+            held in memory
+        """
+        stages = {stage: {"hits": s[0], "disk_hits": s[1], "misses": s[2]}
+                  for stage, s in self.stats_m.items()}
+        return {"stages": stages, "entries": len(self.entries_m), "nbytes": self.nbytes_m}
+
+    def display_stats(self):
+        """
+            Displays to screen cache hits and misses per stage
+        """
+        stats = self.get_stats()
+        print("Entries = %d, Memory = %.1f MB" %(stats["entries"], stats["nbytes"]/1e6))
+        for stage, s in stats["stages"].items():
+            print("Stage %s: %d hits, %d disk hits, %d misses" %(stage, s["hits"], s["disk_hits"], s["misses"]))
+        print("\n")
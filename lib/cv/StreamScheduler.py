@@ -0,0 +1,277 @@
+import multiprocessing as mp
+import numpy as np
+import queue
+import time
+import cv2
+import os
+
+from FrameRing import FrameRing
+
+# StreamScheduler multiplexes several camera streams, each with its own
+# calibrated LanePipeline, over a fixed pool of worker processes.
+# - Stream affinity: a stream is bound to one worker, so the worker keeps that
+#   stream's tracker state and processes its frames in order
+# - Fair scheduling: frames are pulled from the streams round-robin
+# - Backpressure: a stream has at most max_inflight frames in flight, its
+#   source is not read again until one of them is done
+# Frames go through a FrameRing per stream (cameras can differ in resolution),
+# only slot indices travel over the worker queues.
+
+def video_frames(video_path):
+    """
+        Yields frames read from a video file with cv2.VideoCapture
+    """
+    video_reader = cv2.VideoCapture(video_path)
+    while True:
+        ret, frame = video_reader.read()
+        if ret == False:
+            break
+        yield frame
+    video_reader.release()
+
+
+def stream_worker(task_queue, done_queue):
+    """
+        Worker process loop serving the streams bound to it. Tasks are:
+        ("add", stream_id, ring, pipeline), ("frame", stream_id, slot, frame_id)
+        and None to stop the worker. Frames are reported as (stream_id, slot,
+        frame_id, seconds, error), error is None unless the pipeline failed
+        on the frame.
+    """
+    # Workers already fill the cores, OpenCV threads would oversubscribe them
+    cv2.setNumThreads(1)
+    rings = {}
+    pipelines = {}
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        if task[0] == "frame":
+            stream_id, slot, frame_id = task[1:]
+            ring = rings[stream_id]
+            pipeline = pipelines[stream_id]
+            start = time.perf_counter()
+            try:
+                result = pipeline.run_pipeline(ring.get_frame(slot))
+                ring.write_result(slot, result)
+                error = None
+            except Exception as e:
+                # e.g. no lane line pixels found in the frame, the stream goes
+                # on from a fresh tracker
+                pipeline.reset_tracker()
+                error = "%s: %s" %(type(e).__name__, e)
+            done_queue.put((stream_id, slot, frame_id, time.perf_counter() - start, error))
+        elif task[0] == "add":
+            stream_id, ring, pipeline = task[1:]
+            rings[stream_id] = ring
+            pipelines[stream_id] = pipeline
+    for ring in rings.values():
+        ring.close()
+
+
+class StreamScheduler:
+    def __init__(self, nworkers = None, max_inflight = 2):
+        """
+            nworkers defaults to the number of cores this process may run on,
+            max_inflight is the number of frames per stream being processed or
+            waiting for a worker at any time
+        """
+        if nworkers is None:
+            # Cores this process may run on, where the platform tells
+            nworkers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        self.nworkers_m = nworkers
+        self.max_inflight_m = max_inflight
+        # stream_id -> stream state, in the order streams were added
+        self.streams_m = {}
+        # Pixels per frame bound to each worker, used to balance affinity
+        self.worker_load_m = [0] * nworkers
+
+    def add_stream(self, stream_id, source, pipeline, frame_shape = None):
+        """
+            Adds a stream. source is a video path or an iterable of frames,
+            pipeline is the LanePipeline configured with this camera's
+            calibration and perspective. frame_shape is taken from the first
+            frame when not given.
+        """
+        if isinstance(source, str):
+            source = video_frames(source)
+        frames = iter(source)
+        first_frame = None
+        if frame_shape is None:
+            first_frame = next(frames, None)
+            if first_frame is None:
+                print("Error: stream %s has no frames" %(stream_id))
+                return
+            frame_shape = first_frame.shape
+        # Bind the stream to the least loaded worker
+        worker_id = int(np.argmin(self.worker_load_m))
+        self.worker_load_m[worker_id] += int(np.prod(frame_shape))
+        self.streams_m[stream_id] = {
+            "frames": frames,
+            "first_frame": first_frame,
+            "frame_shape": tuple(frame_shape),
+            "pipeline": pipeline,
+            "worker_id": worker_id,
+            "exhausted": False,
+            "next_frame_id": 0,
+            # frame_id -> time the frame was handed to the worker
+            "submitted": {},
+            "latencies": [],
+            "proc_times": [],
+            # (frame_id, error) of the frames the pipeline failed on
+            "errors": [],
+        }
+
+    def read_frame(self, stream):
+        """
+            Returns the next frame of a stream or None once it is exhausted
+        """
+        if stream["first_frame"] is not None:
+            frame = stream["first_frame"]
+            stream["first_frame"] = None
+            return frame
+        return next(stream["frames"], None)
+
+    def run(self, on_result = None):
+        """
+            Processes every stream until all sources are exhausted.
+            on_result(stream_id, frame_id, result) is called in frame order per
+            stream, result is a view into shared memory only valid during the
+            call, None when the pipeline failed on the frame (see
+            get_errors()). Returns per-stream latency stats. Raises
+            RuntimeError when a worker process dies.
+        """
+        # Rings are created before the workers start, so the workers share
+        # this process' shared memory tracker and never unlink a ring
+        for stream in self.streams_m.values():
+            stream["ring"] = FrameRing(self.max_inflight_m, stream["frame_shape"])
+            stream["free_slots"] = list(range(self.max_inflight_m))
+
+        task_queues = [mp.Queue() for counter_w in range(self.nworkers_m)]
+        done_queue = mp.Queue()
+        workers = []
+        for worker_id in range(self.nworkers_m):
+            worker = mp.Process(target = stream_worker,
+                                args = (task_queues[worker_id], done_queue),
+                                daemon = True)
+            worker.start()
+            workers.append(worker)
+        for stream_id, stream in self.streams_m.items():
+            task_queues[stream["worker_id"]].put(
+                ("add", stream_id, stream["ring"], stream["pipeline"])
+            )
+
+        self.start_time_m = time.perf_counter()
+        in_flight = 0
+        while True:
+            # One frame per stream per round keeps the streams fair
+            for stream_id, stream in self.streams_m.items():
+                if stream["exhausted"] or not stream["free_slots"]:
+                    continue
+                frame = self.read_frame(stream)
+                if frame is None:
+                    stream["exhausted"] = True
+                    continue
+                slot = stream["free_slots"].pop()
+                stream["ring"].write_frame(slot, frame)
+                frame_id = stream["next_frame_id"]
+                stream["next_frame_id"] += 1
+                stream["submitted"][frame_id] = time.perf_counter()
+                task_queues[stream["worker_id"]].put(
+                    ("frame", stream_id, slot, frame_id)
+                )
+                in_flight += 1
+            if in_flight == 0:
+                break
+            # Wait for at least one result, then take whatever else is done
+            done = [self.get_done(done_queue, workers)]
+            while True:
+                try:
+                    done.append(done_queue.get_nowait())
+                except queue.Empty:
+                    break
+            for stream_id, slot, frame_id, proc_time, error in done:
+                stream = self.streams_m[stream_id]
+                stream["latencies"].append(
+                    time.perf_counter() - stream["submitted"].pop(frame_id)
+                )
+                stream["proc_times"].append(proc_time)
+                result = None
+                if error is None:
+                    result = stream["ring"].get_result(slot)
+                else:
+                    stream["errors"].append((frame_id, error))
+                if on_result is not None:
+                    on_result(stream_id, frame_id, result)
+                stream["free_slots"].append(slot)
+                in_flight -= 1
+        self.elapsed_m = time.perf_counter() - self.start_time_m
+
+        for task_queue in task_queues:
+            task_queue.put(None)
+        for worker in workers:
+            worker.join()
+        for stream in self.streams_m.values():
+            stream["ring"].close()
+        return self.get_latency_stats()
+
+    def get_done(self, done_queue, workers, poll_interval = 1.0):
+        """
+            Waits for the next frame done by a worker, raises RuntimeError
+            when a worker died, the frames of its streams would never come
+            back
+        """
+        while True:
+            try:
+                return done_queue.get(timeout = poll_interval)
+            except queue.Empty:
+                dead = [worker.pid for worker in workers if not worker.is_alive()]
+                if dead:
+                    for worker in workers:
+                        worker.terminate()
+                    for stream in self.streams_m.values():
+                        stream["ring"].close()
+                    raise RuntimeError("Stream worker process %s exited" %(dead))
+
+    def get_errors(self):
+        """
+            Returns stream_id -> (frame_id, error) of the frames the pipeline
+            failed on, for the streams with failures
+        """
+        return {stream_id: list(stream["errors"])
+                for stream_id, stream in self.streams_m.items() if stream["errors"]}
+
+    def get_latency_stats(self):
+        """
+            Returns per-stream frame count, throughput and latency (seconds from
+            handing a frame to its worker until its result is back) mean, p50,
+            p95, max, and mean processing time inside the worker
+        """
+        stats = {}
+        for stream_id, stream in self.streams_m.items():
+            latencies = np.array(stream["latencies"])
+            if len(latencies) == 0:
+                continue
+            stats[stream_id] = {
+                "worker_id": stream["worker_id"],
+                "frames": len(latencies),
+                "errors": len(stream["errors"]),
+                "fps": len(latencies)/self.elapsed_m,
+                "latency_mean": float(np.mean(latencies)),
+                "latency_p50": float(np.percentile(latencies, 50)),
+                "latency_p95": float(np.percentile(latencies, 95)),
+                "latency_max": float(np.max(latencies)),
+                "proc_time_mean": float(np.mean(stream["proc_times"])),
+            }
+        return stats
+
+    def display_latency_stats(self):
+        """
+            Displays to screen per-stream throughput and latency
+        """
+        for stream_id, s in self.get_latency_stats().items():
+            print("Stream: %s (worker %d)" %(stream_id, s["worker_id"]))
+            print("Frames = %d, FPS = %.1f" %(s["frames"], s["fps"]))
+            print("Latency mean = %.1f ms, p95 = %.1f ms, max = %.1f ms"
+                  %(s["latency_mean"]*1000, s["latency_p95"]*1000, s["latency_max"]*1000))
+            print("\n")
@@ -0,0 +1,151 @@
+import numpy as np
+import cv2
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from GradientThresholds import GradientThresholds
+
+# StripeThresholds applies a LanePipeline's Color & Gradient Thresholding to
+# horizontal stripes of one frame on a thread pool, so a single high resolution
+# stream uses more than one core. OpenCV and NumPy release the GIL while they
+# work on the stripes.
+# - Each stripe is read with halo rows above and below it, as many as the
+#   Gaussian and Sobel kernels reach, so the stripe's own rows come out the
+#   same as on the full frame
+# - Sobel-X and Gradient Magnitude are scaled by their max over the whole
+#   frame, so they run in two phases: gradients per stripe, then thresholds
+#   per stripe once the global max is known
+# - OpenCV's own threads are cut down while the pool runs, so the two don't
+#   oversubscribe the cores
+
+class StripeThresholds:
+    def __init__(self, nthreads = None, nstripes = None):
+        """
+            nthreads defaults to the cores this process may run on, nstripes
+            defaults to nthreads
+        """
+        if nthreads is None:
+            nthreads = len(os.sched_getaffinity(0))
+        self.nthreads_m = nthreads
+        self.nstripes_m = nthreads if nstripes is None else nstripes
+        # OpenCV threads per pool thread while stripes are processed
+        self.cv_threads_m = max(1, len(os.sched_getaffinity(0))//nthreads)
+        self.executor_m = None
+
+    def __getstate__(self):
+        # The pool stays with the process that made it
+        state = dict(self.__dict__)
+        state["executor_m"] = None
+        return state
+
+    def get_executor(self):
+        """
+            Returns the thread pool, starting it on first use
+        """
+        if self.executor_m is None:
+            self.executor_m = ThreadPoolExecutor(max_workers = self.nthreads_m)
+        return self.executor_m
+
+    def close(self):
+        """
+            Shuts the thread pool down
+        """
+        if self.executor_m is not None:
+            self.executor_m.shutdown()
+            self.executor_m = None
+
+    def get_halo(self, params):
+        """
+            Rows a stripe reads beyond its own: Gaussian blur then Sobel for
+            Sobel-X, Sobel alone for Gradient Magnitude and Direction
+        """
+        # A kernel size of 1 is a 3 tap Sobel along the derivative
+        sobel_x_halo = params["sobel_kernel"][1]//2 + 1
+        mag_halo = max(params["mag_kernel"]//2, 1)
+        dir_halo = max(params["dir_kernel"]//2, 1)
+        return max(sobel_x_halo, mag_halo, dir_halo)
+
+    def get_stripes(self, img_h, halo):
+        """
+            Returns (start, stop, halo_start, halo_stop) rows per stripe
+        """
+        nstripes = max(1, min(self.nstripes_m, img_h))
+        bounds = np.linspace(0, img_h, nstripes + 1).astype(int)
+        return [(start, stop, max(start - halo, 0), min(stop + halo, img_h))
+                for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def stripe_gradients(self, pipeline, undist_frame, stripe):
+        """
+            Phase 1 on one stripe: Sobel-X and Gradient Magnitude before
+            scaling, the Gradient Direction and Color binaries
+        """
+        p = pipeline.params_m
+        start, stop, halo_start, halo_stop = stripe
+        halo_frame = undist_frame[halo_start:halo_stop]
+        rows = slice(start - halo_start, stop - halo_start)
+        gradient_cam = GradientThresholds()
+        abs_sobel = gradient_cam.sobel_abs(halo_frame, p["sobel_orient"], p["sobel_kernel"])[rows]
+        if p["fast_gradients"]:
+            grad_mag = gradient_cam.grad_mag2(halo_frame, p["mag_kernel"])[rows]
+            grad_dir_binary = gradient_cam.apply_grad_dir_thresh_fast(
+                halo_frame, p["dir_kernel"], p["dir_thresh"]
+            )[rows]
+        else:
+            grad_mag = gradient_cam.grad_mag(halo_frame, p["mag_kernel"])[rows]
+            grad_dir_binary = gradient_cam.apply_grad_dir_thresh(
+                halo_frame, p["dir_kernel"], p["dir_thresh"]
+            )[rows]
+        # Color thresholds are per pixel and need no halo
+        color_binary = pipeline.apply_color_thresholds(undist_frame[start:stop])
+        return abs_sobel, grad_mag, grad_dir_binary, color_binary
+
+    def stripe_thresholds(self, pipeline, gradients, max_sobel, max_mag, combined_stripe):
+        """
+            Phase 2 on one stripe: scales and thresholds Sobel-X and Gradient
+            Magnitude by their global max, combines them with the Gradient
+            Direction and Color binaries into combined_stripe
+        """
+        p = pipeline.params_m
+        abs_sobel, grad_mag, grad_dir_binary, color_binary = gradients
+        gradient_cam = GradientThresholds()
+        sx_binary = gradient_cam.scale_sobel_thresh(abs_sobel, max_sobel, p["sobel_thresh"])
+        if p["fast_gradients"]:
+            grad_mag_binary = gradient_cam.grad_mag2_thresh(grad_mag, max_mag, p["mag_thresh"])
+        else:
+            grad_mag_binary = gradient_cam.scale_grad_mag_thresh(grad_mag, max_mag, p["mag_thresh"])
+        comb_grad_binary = gradient_cam.apply_combined_thresh(
+            p["grad_code"], grad_x = sx_binary,
+            grad_mag = grad_mag_binary, grad_dir = grad_dir_binary
+        )
+        combined_stripe[ (comb_grad_binary == 1) | (color_binary == 1) ] = 1
+
+    def combine_thresholds(self, pipeline, undist_frame):
+        """
+            Same binary frame as pipeline.combine_thresholds(), thresholded
+            stripe by stripe on the thread pool
+        """
+        stripes = self.get_stripes(undist_frame.shape[0], self.get_halo(pipeline.params_m))
+        executor = self.get_executor()
+        cv_threads = cv2.getNumThreads()
+        cv2.setNumThreads(self.cv_threads_m)
+        try:
+            gradients = list(executor.map(
+                lambda stripe: self.stripe_gradients(pipeline, undist_frame, stripe),
+                stripes
+            ))
+            # Global max over every stripe
+            max_sobel = max(np.max(g[0]) for g in gradients)
+            max_mag = max(np.max(g[1]) for g in gradients)
+            if pipeline.params_m["fast_gradients"]:
+                max_mag = int(max_mag)
+            combined_binary = np.zeros(undist_frame.shape[:2], dtype = np.uint8)
+            list(executor.map(
+                lambda i: self.stripe_thresholds(
+                    pipeline, gradients[i], max_sobel, max_mag,
+                    combined_binary[stripes[i][0]:stripes[i][1]]
+                ),
+                range(len(stripes))
+            ))
+        finally:
+            cv2.setNumThreads(cv_threads)
+        return combined_binary
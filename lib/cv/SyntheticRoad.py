@@ -0,0 +1,226 @@
+import numpy as np
+import cv2
+
+from FrameSource import FrameSource
+from CameraPerspective import CameraPerspective
+import LaneFunctions
+
+# SyntheticRoad renders road frames with known lane lines, at any resolution
+# and clip length, for throughput, memory and accuracy benchmarks without
+# external data.
+# - The road is drawn in the bird's eye view, then warped to the camera view
+#   with the inverse of the pipeline's default Bird's Eye View transform, so
+#   the pipeline's own warp gives the drawn lane lines back
+# - Lane geometry follows the pipeline's conventions: 30 m ahead span the
+#   view's height and a 3.7 m lane spans 700 of 1280 pixels, scaled to the
+#   resolution. The lane center is offset + Y**2/(2*radius) meters at Y meters
+#   ahead, so the ground truth polynomials are exact.
+# - Curvature and offset vary smoothly over the clip, the right line is
+#   dashed and its dashes move with the vehicle's speed
+# - Every frame is a function of the seed and its index alone, frames are
+#   rendered one at a time as they are read and any frame can be rendered on
+#   its own
+# The frames have no lens distortion, get_calibration() gives a camera matrix
+# and distortion coefficients for which Distortion Correction changes nothing.
+
+# Colors (RGB)
+ASPHALT = (95, 95, 100)
+SKY = (150, 190, 230)
+YELLOW_LINE = (230, 190, 40)
+WHITE_LINE = (235, 235, 235)
+
+LANE_WIDTH = 3.7
+LINE_WIDTH = 0.15
+# Dashes of the right line and the gaps between them, in meters
+DASH_LENGTH = 3.0
+DASH_GAP = 9.0
+
+
+class SyntheticRoad(FrameSource):
+    def __init__(self, width = 1280, height = 720, nframes = 250, seed = 0, fps = 25,
+                 speed = 20.0, min_radius = 300.0, max_offset = 0.5, noise = 8, color = "rgb"):
+        """
+            width and height are the frame resolution (720p up to 8K), nframes
+            the clip length, seed makes the clip reproducible, speed is in m/s,
+            min_radius the tightest curve in meters, max_offset the largest
+            distance in meters of the vehicle from the lane center and noise
+            the largest sensor noise in gray levels
+        """
+        FrameSource.__init__(self, color)
+        self.width_m = width
+        self.height_m = height
+        self.nframes_m = nframes
+        self.seed_m = seed
+        self.fps_m = fps
+        self.speed_m = speed
+        self.min_radius_m = min_radius
+        self.max_offset_m = max_offset
+        self.noise_m = noise
+        # Meters per pixel of the bird's eye view, as LanePipeline.measure_lane()
+        self.ym_per_pix_m = (30/720)*(720/height)
+        self.xm_per_pix_m = (3.7/700)*(1280/width)
+        # Phases and periods (in frames) of the curvature and offset changes
+        rng = np.random.default_rng(seed)
+        self.curve_phase_m, self.offset_phase_m = rng.uniform(0, 2*np.pi, 2)
+        self.curve_period_m, self.offset_period_m = rng.uniform(150, 400, 2)
+        self.Minv_m = CameraPerspective().compute_transform((height, width))[1]
+        self.noise_texture_m = None
+
+    def get_calibration(self):
+        """
+            Returns camera matrix and distortion coefficients of the synthetic
+            camera, which has no lens distortion
+        """
+        mtx = np.array([[self.width_m, 0, self.width_m/2],
+                        [0, self.width_m, self.height_m/2],
+                        [0, 0, 1]], dtype = np.float64)
+        return mtx, np.zeros((1, 5))
+
+    def lane_state(self, index):
+        """
+            Returns curvature (1/radius, positive curving right, 1/m) and the
+            vehicle's offset from the lane center (positive right of center,
+            m) of frame index
+        """
+        curvature = np.sin(2*np.pi*index/self.curve_period_m + self.curve_phase_m)/self.min_radius_m
+        offset = self.max_offset_m*np.sin(2*np.pi*index/self.offset_period_m + self.offset_phase_m)
+        return curvature, offset
+
+    def lane_fits(self, index):
+        """
+            Left and right lane line polynomials x = A*y**2 + B*y + C of frame
+            index, in bird's eye view pixels
+        """
+        curvature, offset = self.lane_state(index)
+        h, w = self.height_m, self.width_m
+        ym, xm = self.ym_per_pix_m, self.xm_per_pix_m
+        # Y = (h - y)*ym meters ahead, x = offset + curvature*Y**2/2 meters
+        # from the view center. The vehicle is offset right of the lane
+        # center, so the lane center is offset left of the view center.
+        A = curvature*ym*ym/(2*xm)
+        B = -2*h*A
+        fits = []
+        for side in (-1, 1):
+            C = w/2 + (side*LANE_WIDTH/2 - offset)/xm + A*h*h
+            fits.append(np.array([A, B, C]))
+        return fits[0], fits[1]
+
+    def ground_truth(self, index, unit_type = "meters"):
+        """
+            Ground truth of frame index in the pipeline's lane metrics
+            conventions: fits, curvature radius and angle, vehicle position
+        """
+        left_fit, right_fit = self.lane_fits(index)
+        ploty = np.linspace(0, self.height_m-1, self.height_m)
+        curvature_radius = LaneFunctions.measure_radius_curvature(
+            ploty, left_fit, right_fit, unit_type, self.ym_per_pix_m, self.xm_per_pix_m
+        )
+        curvature_angle = LaneFunctions.measure_angle_curvature(
+            curvature_radius.left_curverad, curvature_radius.right_curverad
+        )
+        position = LaneFunctions.measure_vehicle_position(
+            (self.height_m, self.width_m), left_fit, right_fit, unit_type, self.xm_per_pix_m
+        )
+        curvature, offset = self.lane_state(index)
+        return {
+            "left_fit": left_fit, "right_fit": right_fit,
+            "left_curverad": curvature_radius.left_curverad,
+            "right_curverad": curvature_radius.right_curverad,
+            "curverad_units": curvature_radius.units,
+            "l_angle_curve": curvature_angle.l_angle_curve,
+            "r_angle_curve": curvature_angle.r_angle_curve,
+            "angle_units": curvature_angle.units,
+            "dist_center": position.dist_center,
+            "position_units": position.units,
+            "side_center": position.side_center,
+            "curvature": curvature,
+            "offset": offset,
+        }
+
+    def line_polygon(self, fit, y_top, y_bottom):
+        """
+            Polygon of a lane line of LINE_WIDTH from row y_top to y_bottom of
+            the bird's eye view
+        """
+        half_width = LINE_WIDTH/2/self.xm_per_pix_m
+        ploty = np.linspace(y_top, y_bottom, max(2, int((y_bottom - y_top)//8) + 2))
+        fitx = np.polyval(fit, ploty)
+        pts = np.concatenate([
+            np.stack([fitx - half_width, ploty], axis = 1),
+            np.stack([fitx + half_width, ploty], axis = 1)[::-1],
+        ])
+        return np.round(pts).astype(np.int32)
+
+    def render_birds_eye(self, index):
+        """
+            Bird's eye view of the road of frame index: asphalt, a solid yellow
+            left line and a dashed white right line
+        """
+        h, w = self.height_m, self.width_m
+        view = np.empty((h, w, 3), dtype = np.uint8)
+        view[:] = ASPHALT
+        left_fit, right_fit = self.lane_fits(index)
+        cv2.fillPoly(view, [self.line_polygon(left_fit, 0, h - 1)], YELLOW_LINE)
+        # Distance travelled moves the dashes towards the vehicle
+        period = DASH_LENGTH + DASH_GAP
+        travelled = (index*self.speed_m/self.fps_m) % period
+        dashes = []
+        dash_start = -travelled
+        while dash_start < h*self.ym_per_pix_m:
+            # Meters ahead to rows, rows grow towards the vehicle
+            y_bottom = h - 1 - max(dash_start, 0)/self.ym_per_pix_m
+            y_top = h - 1 - (dash_start + DASH_LENGTH)/self.ym_per_pix_m
+            if y_bottom > 0 and dash_start + DASH_LENGTH > 0:
+                dashes.append(self.line_polygon(right_fit, max(y_top, 0), y_bottom))
+            dash_start += period
+        cv2.fillPoly(view, dashes, WHITE_LINE)
+        return view
+
+    def get_noise_texture(self):
+        """
+            Sensor noise texture, a few rows taller than a frame so each frame
+            reads it at its own offset. Made once, on first use. Noise is the
+            same on the 3 channels, so it changes brightness and not color.
+        """
+        if self.noise_texture_m is None:
+            rng = np.random.default_rng(self.seed_m)
+            noise = rng.integers(
+                0, 2*self.noise_m + 1, (self.height_m + 64, self.width_m, 1), dtype = np.uint8
+            )
+            self.noise_texture_m = np.repeat(noise, 3, axis = 2)
+        return self.noise_texture_m
+
+    def render(self, index):
+        """
+            Camera frame of frame index (uint8, in the source's color order)
+        """
+        h, w = self.height_m, self.width_m
+        # The road goes on past the sides of the bird's eye view, a road edge
+        # there would run the whole height of the view and pass for a lane line
+        frame = cv2.warpPerspective(
+            self.render_birds_eye(index), self.Minv_m, (w, h), flags = cv2.INTER_LINEAR,
+            borderMode = cv2.BORDER_REPLICATE
+        )
+        # Sky above the far end of the bird's eye view
+        horizon = int(np.ceil(cv2.perspectiveTransform(np.float32([[[w/2, 0]]]), self.Minv_m)[0, 0, 1]))
+        frame[:max(horizon - 1, 0)] = SKY
+        if self.noise_m > 0:
+            offset = np.random.default_rng((self.seed_m, index)).integers(0, 64)
+            cv2.add(frame, self.get_noise_texture()[offset:offset + h], dst = frame)
+            cv2.subtract(frame, (self.noise_m, self.noise_m, self.noise_m, 0), dst = frame)
+        if self.color_m == "bgr":
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        return frame
+
+    def read_frames(self):
+        for index in range(self.nframes_m):
+            yield self.render(index)
+
+    def describe(self):
+        return {
+            "backend": "synthetic",
+            "width": self.width_m, "height": self.height_m, "nframes": self.nframes_m,
+            "seed": self.seed_m, "fps": self.fps_m, "speed": self.speed_m,
+            "min_radius": self.min_radius_m, "max_offset": self.max_offset_m,
+            "noise": self.noise_m,
+        }
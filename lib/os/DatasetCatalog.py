@@ -0,0 +1,220 @@
+from PIL import Image
+import fnmatch
+import cv2
+import re
+import os
+
+# DatasetCatalog indexes the image and video files under a root directory in
+# process with os.scandir, without spawning a process per listing.
+# - Each directory's listing is kept with the directory's mtime, refresh()
+#   only rescans directories whose mtime changed (a file was added, removed or
+#   renamed in them), so refreshing an unchanged tree is one stat per directory
+# - Size, mtime, resolution and frame count of a file are only read when asked
+#   for and kept until the file's size or mtime change
+# - query() matches glob-style patterns against paths relative to the root,
+#   segment by segment as glob does: "*" and "?" stay within one directory
+#   level, a "**" segment matches any number of levels
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+
+def compile_segments(pattern):
+    """
+        Splits a glob-style pattern into its segments, each compiled with
+        fnmatch's translation except "**"
+    """
+    return [part if part == "**" else re.compile(fnmatch.translate(part))
+            for part in pattern.split("/")]
+
+
+def match_segments(parts, pattern_parts):
+    """
+        Returns whether path segments match compiled pattern segments, a
+        "**" pattern segment matching zero or more path segments
+    """
+    if not pattern_parts:
+        return not parts
+    if pattern_parts[0] == "**":
+        return any(match_segments(parts[i:], pattern_parts[1:]) for i in range(len(parts) + 1))
+    return (len(parts) > 0 and pattern_parts[0].match(parts[0]) is not None
+            and match_segments(parts[1:], pattern_parts[1:]))
+
+class DatasetCatalog:
+    def __init__(self, root, recursive = True):
+        """
+            root is the dataset directory, with recursive its subdirectories
+            are indexed too
+        """
+        self.root_m = root
+        self.recursive_m = recursive
+        # directory -> (mtime_ns, files as (relative path, kind), subdirectories)
+        self.dirs_m = {}
+        # relative path -> kind ("image" or "video")
+        self.files_m = {}
+        # Sorted relative paths, made again after a change
+        self.sorted_paths_m = None
+        # relative path -> metadata read so far
+        self.metadata_m = {}
+        self.refresh()
+
+    def scan_dir(self, dir_path):
+        """
+            Lists a directory once: its image and video files and its
+            subdirectories
+        """
+        files = []
+        subdirs = []
+        # Relative paths by slicing, os.path.relpath() per file is slow
+        prefix_len = len(os.path.join(self.root_m, ""))
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    kind = self.get_kind(entry.name)
+                    if kind is not None:
+                        files.append((entry.path[prefix_len:], kind))
+        return files, subdirs
+
+    def get_kind(self, filename):
+        """
+            Returns "image" or "video" from the file extension, None for any
+            other file
+        """
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in IMAGE_EXTENSIONS:
+            return "image"
+        if extension in VIDEO_EXTENSIONS:
+            return "video"
+        return None
+
+    def refresh(self):
+        """
+            Brings the index up to date, rescanning only directories that
+            changed since they were last scanned. Returns the number of
+            directories rescanned.
+        """
+        dirs = {}
+        rescanned = 0
+        pending = [self.root_m]
+        while pending:
+            dir_path = pending.pop()
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            cached = self.dirs_m.get(dir_path)
+            if cached is not None and cached[0] == mtime_ns:
+                dirs[dir_path] = cached
+            else:
+                files, subdirs = self.scan_dir(dir_path)
+                if cached is not None:
+                    self.remove_files(cached[1])
+                self.files_m.update(files)
+                dirs[dir_path] = (mtime_ns, files, subdirs)
+                rescanned += 1
+            if self.recursive_m:
+                pending.extend(dirs[dir_path][2])
+        # Directories that are gone
+        for dir_path in self.dirs_m.keys() - dirs.keys():
+            self.remove_files(self.dirs_m[dir_path][1])
+            rescanned += 1
+        self.dirs_m = dirs
+        if rescanned > 0:
+            self.sorted_paths_m = None
+        return rescanned
+
+    def remove_files(self, files):
+        """
+            Removes a directory's previous files from the index with their
+            metadata
+        """
+        for relpath, kind in files:
+            self.files_m.pop(relpath, None)
+            self.metadata_m.pop(relpath, None)
+
+    def get_paths(self):
+        """
+            Returns every relative path in the catalog, sorted
+        """
+        if self.sorted_paths_m is None:
+            self.sorted_paths_m = sorted(self.files_m)
+        return self.sorted_paths_m
+
+    def query(self, pattern = "**", kind = None):
+        """
+            Relative paths matching a glob-style pattern (e.g.
+            "test_images/*.jpg", "*/calibration*", "**/*.mp4"), only images or
+            videos with kind. Paths are in sorted order.
+        """
+        paths = self.get_paths()
+        if kind is not None:
+            paths = [relpath for relpath in paths if self.files_m[relpath] == kind]
+        if pattern == "**":
+            return list(paths)
+        if "**" not in pattern.split("/"):
+            # A path matching segment by segment matches the whole pattern
+            # with fnmatch, whose "*" also crosses "/", the fast filter first
+            paths = fnmatch.filter(paths, pattern)
+        pattern_parts = compile_segments(pattern)
+        return [relpath for relpath in paths if match_segments(relpath.split(os.sep), pattern_parts)]
+
+    def get_path(self, relpath):
+        """
+            Returns the full path of a catalog file
+        """
+        return os.path.join(self.root_m, relpath)
+
+    def get_metadata(self, relpath):
+        """
+            Returns kind, size, mtime, width, height and frame count of a
+            catalog file, reading them only if the file changed since they were
+            last read
+        """
+        stat = os.stat(self.get_path(relpath))
+        metadata = self.metadata_m.get(relpath)
+        if metadata is not None and metadata["size"] == stat.st_size and metadata["mtime"] == stat.st_mtime:
+            return metadata
+        metadata = {
+            "kind": self.files_m[relpath],
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+        if metadata["kind"] == "image":
+            metadata.update(self.read_image_info(self.get_path(relpath)))
+        else:
+            metadata.update(self.read_video_info(self.get_path(relpath)))
+        self.metadata_m[relpath] = metadata
+        return metadata
+
+    def read_image_info(self, image_path):
+        """
+            Reads an image's resolution from its header, without decoding it
+        """
+        try:
+            with Image.open(image_path) as img:
+                width, height = img.size
+        except OSError:
+            print("Error: Could not read image %s" %(image_path))
+            width, height = None, None
+        return {"width": width, "height": height, "frames": 1}
+
+    def read_video_info(self, video_path):
+        """
+            Reads a video's resolution and frame count from its container
+        """
+        video_reader = cv2.VideoCapture(video_path)
+        if not video_reader.isOpened():
+            print("Error: Could not read video %s" %(video_path))
+            return {"width": None, "height": None, "frames": None}
+        info = {
+            "width": int(video_reader.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(video_reader.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "frames": int(video_reader.get(cv2.CAP_PROP_FRAME_COUNT)),
+        }
+        video_reader.release()
+        return info
+
+    def __len__(self):
+        return len(self.files_m)
@@ -9,8 +9,11 @@ class FileSystemCli:
         
     def listdir_shell(self, path, *lsargs):
         """
-            List the directory contents of files and directories
+            List the directory contents of files and directories, with ls
+            only when ls arguments are given, else with listdir()
         """
+        if not lsargs:
+            return self.listdir(path)
         if self.os_flavor_m == "Linux":
             p = Popen(("ls", path) + lsargs, shell=False, stdout=PIPE, close_fds = True, encoding = "utf8")
             # loops through dir path, reads each line from stdout and removes
@@ -18,4 +21,12 @@ class FileSystemCli:
             # then returns a list of elements of type string
             return [path.rstrip("\n") for path in p.stdout.readlines()]
         else:
-            print("OS Flavor not supported")
\ No newline at end of file
+            print("OS Flavor not supported")
+
+    def listdir(self, path):
+        """
+            List the directory contents of files and directories in sorted
+            order like ls, in process and on any OS flavor
+        """
+        with os.scandir(path) as it:
+            return sorted(entry.name for entry in it if not entry.name.startswith("."))
\ No newline at end of file
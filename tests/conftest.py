@@ -0,0 +1,64 @@
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "lib", "cv"))
+sys.path.insert(0, os.path.join(ROOT, "lib", "os"))
+
+from CameraCalibration import CameraCalibration
+from LanePipeline import LanePipeline
+from SyntheticRoad import SyntheticRoad
+
+TEST_IMAGES = os.path.join(ROOT, "data", "input", "image", "test_images")
+
+
+@pytest.fixture(scope = "session")
+def test_images():
+    """
+        The project's test images, RGB
+    """
+    paths = sorted(glob.glob(os.path.join(TEST_IMAGES, "*.jpg")))
+    return [cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB) for path in paths]
+
+
+@pytest.fixture(scope = "session")
+def synthetic_road():
+    return SyntheticRoad(nframes = 24, seed = 4)
+
+
+@pytest.fixture
+def make_pipeline(synthetic_road):
+    """
+        Makes LanePipelines with the synthetic camera, which has no lens
+        distortion, so no chessboard calibration is needed
+    """
+    mtx, dist = synthetic_road.get_calibration()
+    calibrate_cam = CameraCalibration(9, 6, os.path.join(TEST_IMAGES, "none*.jpg"))
+
+    def make(**params):
+        return LanePipeline(calibrate_cam, mtx, dist, **params)
+    return make
+
+
+class FailingPipeline:
+    """
+        Stand-in pipeline for the worker pools: adds 1 to a frame and fails
+        on frames whose first pixel is 3, as on a frame without lane lines
+    """
+    def run_pipeline(self, frame):
+        if frame[0, 0, 0] == 3:
+            raise ValueError("no lane line pixels")
+        return frame + 1
+
+    def reset_tracker(self):
+        pass
+
+
+@pytest.fixture
+def failing_pipeline():
+    return FailingPipeline()
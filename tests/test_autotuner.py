@@ -0,0 +1,24 @@
+import pytest
+
+from BackendAutotuner import BackendAutotuner
+
+
+def test_unknown_override_is_rejected(make_pipeline):
+    with pytest.raises(ValueError):
+        BackendAutotuner(make_pipeline(), None, overrides = {"gradients": "simd"})
+    with pytest.raises(ValueError):
+        BackendAutotuner(make_pipeline(), None, overrides = {"thresholds": "float"})
+
+
+def test_cache_key_follows_pipeline_params(make_pipeline):
+    pipeline = make_pipeline()
+    autotuner = BackendAutotuner(pipeline, None)
+    key = autotuner.get_cache_key((720, 1280, 3))
+    assert key != autotuner.get_cache_key((1080, 1920, 3))
+    # Backends and the overlay's text don't change the key
+    pipeline.set_params(fast_gradients = True, warp_first = True, font_size = 1.0)
+    assert autotuner.get_cache_key((720, 1280, 3)) == key
+    for params in ({"detect_scale": 0.5}, {"threshold_decimation": 2}, {"s_thresh": (90, 255)}):
+        pipeline.set_params(**params)
+        assert autotuner.get_cache_key((720, 1280, 3)) != key
+        key = autotuner.get_cache_key((720, 1280, 3))
@@ -0,0 +1,35 @@
+import os
+
+from DatasetCatalog import DatasetCatalog
+from FileSystemCli import FileSystemCli
+
+
+def make_tree(root, relpaths):
+    for relpath in relpaths:
+        path = os.path.join(str(root), relpath)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        open(path, "w").close()
+
+
+def test_query_matches_segment_by_segment(tmp_path):
+    make_tree(tmp_path, ["a.jpg", "clips/b.mp4", "test_images/c.jpg", "test_images/old/d.jpg",
+                         "camera_cal/calibration1.jpg", "notes.txt"])
+    catalog = DatasetCatalog(str(tmp_path))
+    assert catalog.query() == ["a.jpg", "camera_cal/calibration1.jpg", "clips/b.mp4",
+                               "test_images/c.jpg", "test_images/old/d.jpg"]
+    # "*" stays within one directory level
+    assert catalog.query("*.jpg") == ["a.jpg"]
+    assert catalog.query("test_images/*.jpg") == ["test_images/c.jpg"]
+    assert catalog.query("*/calibration*") == ["camera_cal/calibration1.jpg"]
+    assert catalog.query("*/*") == ["camera_cal/calibration1.jpg", "clips/b.mp4", "test_images/c.jpg"]
+    # "**" spans any number of levels, none included
+    assert catalog.query("**/*.jpg") == ["a.jpg", "camera_cal/calibration1.jpg",
+                                         "test_images/c.jpg", "test_images/old/d.jpg"]
+    assert catalog.query("test_images/**/d.jpg") == ["test_images/old/d.jpg"]
+    assert catalog.query("**", kind = "video") == ["clips/b.mp4"]
+
+
+def test_listdir_shell_without_ls_args_lists_in_process(tmp_path):
+    make_tree(tmp_path, ["b.jpg", "a/c.jpg", ".hidden"])
+    fs = FileSystemCli()
+    assert fs.listdir_shell(str(tmp_path)) == fs.listdir(str(tmp_path)) == ["a", "b.jpg"]
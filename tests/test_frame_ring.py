@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from FrameRing import FrameRingPool
+
+
+def test_failed_frame_is_reported_and_workers_go_on(failing_pipeline):
+    pool = FrameRingPool(failing_pipeline, nworkers = 2, nslots = 3, frame_shape = (4, 6, 3))
+    try:
+        frames = [np.full((4, 6, 3), value, dtype = np.uint8) for value in range(8)]
+        results = list(pool.imap(frames))
+    finally:
+        pool.close()
+    assert results[3] is None
+    for value, result in enumerate(results):
+        if value != 3:
+            np.testing.assert_array_equal(result, frames[value] + 1)
+    assert pool.get_errors() == [(3, "ValueError: no lane line pixels")]
+
+
+def test_dead_worker_raises_instead_of_hanging(failing_pipeline):
+    pool = FrameRingPool(failing_pipeline, nworkers = 1, nslots = 2, frame_shape = (4, 6, 3))
+    try:
+        pool.workers_m[0].kill()
+        pool.workers_m[0].join()
+        with pytest.raises(RuntimeError):
+            list(pool.imap([np.zeros((4, 6, 3), dtype = np.uint8)]))
+    finally:
+        pool.ring_m.close()
@@ -0,0 +1,34 @@
+import mmap
+
+import numpy as np
+
+from FrameSource import ImageDirFrameSource, MemmapFrameCache
+
+
+def test_memmap_cache_times_paged_in_frames(tmp_path, monkeypatch):
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        np.save(str(image_dir / ("%d.npy" %(i))), rng.integers(0, 256, (64, 96, 3), dtype = np.uint8))
+    source = ImageDirFrameSource(str(image_dir), extensions = (".npy",))
+    monkeypatch.setattr("cv2.imread", lambda path, flags: np.load(path))
+    cache_path = str(tmp_path / "clip.u8")
+    decoded = [frame.copy() for frame in MemmapFrameCache(source, cache_path)]
+
+    touched = []
+    max_method = np.memmap.max
+
+    def touch(pages, *args, **kwargs):
+        touched.append(pages.size)
+        return max_method(pages, *args, **kwargs)
+    monkeypatch.setattr(np.memmap, "max", touch)
+    cache = MemmapFrameCache(source, cache_path)
+    frames = list(cache)
+    # Each frame's pages were read before it was yielded, within the timed
+    # read, one byte per page
+    assert touched == [-(-decoded[0].size//mmap.PAGESIZE)]*3
+    for frame, decoded_frame in zip(frames, decoded):
+        assert not frame.flags.writeable
+        np.testing.assert_array_equal(frame, decoded_frame)
+    assert cache.get_throughput()["frames"] == 3
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import JitKernels
+import LaneFunctions
+from ColorThresholds import ColorThresholds
+from GradientThresholds import GradientThresholds
+
+
+def lane_points(seed, img_shape = (90, 160)):
+    """
+        Nonzero pixels of a small lane-like binary warped image
+    """
+    rng = np.random.default_rng(seed)
+    binary_warped = (rng.random(img_shape) < 0.02).astype(np.uint8)
+    rows = np.arange(img_shape[0])
+    for base in (img_shape[1]//4, 3*img_shape[1]//4):
+        cols = (base + 6*np.sin(rows/20.0 + seed) + rng.normal(0, 1, rows.size)).astype(int)
+        for offset in range(-2, 3):
+            binary_warped[rows, np.clip(cols + offset, 0, img_shape[1] - 1)] = 1
+    nonzeroy, nonzerox = binary_warped.nonzero()
+    return nonzeroy, nonzerox
+
+
+def test_cross_check():
+    pytest.importorskip("numba")
+    assert all(JitKernels.cross_check(nframes = 2).values())
+
+
+def test_slide_windows_kernel_matches_numpy():
+    # The kernel's Python source, compiled or not
+    kernel = getattr(JitKernels.slide_windows_kernel, "py_func", JitKernels.slide_windows_kernel)
+    config = LaneFunctions.SlidingWindowConfig(9, 12, 5)
+    enabled = JitKernels.is_jit_enabled()
+    JitKernels.set_jit_enabled(False)
+    try:
+        for seed in range(4):
+            nonzeroy, nonzerox = lane_points(seed)
+            windows = LaneFunctions.sliding_window_search(nonzeroy, nonzerox, 90, 40, 120, config)
+            left_inds, right_inds, left_centers, right_centers = kernel(
+                nonzeroy, nonzerox, 90, 9, windows.window_height, 12, 5, 40, 120
+            )
+            np.testing.assert_array_equal(left_inds, windows.lane_pixels.left_inds)
+            np.testing.assert_array_equal(right_inds, windows.lane_pixels.right_inds)
+            np.testing.assert_array_equal(left_centers, windows.left_centers)
+            np.testing.assert_array_equal(right_centers, windows.right_centers)
+    finally:
+        JitKernels.set_jit_enabled(enabled)
+
+
+def test_combine_masks_matches_numpy():
+    rng = np.random.default_rng(0)
+    masks = [(rng.random((30, 40)) < 0.5).astype(np.uint8) for i in range(4)]
+    gradient_cam, color_cam = GradientThresholds(), ColorThresholds()
+    for code in range(4):
+        for name, combine, code_masks in (
+                ("combined_thresh", gradient_cam.apply_combined_thresh_numpy, masks),
+                ("rgb_thresh", color_cam.apply_rgb_thresh_numpy, masks[:3]),
+                ("hls_thresh", color_cam.apply_hls_thresh_numpy, masks[:3])):
+            expected = combine(code, *code_masks)
+            result = JitKernels.combine_masks(name, combine, code, code_masks)
+            assert result.dtype == expected.dtype
+            np.testing.assert_array_equal(result, expected)
+
+
+def test_combine_masks_raises_on_missing_mask_it_uses():
+    masks = [np.ones((4, 4), dtype = np.uint8)]*4
+    combine = GradientThresholds().apply_combined_thresh_numpy
+    # Code 2 combines grad_x, grad_mag and grad_dir, grad_y may be missing
+    np.testing.assert_array_equal(
+        JitKernels.combine_masks("combined_thresh", combine, 2, (masks[0], None, masks[2], masks[3])),
+        combine(2, masks[0], None, masks[2], masks[3])
+    )
+    with pytest.raises(ValueError):
+        JitKernels.combine_masks("combined_thresh", combine, 3, (masks[0], None, masks[2], masks[3]))
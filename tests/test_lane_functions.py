@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import LaneFunctions
+from LaneLineCurvature import LaneLineCurvature
+from LaneLineDetection import LaneLineDetection
+from LaneVehiclePosition import LaneVehiclePosition
+
+
+def wrapper_find_lane(binary_warped, config, prior_detection = None):
+    """
+        The notebook's steps with LaneLineDetection: Search from Prior with
+        the last frame's detection, else Histogram Peaks, Sliding Windows
+        Search and Search from Prior
+    """
+    if prior_detection is not None:
+        prior_detection.find_nonzero(binary_warped)
+        prior_detection.select_around_poly()
+        left_count, right_count = prior_detection.get_lane_pixel_counts()
+        if left_count > config.minpix and right_count > config.minpix:
+            prior_detection.fit_polynomial(binary_warped)
+            return prior_detection, "prior"
+    detection = LaneLineDetection()
+    detection.setup_sw_hyperparameters(*config)
+    detection.find_lane_pixels(binary_warped, detection.histogram_peaks(binary_warped))
+    detection.fit_polynomial(binary_warped, False)
+    detection.search_around_poly(binary_warped)
+    return detection, "search"
+
+
+@pytest.mark.parametrize("unit_type", ["meters", "pixels"])
+def test_functions_match_wrapper_classes(make_pipeline, synthetic_road, unit_type):
+    pipeline = make_pipeline()
+    config = LaneFunctions.SlidingWindowConfig(9, 100, 50)
+    prior, prior_detection = None, None
+    for index in (0, 1, 5):
+        binary_warped = pipeline.lane_binary_view(synthetic_road.render(index))
+        lane_fit, method = LaneFunctions.find_lane(binary_warped, config, prior)
+        prior_detection, wrapper_method = wrapper_find_lane(binary_warped, config, prior_detection)
+        ploty, left_fit, right_fit = prior_detection.get_fit_polynomial_data()
+        assert method == wrapper_method
+        np.testing.assert_array_equal(lane_fit.ploty, ploty)
+        np.testing.assert_array_equal(lane_fit.left_fit, left_fit)
+        np.testing.assert_array_equal(lane_fit.right_fit, right_fit)
+        prior = lane_fit
+
+        radius = LaneFunctions.measure_radius_curvature(ploty, left_fit, right_fit, unit_type)
+        angle = LaneFunctions.measure_angle_curvature(radius.left_curverad, radius.right_curverad)
+        position = LaneFunctions.measure_vehicle_position(binary_warped.shape, left_fit, right_fit, unit_type)
+        lane_curve = LaneLineCurvature()
+        assert tuple(radius) == lane_curve.measure_radius_curvature(ploty, left_fit, right_fit, unit_type)
+        assert tuple(angle) == lane_curve.measure_angle_curvature("arc")
+        assert tuple(position) == LaneVehiclePosition().measure_vehicle_position(
+            binary_warped, left_fit, right_fit, unit_type
+        )
+    # The frames after the first are found around the prior fit
+    assert method == "prior"
+
+
+@pytest.mark.parametrize("detect_scale", [1.0, 0.5])
+def test_stateless_lane_result_matches_pipeline(make_pipeline, synthetic_road, detect_scale):
+    pipeline = make_pipeline(detect_scale = detect_scale, track = True)
+    shared = make_pipeline(detect_scale = detect_scale, track = True)
+    prior = None
+    for index in range(3):
+        frame = synthetic_road.render(index)
+        metrics = pipeline.lane_metrics_from_view(pipeline.lane_binary_view(frame), frame.shape)
+        result = shared.lane_result(frame, prior)
+        prior = result.lane_fit
+        assert result.method == pipeline.get_stage_times()[1]
+        detect_shape = (int(round(frame.shape[0]*detect_scale)), int(round(frame.shape[1]*detect_scale)))
+        full_fit = LaneFunctions.scale_lane_fit(result.lane_fit, detect_shape, frame.shape)
+        np.testing.assert_allclose(full_fit.left_fit, metrics["left_fit"])
+        np.testing.assert_allclose(full_fit.right_fit, metrics["right_fit"])
+        assert result.curvature_radius.left_curverad == pytest.approx(metrics["left_curverad"])
+        assert result.curvature_angle.r_angle_curve == pytest.approx(metrics["r_angle_curve"])
+        assert result.vehicle_position.dist_center == pytest.approx(metrics["dist_center"])
+        assert result.vehicle_position.side_center == metrics["side_center"]
+    assert result.method == "prior"
+    # lane_result() leaves the shared pipeline's tracker alone
+    assert shared.get_lane_metrics() is None
+
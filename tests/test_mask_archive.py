@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+from MaskArchive import MaskArchive, decode_mask, encode_mask, record_lane_masks, replay_lane_metrics
+
+
+def masks(shape = (72, 128)):
+    rng = np.random.default_rng(0)
+    noisy = (rng.random(shape) < 0.1).astype(np.uint8)
+    # Set first pixel, so the runs start with an empty run of 0s
+    noisy[0, 0] = 1
+    return [noisy, np.zeros(shape, dtype = np.uint8), np.ones(shape, dtype = np.uint8), 255*noisy]
+
+
+@pytest.mark.parametrize("encoding", ["packbits", "rle"])
+def test_encode_decode_round_trip(encoding):
+    for mask in masks():
+        decoded = decode_mask(encode_mask(mask, encoding), mask.shape, encoding)
+        assert decoded.dtype == np.uint8
+        np.testing.assert_array_equal(decoded, (mask != 0).astype(np.uint8))
+
+
+@pytest.mark.parametrize("encoding", ["packbits", "rle"])
+def test_archive_round_trip_and_append(tmp_path, encoding):
+    path = os.path.join(str(tmp_path), "clip", "masks.bin")
+    archive = MaskArchive(path, "w", encoding)
+    archive.set_source((720, 1280, 3), {"backend": "test"})
+    for mask in masks()[:2]:
+        archive.append(mask)
+    archive.close()
+    # Appending keeps the archive's encoding
+    archive = MaskArchive(path, "a", "rle" if encoding == "packbits" else "packbits")
+    for mask in masks()[2:]:
+        archive.append(mask)
+    assert archive.append(np.zeros((10, 10), dtype = np.uint8)) is None
+    archive.close()
+    archive = MaskArchive(path)
+    assert len(archive) == 4
+    assert archive.get_frame_shape() == (720, 1280, 3)
+    for (index, mask), expected in zip(archive.replay(), masks()):
+        np.testing.assert_array_equal(mask, (expected != 0).astype(np.uint8))
+    np.testing.assert_array_equal(archive.read_mask(-1), (masks()[-1] != 0).astype(np.uint8))
+    assert archive.get_stats()["masks"] == 4
+
+
+def test_replay_matches_live_metrics(tmp_path, make_pipeline, synthetic_road):
+    path = os.path.join(str(tmp_path), "masks.bin")
+    pipeline = make_pipeline(track = True)
+    assert record_lane_masks(pipeline, synthetic_road, path, max_frames = 4) == 4
+    live = make_pipeline(track = True)
+    expected = [live.lane_metrics_from_view(live.lane_binary_view(synthetic_road.render(index)),
+                                            (720, 1280, 3)) for index in range(4)]
+    replayed = list(replay_lane_metrics(make_pipeline(track = True), MaskArchive(path)))
+    assert [index for index, lane_metrics in replayed] == list(range(4))
+    for (index, lane_metrics), expected_metrics in zip(replayed, expected):
+        np.testing.assert_array_equal(lane_metrics["left_fit"], expected_metrics["left_fit"])
+        np.testing.assert_array_equal(lane_metrics["right_fit"], expected_metrics["right_fit"])
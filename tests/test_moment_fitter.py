@@ -0,0 +1,42 @@
+import numpy as np
+
+from MomentPolyFitter import MomentPolyFitter
+
+
+def lane_line_pixels(seed, img_h = 720, npixels = 5000):
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, img_h, npixels)
+    x = np.round(2e-4*y*y - 0.3*y + 400 + rng.normal(0, 3, npixels)).astype(np.int64)
+    return y, x
+
+
+def test_moments_fit_matches_polyfit():
+    for seed in range(5):
+        y, x = lane_line_pixels(seed)
+        np.testing.assert_allclose(
+            MomentPolyFitter(720).fit(y, x), np.polyfit(y, x, 2), rtol = 1e-6, atol = 1e-6
+        )
+
+
+def test_only_final_fits_are_accumulated():
+    fitter = MomentPolyFitter(720, decay = 0.5)
+    first, second = lane_line_pixels(0), lane_line_pixels(1)
+    fitter.fit(*first)
+    # A fit on the way to the final selection is of its own pixels
+    np.testing.assert_allclose(fitter.fit(*second, accumulate = False), np.polyfit(*second, 2), rtol = 1e-6)
+    fitter.fit(*second)
+    assert fitter.sum_t_m[0] == len(second[0]) + 0.5*len(first[0])
+
+
+def test_fit_decay_carries_over_searches(make_pipeline, synthetic_road):
+    frames = [synthetic_road.render(index) for index in range(2)]
+    # Without tracking every frame is searched by a new lane line detection
+    decayed = make_pipeline(fit_method = "moments", fit_decay = 0.5)
+    for frame in frames:
+        decayed.run_pipeline(frame)
+    counts = []
+    for frame in frames:
+        pipeline = make_pipeline(fit_method = "moments")
+        pipeline.run_pipeline(frame)
+        counts.append(pipeline.lane_fitters_m[0].sum_t_m[0])
+    np.testing.assert_allclose(decayed.lane_fitters_m[0].sum_t_m[0], counts[1] + 0.5*counts[0])
@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+
+
+def test_overlay_not_due_blends_last_layer_onto_new_frame(make_pipeline, synthetic_road):
+    frames = [synthetic_road.render(index) for index in range(3)]
+    pipeline = make_pipeline(overlay_interval = 3)
+    outputs = [pipeline.run_pipeline(frames[0]).copy()]
+    y_low, y_high, x_low, x_high, green = pipeline.overlay_layer_m[0]
+    for frame in frames[1:]:
+        outputs.append(pipeline.run_pipeline(frame).copy())
+        assert not np.array_equal(outputs[-1], outputs[-2])
+        # The first frame's lane layer on the new frame, which has no lens
+        # distortion, below the text
+        expected = frame.copy()
+        zeros = np.zeros_like(green)
+        expected[y_low:y_high, x_low:x_high] = cv2.addWeighted(
+            frame[y_low:y_high, x_low:x_high], 1, cv2.merge((zeros, green, zeros)), 0.3, 0
+        )
+        np.testing.assert_array_equal(outputs[-1][300:], expected[300:])
+    assert pipeline.get_output_ages()["overlay"] == 2
+    pipeline.run_pipeline(frames[0])
+    assert pipeline.get_output_ages()["overlay"] == 0
+
+
+def test_set_params_keeps_output_ages_unless_they_depend_on_them(make_pipeline, synthetic_road):
+    pipeline = make_pipeline(curvature_interval = 3, overlay_interval = 3)
+    pipeline.run_pipeline(synthetic_road.render(0))
+    pipeline.set_params(threshold_decimation = 2)
+    pipeline.run_pipeline(synthetic_road.render(1))
+    assert pipeline.get_output_ages() == {"position": 0, "curvature": 1, "overlay": 1}
+    # Overlay turned off then on again is drawn on the next frame
+    pipeline.set_params(render_overlay = True)
+    pipeline.run_pipeline(synthetic_road.render(2))
+    assert pipeline.get_output_ages() == {"position": 0, "curvature": 2, "overlay": 0}
+    pipeline.set_params(curvature_interval = 2)
+    assert pipeline.get_output_ages() is None
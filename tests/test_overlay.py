@@ -0,0 +1,8 @@
+import numpy as np
+
+
+def test_direct_overlay_matches_warped_overlay(make_pipeline, test_images):
+    warped = make_pipeline()
+    direct = make_pipeline(direct_overlay = True)
+    for frame in test_images:
+        np.testing.assert_array_equal(direct.run_pipeline(frame), warped.run_pipeline(frame))
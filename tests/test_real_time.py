@@ -0,0 +1,83 @@
+import time
+
+from RealTimeLanePipeline import RealTimeLanePipeline
+
+
+class SleepPipeline:
+    """
+        Stands in for a LanePipeline whose seconds per frame depend on the
+        quality level it is set to
+    """
+    def __init__(self, costs):
+        self.costs_m = costs
+        self.params_m = {}
+        self.seconds_m = 0.0
+
+    def set_params(self, **params):
+        self.params_m.update(params)
+
+    def run_pipeline(self, frame):
+        p = self.params_m
+        if not p.get("prior_search_only"):
+            level = 0
+        elif p.get("threshold_decimation", 1) == 1:
+            level = 1
+        elif p.get("render_overlay", True):
+            level = 2
+        else:
+            level = 3
+        self.seconds_m = self.costs_m[level]
+        time.sleep(self.seconds_m)
+        return level
+
+    def get_stage_times(self):
+        s = self.seconds_m
+        # The full level searches with Sliding Windows
+        method = "prior" if self.params_m.get("prior_search_only") else "search"
+        return {"threshold": 0.5*s, "detect": 0.3*s, "overlay": 0.2*s}, method
+
+
+def test_slow_pipeline_runs_lowest_level_instead_of_dropping():
+    # Every level but the lowest is over the 33 ms deadline
+    real_time = RealTimeLanePipeline(SleepPipeline([0.05, 0.045, 0.04, 0.02]))
+    for i in range(20):
+        result, status = real_time.process(None)
+        assert not status["dropped"]
+    report = real_time.get_quality_report()
+    assert report["dropped"] == 0
+    assert report["level"] == "no_overlay"
+    assert report["level_frames"]["no_overlay"] >= 18
+
+
+def test_late_frame_is_dropped():
+    real_time = RealTimeLanePipeline(SleepPipeline([0.001]*4))
+    result, status = real_time.process(None, time.perf_counter() - 1.0)
+    assert status["dropped"]
+    assert real_time.get_quality_report()["dropped"] == 1
+
+
+def test_degrades_step_by_step_and_recovers():
+    real_time = RealTimeLanePipeline(SleepPipeline([0.05, 0.04, 0.02, 0.01]), recover_frames = 5)
+    for i in range(5):
+        real_time.process(None)
+    levels = [name for frame, name in real_time.get_quality_report()["level_changes"]]
+    assert levels == ["full", "prior_only", "decimated"]
+    # Only the lowest level makes a frame this late
+    result, status = real_time.process(None, time.perf_counter() - 0.028)
+    assert status["level"] == "no_overlay"
+    for i in range(10):
+        real_time.process(None)
+    assert real_time.get_quality_report()["level"] == "decimated"
+
+
+def test_late_frame_runs_at_best_level_that_fits():
+    costs = [0.02, 0.012, 0.008, 0.004]
+    # 6 ms of Sliding Windows Search save predicts 14 ms at prior_only, and
+    # decimation a further 7.5 ms of thresholding predicts 6.5 ms at decimated
+    for late, level in ((0.015, "prior_only"), (0.02, "decimated"), (0.03, "no_overlay")):
+        real_time = RealTimeLanePipeline(SleepPipeline(costs))
+        for i in range(3):
+            assert real_time.process(None)[1]["level"] == "full"
+        result, status = real_time.process(None, time.perf_counter() - late)
+        assert not status["dropped"]
+        assert status["level"] == level
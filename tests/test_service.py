@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+import cv2
+import numpy as np
+
+from LaneService import FrameError, LaneService, service_state
+
+
+def test_sessions_share_no_pipeline_state(make_pipeline, synthetic_road):
+    base = make_pipeline(threshold_threads = 2)
+    service = LaneService(base, nworkers = 1)
+    first = service.get_session("first")["pipeline"]
+    second = service.get_session("second")["pipeline"]
+    assert service.get_session("first")["pipeline"] is first
+    assert first.get_params()["track"] and not service.get_session(None)["pipeline"].get_params()["track"]
+    frame = synthetic_road.render(0)
+    lane_b_e_view = base.lane_binary_view(frame)
+    first.lane_metrics_from_view(lane_b_e_view, frame.shape)
+    assert second.find_lane_lines_m is None and base.find_lane_lines_m is None
+    for name in ("calibrate_cam_m", "cam_view_m", "stripe_thresholds_m", "stage_cache_m"):
+        value = getattr(first, name)
+        assert value is None or all(value is not getattr(other, name) for other in (second, base))
+    np.testing.assert_array_equal(first.mtx_m, base.mtx_m)
+
+
+def test_bad_frame_fails_only_its_own_request(make_pipeline, synthetic_road, monkeypatch):
+    service = LaneService(make_pipeline(), nworkers = 1)
+    service.executor_m = ThreadPoolExecutor(1)
+    monkeypatch.setitem(service_state, "pipeline", service.pipeline_m)
+    frame = synthetic_road.render(0)
+    grayscale = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        chunk = [(f, loop.create_future()) for f in (frame, grayscale, frame)]
+        await service.run_chunk(chunk)
+        return [future for f, future in chunk]
+
+    try:
+        futures = asyncio.run(run())
+    finally:
+        service.executor_m.shutdown()
+    assert isinstance(futures[1].exception(), FrameError)
+    for future in (futures[0], futures[2]):
+        packed_view, view_shape = future.result()
+        assert view_shape == frame.shape[:2]
+        assert packed_view.any()
+
+
+def test_stats_are_bounded(make_pipeline):
+    service = LaneService(make_pipeline(), nworkers = 1, stats_window = 4)
+    for i in range(10):
+        service.latencies_m.append(0.001*i)
+        service.batch_sizes_m.append(i)
+    assert len(service.latencies_m) == len(service.batch_sizes_m) == 4
+    assert service.get_stats()["batch_mean"] == np.mean([6, 7, 8, 9])
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("direct_overlay", [False, True])
+def test_static_reuse_overlay_blends_last_layer_onto_new_frame(make_pipeline, test_images, direct_overlay):
+    frame = test_images[0]
+    # A small brightness change keeps the scene static
+    static_frame = np.clip(frame.astype(np.int16) + 1, 0, 255).astype(np.uint8)
+    reused = make_pipeline(skip_static = True, static_reuse_overlay = True, direct_overlay = direct_overlay)
+    redrawn = make_pipeline(skip_static = True, direct_overlay = direct_overlay)
+    first = reused.run_pipeline(frame).copy()
+    redrawn.run_pipeline(frame)
+    result = reused.run_pipeline(static_frame)
+    assert reused.get_stage_times()[1] == "static"
+    # The new frame with the reused lane, not the last output frame
+    np.testing.assert_array_equal(result, redrawn.run_pipeline(static_frame))
+    assert not np.array_equal(result, first)
+    assert reused.get_output_ages()["overlay"] == 1
+
+
+def test_set_params_keeps_scene_detector_unless_it_depends_on_them(make_pipeline, test_images):
+    frame = test_images[0]
+    pipeline = make_pipeline(skip_static = True)
+    pipeline.run_pipeline(frame)
+    # A real-time quality level change
+    pipeline.set_params(threshold_decimation = 2, render_overlay = True)
+    pipeline.run_pipeline(frame)
+    assert pipeline.get_stage_times()[1] == "static"
+    pipeline.set_params(static_threshold = 2.0)
+    pipeline.run_pipeline(frame)
+    assert pipeline.get_stage_times()[1] == "search"
@@ -0,0 +1,26 @@
+import numpy as np
+
+from StreamScheduler import StreamScheduler
+
+
+def test_failed_frame_is_reported_per_stream(failing_pipeline):
+    scheduler = StreamScheduler(nworkers = 1, max_inflight = 2)
+    for stream_id in ("a", "b"):
+        frames = [np.full((4, 6, 3), value, dtype = np.uint8) for value in range(6)]
+        scheduler.add_stream(stream_id, frames, failing_pipeline)
+    results = {}
+
+    def on_result(stream_id, frame_id, result):
+        results[stream_id, frame_id] = None if result is None else result.copy()
+    stats = scheduler.run(on_result)
+    # Both streams share the worker and get every frame back
+    assert len(results) == 12
+    for (stream_id, frame_id), result in results.items():
+        if frame_id == 3:
+            assert result is None
+        else:
+            np.testing.assert_array_equal(result, np.full((4, 6, 3), frame_id + 1))
+    assert scheduler.get_errors() == {
+        "a": [(3, "ValueError: no lane line pixels")], "b": [(3, "ValueError: no lane line pixels")]
+    }
+    assert stats["a"]["errors"] == 1
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from CorridorThresholds import CorridorThresholds
+from GradientThresholds import GradientThresholds
+
+
+@pytest.mark.parametrize("ksize", [3, 5, 7])
+@pytest.mark.parametrize("dir_thresh", [(0.3, 1.3), (1.0, 1.57), (0.0, np.pi/2), (0.7, 0.7001)])
+def test_fast_gradient_direction_matches_float(test_images, ksize, dir_thresh):
+    gradient_cam = GradientThresholds()
+    for frame in test_images:
+        np.testing.assert_array_equal(
+            gradient_cam.apply_grad_dir_thresh_fast(frame, ksize, dir_thresh),
+            gradient_cam.apply_grad_dir_thresh(frame, ksize, dir_thresh)
+        )
+
+
+@pytest.mark.parametrize("ksize", [3, 5, 7])
+@pytest.mark.parametrize("mag_thresh", [(36, 100), (0, 255), (1, 1), (254, 255), (0, 254), (255, 255)])
+def test_fast_gradient_magnitude_matches_float(test_images, ksize, mag_thresh):
+    gradient_cam = GradientThresholds()
+    for frame in test_images:
+        np.testing.assert_array_equal(
+            gradient_cam.apply_grad_mag_thresh_fast(frame, ksize, mag_thresh),
+            gradient_cam.apply_grad_mag_thresh(frame, ksize, mag_thresh)
+        )
+
+
+@pytest.mark.parametrize("fast_gradients", [False, True])
+def test_corridor_matches_whole_frame_inside_corridor(make_pipeline, test_images, fast_gradients):
+    pipeline = make_pipeline(fast_gradients = fast_gradients)
+    corridor = CorridorThresholds(band_height = 16)
+    for frame in test_images:
+        whole = pipeline.combine_thresholds(frame)
+        np.testing.assert_array_equal(corridor.combine_thresholds(pipeline, frame), whole)
+        # Lane lines as they are in the bird's eye view of the defaults
+        Minv = pipeline.get_cam_view().compute_transform(frame.shape)[1]
+        mask = corridor.corridor_mask(
+            frame.shape, np.array([0, 0, 320.0]), np.array([0, 0, 960.0]), 100, Minv
+        )
+        # The corridor is scaled by the whole frame's max kept as reference
+        np.testing.assert_array_equal(corridor.combine_thresholds(pipeline, frame, mask), whole & mask)
+
+
+def test_set_params_keeps_corridor_unless_it_depends_on_them(make_pipeline):
+    pipeline = make_pipeline(track = True, corridor_thresholds = True)
+    corridor = pipeline.get_corridor_thresholds()
+    # A real-time quality level change
+    pipeline.set_params(prior_search_only = True, render_overlay = False)
+    assert pipeline.get_corridor_thresholds() is corridor
+    pipeline.set_params(sobel_kernel = (5, 5))
+    assert pipeline.get_corridor_thresholds() is not corridor
+
+
+@pytest.mark.parametrize("fast_gradients", [False, True])
+@pytest.mark.parametrize("threads, stripes", [(2, None), (3, 7)])
+def test_stripes_match_whole_frame(make_pipeline, test_images, fast_gradients, threads, stripes):
+    whole = make_pipeline(fast_gradients = fast_gradients)
+    striped = make_pipeline(
+        fast_gradients = fast_gradients, threshold_threads = threads, threshold_stripes = stripes
+    )
+    try:
+        for frame in test_images:
+            np.testing.assert_array_equal(striped.combine_thresholds(frame), whole.combine_thresholds(frame))
+    finally:
+        striped.close()